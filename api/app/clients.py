@@ -0,0 +1,60 @@
+from typing import Awaitable, Callable, Generic, TypeVar
+
+from app.config import settings
+
+C = TypeVar("C")
+
+
+def get_channel_options() -> list[tuple[str, int]]:
+    """Options of the gRPC channels of the clients, with the keepalive of the settings"""
+    return [
+        ("grpc.keepalive_time_ms", int(settings.GRPC_KEEPALIVE_TIME * 1000)),
+        ("grpc.keepalive_timeout_ms", int(settings.GRPC_KEEPALIVE_TIMEOUT * 1000)),
+        ("grpc.max_send_message_length", -1),
+        ("grpc.max_receive_message_length", -1),
+        # Otherwise channels with the same options share their connection
+        ("grpc.use_local_subchannel_pool", 1),
+    ]
+
+
+class ClientPool(Generic[C]):
+    """
+    Clients shared by the requests of the process, used in turn. Each client has its own gRPC
+    channel, so the concurrent requests are spread over `size` connections. The clients are created
+    with `open` and closed with `close`, from the same event loop, by the lifespan of the app.
+
+    Parameters:
+    -----------
+    create : Callable[[], C]
+        Function creating a client
+    close : Callable[[C], Awaitable[None]]
+        Function closing a client
+    size : int
+        Number of clients
+    """
+
+    def __init__(self, create: Callable[[], C], close: Callable[[C], Awaitable[None]], size: int) -> None:
+        self._create = create
+        self._close = close
+        self.size = max(size, 1)
+        self._clients: list[C] = []
+        self._next = 0
+
+    def open(self) -> None:
+        if not self._clients:
+            self._clients = [self._create() for _ in range(self.size)]
+
+    def get(self) -> C:
+        if not self._clients:
+            raise RuntimeError("The clients are not open, they are created by the lifespan of the app")
+        client = self._clients[self._next % self.size]
+        self._next += 1
+        return client
+
+    async def close(self) -> None:
+        clients, self._clients = self._clients, []
+        for client in clients:
+            try:
+                await self._close(client)
+            except Exception as e:
+                print(f"Could not close client: {e}")
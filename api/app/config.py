@@ -11,6 +11,43 @@ class Settings(BaseSettings):
 
     FIRESTORE_EMULATOR_HOST: str = ""
 
+    # Job payloads larger than `PAYLOAD_INLINE_LIMIT` bytes are compressed with
+    # `PAYLOAD_COMPRESSION` (`gzip` or `zstd`) and stored in `PAYLOAD_STORE` (a local directory or a
+    # `gs://<bucket>/<prefix>` URI). Without a store, they are always stored inline.
+    PAYLOAD_STORE: str = ""
+    PAYLOAD_INLINE_LIMIT: int = 64 * 1024
+    PAYLOAD_COMPRESSION: str = "gzip"
+
+    # How the task container gets the parameters of a job: `args` flattens them into arguments, as
+    # the task images without `--parameters_from` expect, `job` reads them from the job document
+    # (inline or in the payload store), and `env` passes them in the `TASK_PARAMETERS` variable in
+    # JSON format. Switch to `job` once the task images are rebuilt with `--parameters_from`
+    TASK_PARAMETERS_TRANSPORT: str = "args"
+
+    # Array jobs, default number of Cloud Run task instances sharing the child jobs (at most one per
+    # parameter set), and maximum number of parameter sets
+    ARRAY_TASK_COUNT: int = 10
+    ARRAY_MAX_SIZE: int = 10000
+
+    # Cloud Run clients, shared by the requests. The pool has `GRPC_POOL_SIZE` clients with their own
+    # channel, used in turn. Channels ping the server every `GRPC_KEEPALIVE_TIME` seconds, and close
+    # after `GRPC_KEEPALIVE_TIMEOUT` seconds without answer. Firestore does not use these settings:
+    # it has a single shared client, whose channel is created by the client library with its own
+    # keepalive (30 seconds)
+    GRPC_POOL_SIZE: int = 2
+    GRPC_KEEPALIVE_TIME: float = 30.0
+    GRPC_KEEPALIVE_TIMEOUT: float = 10.0
+
+    # Maximum number of Pydantic models created from the task parameters schemas kept in memory,
+    # the least recently used are dropped
+    SCHEMA_CACHE_SIZE: int = 256
+
+    # User and task documents are cached for `METADATA_CACHE_TTL` seconds (`0` reads them on every
+    # request), and dropped when they change. With the emulator, changes are polled every
+    # `METADATA_POLL_INTERVAL` seconds
+    METADATA_CACHE_TTL: float = 300.0
+    METADATA_POLL_INTERVAL: float = 10.0
+
     # Cloud Tasks
     TASKS_PROJECT_ID: str = "demo-project"
     TASKS_LOCATION: str = "us-central1"
@@ -1,17 +1,54 @@
-from typing import TypeVar
+from typing import Any, Awaitable, Callable, TypeVar
+import asyncio
 import json
+import threading
+import time
 
-from google.cloud.firestore import AsyncClient, DocumentSnapshot
+from google.cloud.firestore import AsyncClient, AsyncTransaction, DocumentSnapshot, async_transactional
+from google.cloud.firestore_v1.base_query import FieldFilter
+from google.cloud.firestore_v1.field_path import FieldPath
 from pydantic import BaseModel
+from pydantic.json_schema import JsonSchemaValue
 
-from app.models import get_timestamp, Task, UserDocument, TaskDetails, TaskDocument, JobDocument, JobCreate, JobResult
+from app.models import (
+    get_timestamp,
+    Task,
+    UserDocument,
+    TaskDetails,
+    TaskDocument,
+    JobDocument,
+    JobCreate,
+    JobResult,
+    JobProgress,
+    JobProgressEvent,
+    JobProgressEvents,
+    JobPartialChunk,
+    JobPartials,
+    JobArray,
+    JobStatus,
+    PayloadRef,
+)
+from app.clients import ClientPool
 from app.config import settings
+from app.storage import dump_payload, load_payload
 
 T = TypeVar("T", bound=BaseModel)
 
 USERS_COLLECTION = "users"
 TASKS_COLLECTION = "tasks"
 JOBS_COLLECTION = "jobs"
+STEPS_COLLECTION = "steps"
+PARTIALS_COLLECTION = "partials"
+
+# Fields of the job document holding the payloads, only read when requested
+PAYLOAD_FIELDS = {
+    "parameters": ["parameters_json_value", "parameters_ref"],
+    "result": ["result_json_value", "result_ref"],
+}
+JOB_STATUS_FIELDS = [
+    name for name in JobDocument.model_fields
+    if name != "id" and not any(name in fields for fields in PAYLOAD_FIELDS.values())
+]
 
 
 def _validate_firestore_document(doc: DocumentSnapshot, model: type[T]) -> T:
@@ -20,7 +57,143 @@ def _validate_firestore_document(doc: DocumentSnapshot, model: type[T]) -> T:
     return model.model_validate(doc_dict)
 
 
-async def get_firestore_client() -> AsyncClient:
+class _MetadataCache:
+    """
+    Cache of documents by ID, kept `METADATA_CACHE_TTL` seconds. Entries are dropped when their
+    document changes, from the snapshot listener threads or the polling task, so a load started
+    before a change is not stored.
+    """
+
+    def __init__(self) -> None:
+        # Document ID to expiry time, value and update time of the document
+        self._entries: dict[str, tuple[float, Any, Any]] = {}
+        self._lock = threading.Lock()
+        self._version = 0
+
+    async def get(self, key: str, load: Callable[[], Awaitable[tuple[Any, Any]]]) -> Any:
+        """Get the cached value of a document, or load the value and update time of the document"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1]
+            version = self._version
+        value, update_time = await load()
+        with self._lock:
+            if version == self._version and settings.METADATA_CACHE_TTL > 0:
+                self._entries[key] = (time.monotonic() + settings.METADATA_CACHE_TTL, value, update_time)
+        return value
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._version += 1
+            self._entries.pop(key, None)
+
+    def invalidate_changed(self, update_times: dict[str, Any]) -> None:
+        """Drop the entries whose document update time is not the cached one, or was deleted"""
+        with self._lock:
+            changed = [key for key, entry in self._entries.items() if update_times.get(key) != entry[2]]
+            if changed:
+                self._version += 1
+            for key in changed:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+
+_users_cache = _MetadataCache()
+_tasks_cache = _MetadataCache()
+_METADATA_CACHES = {USERS_COLLECTION: _users_cache, TASKS_COLLECTION: _tasks_cache}
+
+
+def _invalidate_on_change(cache: _MetadataCache):
+    def on_snapshot(docs: list[DocumentSnapshot], changes: list[Any], read_time: Any) -> None:
+        for change in changes:
+            cache.invalidate(change.document.id)
+    return on_snapshot
+
+
+async def _poll_metadata(client: AsyncClient, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        for collection, cache in _METADATA_CACHES.items():
+            try:
+                # Only the names and update times of the documents are read
+                query = client.collection(collection).select([FieldPath.document_id()])
+                update_times = {doc.id: doc.update_time async for doc in query.stream()}
+            except Exception as e:
+                print(f"Could not poll the {collection} collection: {e}")
+                continue
+            cache.invalidate_changed(update_times)
+
+
+async def watch_metadata(client: AsyncClient) -> Callable[[], None]:
+    """
+    Keep the cached user and task documents up to date. With Firestore, snapshot listeners drop the
+    changed documents from the cache. With the emulator, the collections are polled every
+    `METADATA_POLL_INTERVAL` seconds instead. In any case, documents are read again after
+    `METADATA_CACHE_TTL` seconds.
+
+    Returns a function stopping the watch.
+    """
+    if settings.METADATA_CACHE_TTL <= 0:
+        return lambda: None
+    if settings.FIRESTORE_EMULATOR_HOST:
+        task = asyncio.create_task(_poll_metadata(client, settings.METADATA_POLL_INTERVAL))
+        return task.cancel
+
+    # Listeners are only available with the synchronous client, they call back from their threads
+    from google.cloud.firestore import Client
+    sync_client = Client(project=settings.FIRESTORE_PROJECT_ID, database=settings.FIRESTORE_DATABASE)
+    watches = [
+        sync_client.collection(collection).on_snapshot(_invalidate_on_change(cache))
+        for collection, cache in _METADATA_CACHES.items()
+    ]
+
+    def stop() -> None:
+        for watch in watches:
+            watch.unsubscribe()
+        sync_client.close()
+    return stop
+
+
+def clear_metadata_cache() -> None:
+    """Drop all the cached user and task documents"""
+    for cache in _METADATA_CACHES.values():
+        cache.clear()
+
+
+async def _get_user(client: AsyncClient, user_email: str) -> UserDocument | None:
+    async def load() -> tuple[UserDocument | None, Any]:
+        user_doc = await client.collection(USERS_COLLECTION).document(user_email).get()
+        if not user_doc.exists:
+            return None, None
+        return _validate_firestore_document(user_doc, UserDocument), user_doc.update_time
+    return await _users_cache.get(user_email, load)
+
+
+async def _get_task(client: AsyncClient, task_id: str) -> TaskDetails | None:
+    async def load() -> tuple[TaskDetails | None, Any]:
+        task_doc = await client.collection(TASKS_COLLECTION).document(task_id).get()
+        if not task_doc.exists:
+            return None, None
+        task = _validate_firestore_document(task_doc, TaskDocument)
+        # The schemas are parsed once, with the document
+        details = TaskDetails(
+            id=task.id,
+            name=task.name,
+            description=task.description,
+            parameters_schema=json.loads(task.parameters_json_schema),
+            result_schema=json.loads(task.result_json_schema),
+            uri=task.uri,
+        )
+        return details, task_doc.update_time
+    return await _tasks_cache.get(task_id, load)
+
+
+def _create_firestore_client() -> AsyncClient:
     if settings.FIRESTORE_EMULATOR_HOST:
         print("Using Firestore emulator")
         client = AsyncClient(
@@ -30,68 +203,90 @@ async def get_firestore_client() -> AsyncClient:
         )
         client._emulator_host = settings.FIRESTORE_EMULATOR_HOST
         return client
-    else:
-        client = AsyncClient(
-            project=settings.FIRESTORE_PROJECT_ID,
-            database=settings.FIRESTORE_DATABASE,
-        )
-    return AsyncClient()
+    return AsyncClient(
+        project=settings.FIRESTORE_PROJECT_ID,
+        database=settings.FIRESTORE_DATABASE,
+    )
+
+
+async def _close_firestore_client(client: AsyncClient) -> None:
+    # `AsyncClient.close` only closes the HTTP session, the gRPC channel is closed with the transport
+    # of the underlying API client, created on the first call
+    api = client._firestore_api_internal
+    if api is not None:
+        await api.transport.close()
+    client.close()
+
+
+# A single client, its channel is created by the client library, with its own keepalive, and
+# multiplexes the requests
+_firestore_clients = ClientPool(_create_firestore_client, _close_firestore_client, 1)
+
+
+def open_firestore_clients() -> None:
+    """Create the Firestore client of the process, at startup"""
+    _firestore_clients.open()
+
+
+async def get_firestore_client() -> AsyncClient:
+    """Get a Firestore client of the process pool"""
+    return _firestore_clients.get()
+
+
+async def close_firestore_clients() -> None:
+    """Close the Firestore clients of the process pool"""
+    await _firestore_clients.close()
 
 
 async def list_user_tasks(client: AsyncClient, user_email: str) -> list[Task]:
     # Find user
-    user_ref = client.collection(USERS_COLLECTION).document(user_email)
-    user_doc = await user_ref.get()
-    if not user_doc.exists:
+    user = await _get_user(client, user_email)
+    if user is None:
         print(f"User {user_email} not found")
         return []
-    user = _validate_firestore_document(user_doc, UserDocument)
 
     # Get tasks
     tasks = []
     for task_id in user.tasks:
-        task_ref = client.collection(TASKS_COLLECTION).document(task_id)
-        task_doc = await task_ref.get()
-        if not task_doc.exists:
+        task = await _get_task(client, task_id)
+        if task is None:
             continue
-        task = _validate_firestore_document(task_doc, TaskDocument)
         tasks.append(
             Task(
                 id=task.id,
                 name=task.name,
                 description=task.description,
                 # From json.dumps(Parameters.schema_json())
-                parameters_schema=json.loads(task.parameters_json_schema),
-                result_schema=json.loads(task.result_json_schema),
+                parameters_schema=task.parameters_schema,
+                result_schema=task.result_schema,
             )
         )
     return tasks
 
 
 async def get_task_details(client: AsyncClient, task_id: str) -> TaskDetails:
-    task_ref = client.collection(TASKS_COLLECTION).document(task_id)
-    task_doc = await task_ref.get()
-    if not task_doc.exists:
+    task = await _get_task(client, task_id)
+    if task is None:
         raise ValueError(f"Task {task_id} not found")
-    task = _validate_firestore_document(task_doc, TaskDocument)
-    return TaskDetails(
-        id=task.id,
-        name=task.name,
-        description=task.description,
-        parameters_schema=json.loads(task.parameters_json_schema),
-        result_schema=json.loads(task.result_json_schema),
-        uri=task.uri,
-    )
+    return task
 
 async def user_has_access_to_task(client: AsyncClient, user_email: str, task_id: str) -> bool:
-    user_ref = client.collection(USERS_COLLECTION).document(user_email)
-    user_doc = await user_ref.get()
-    if not user_doc.exists:
+    user = await _get_user(client, user_email)
+    if user is None:
         return False
-    user = _validate_firestore_document(user_doc, UserDocument)
     return task_id in user.tasks
 
 
+async def list_parameters_schemas(client: AsyncClient) -> list[JsonSchemaValue]:
+    """List the parameters schemas of all the registered tasks"""
+    schemas = []
+    async for task_doc in client.collection(TASKS_COLLECTION).select(["parameters_json_schema"]).stream():
+        schema_json = (task_doc.to_dict() or {}).get("parameters_json_schema")
+        if schema_json:
+            schemas.append(json.loads(schema_json))
+    return schemas
+
+
 async def create_job(client: AsyncClient, user_email: str, task_id: str, parameters: BaseModel) -> JobCreate:
     # Create a job
     job_ref = client.collection(JOBS_COLLECTION).document()
@@ -100,7 +295,8 @@ async def create_job(client: AsyncClient, user_email: str, task_id: str, paramet
         task_id=task_id,
         user_id=user_email,
         created_at=get_timestamp(),
-        parameters_json_value=parameters.model_dump_json(),
+        # Large parameters are offloaded to the payload store
+        **await dump_payload(job_ref.id, "parameters", parameters.model_dump_json()),
     )
     job_data = job.model_dump()
     job_data.pop("id")
@@ -116,21 +312,108 @@ async def create_job(client: AsyncClient, user_email: str, task_id: str, paramet
     return job_create
 
 
+async def create_array_job(client: AsyncClient, user_email: str, task_id: str, parameters: list[BaseModel], task_count: int) -> JobCreate:
+    """Create an array job, with a list of parameter sets run as child jobs by `task_count` Cloud
+    Run task instances. The child jobs are created by the task instances."""
+    job_ref = client.collection(JOBS_COLLECTION).document()
+    parameters_values = [instance.model_dump(mode="json") for instance in parameters]
+    job = JobDocument(
+        id=job_ref.id,
+        task_id=task_id,
+        user_id=user_email,
+        created_at=get_timestamp(),
+        array=JobArray(size=len(parameters), task_count=task_count),
+        **await dump_payload(job_ref.id, "parameters", json.dumps(parameters_values)),
+    )
+    job_data = job.model_dump()
+    job_data.pop("id")
+    await job_ref.set(job_data)
+
+    return JobCreate(
+        id=job_ref.id,
+        task_id=task_id,
+        status=job.status,
+        created_at=job.created_at,
+        parameters=parameters_values,
+        array=job.array,
+    )
+
+
 async def user_has_access_to_job(client: AsyncClient, user_email: str, job_id: str) -> bool:
     job_ref = client.collection(JOBS_COLLECTION).document(job_id)
-    job_doc = await job_ref.get()
+    # Only read the owner, not the payloads
+    job_doc = await job_ref.get(field_paths=["user_id"])
     if not job_doc.exists:
         return False
-    job = _validate_firestore_document(job_doc, JobDocument)
-    return job.user_id == user_email
+    return (job_doc.to_dict() or {}).get("user_id") == user_email
+
+
+async def get_job_progress(client: AsyncClient, job_id: str, progress: JobProgress, cursor: int = -1) -> JobProgressEvents:
+    """Get the step events of a job with a sequence number greater than `cursor`."""
+    if cursor >= progress.event_count - 1:
+        # Nothing new since the cursor, skip the query
+        return JobProgressEvents(**progress.model_dump(), events=[], cursor=max(cursor, progress.event_count - 1))
+    steps_ref = client.collection(JOBS_COLLECTION).document(job_id).collection(STEPS_COLLECTION)
+    query = steps_ref.where(filter=FieldFilter("seq", ">", cursor)).order_by("seq")
+    events = [JobProgressEvent.model_validate(event_doc.to_dict()) async for event_doc in query.stream()]
+    return JobProgressEvents(
+        **progress.model_dump(),
+        events=events,
+        cursor=events[-1].seq if events else cursor,
+    )
+
+
+async def get_job_partials(client: AsyncClient, job_id: str, offset: int = 0, limit: int = 1000) -> JobPartials:
+    """Get at most `limit` partial results of a job from `offset`. Only the chunks holding them are
+    read."""
+    job_doc = await client.collection(JOBS_COLLECTION).document(job_id).get(field_paths=["status", "progress"])
+    if not job_doc.exists:
+        raise ValueError(f"Job {job_id} not found")
+    job = job_doc.to_dict() or {}
+    progress = JobProgress.model_validate(job.get("progress") or {})
+    items: list = []
+    if offset < progress.partial_count and limit > 0:
+        partials_ref = client.collection(JOBS_COLLECTION).document(job_id).collection(PARTIALS_COLLECTION)
+        query = partials_ref.where(filter=FieldFilter("end", ">", offset)).order_by("end")
+        async for chunk_doc in query.stream():
+            chunk = JobPartialChunk.model_validate(chunk_doc.to_dict())
+            items.extend(chunk.items[max(offset - chunk.offset, 0):])
+            if len(items) >= limit:
+                break
+    items = items[:limit]
+    return JobPartials(
+        job_id=job_id,
+        status=job.get("status"),
+        offset=offset,
+        items=items,
+        next_offset=offset + len(items),
+        partial_count=progress.partial_count,
+    )
+
+
+async def _load_job_payload(value_json: str | None, ref: PayloadRef | None) -> dict | list | None:
+    if value_json is not None:
+        return json.loads(value_json)
+    if ref is not None:
+        return json.loads(await load_payload(ref))
+    return None
 
 
-async def get_job_status(client: AsyncClient, job_id: str) -> JobResult:
+async def get_job_status(client: AsyncClient, job_id: str, cursor: int = -1, include_parameters: bool = True, include_result: bool = True) -> JobResult:
+    """Get the status of a job, with the step events after `cursor`. Use `-1` to get all the
+    events. The parameters and the result are only read, from the job document or the payload
+    store, when they are included."""
+    field_paths = list(JOB_STATUS_FIELDS)
+    if include_parameters:
+        field_paths += PAYLOAD_FIELDS["parameters"]
+    if include_result:
+        field_paths += PAYLOAD_FIELDS["result"]
     job_ref = client.collection(JOBS_COLLECTION).document(job_id)
-    job_doc = await job_ref.get()
+    job_doc = await job_ref.get(field_paths=field_paths)
     if not job_doc.exists:
         raise ValueError(f"Job {job_id} not found")
     job = _validate_firestore_document(job_doc, JobDocument)
+    progress = await get_job_progress(client, job_id, job.progress, cursor) if job.progress else None
     return JobResult(
         job_id=job.id,
         task_id=job.task_id,
@@ -138,7 +421,48 @@ async def get_job_status(client: AsyncClient, job_id: str) -> JobResult:
         created_at=job.created_at,
         started_at=job.started_at,
         completed_at=job.completed_at,
-        parameters=json.loads(job.parameters_json_value) if job.parameters_json_value else None,
-        result=json.loads(job.result_json_value) if job.result_json_value else None,
+        heartbeat_at=job.heartbeat_at,
+        cancel_requested_at=job.cancel_requested_at,
+        progress=progress,
+        metrics=job.metrics,
+        array=job.array,
+        parent_id=job.parent_id,
+        parameters=await _load_job_payload(job.parameters_json_value, job.parameters_ref) if include_parameters else None,
+        result=await _load_job_payload(job.result_json_value, job.result_ref) if include_result else None,
         error=json.loads(job.error_json_value) if job.error_json_value else None,
-    )
\ No newline at end of file
+    )
+
+
+async def cancel_job(client: AsyncClient, job_id: str) -> JobStatus:
+    """
+    Request the cancellation of a job, atomically. A job not started yet, or an array job, is
+    cancelled right away. A running job gets `cancel_requested_at`, and ends in the "cancelled"
+    status once its runtime sees it, within seconds.
+
+    Returns the status of the job after the request.
+
+    Raises:
+        ValueError: If the job does not exist.
+    """
+    job_ref = client.collection(JOBS_COLLECTION).document(job_id)
+
+    @async_transactional
+    async def cancel(transaction: AsyncTransaction) -> JobStatus:
+        job_doc = await job_ref.get(field_paths=["status", "array", "cancel_requested_at"], transaction=transaction)
+        if not job_doc.exists:
+            raise ValueError(f"Job {job_id} not found")
+        job = job_doc.to_dict() or {}
+        status = JobStatus(job.get("status", JobStatus.CREATED))
+        if status in (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED):
+            return status
+        now = get_timestamp()
+        fields = {"cancel_requested_at": job.get("cancel_requested_at") or now}
+        if status != JobStatus.RUNNING or job.get("array") is not None:
+            # Nothing runs the job itself, the task instances of an array job start no more children
+            # and forward the cancellation to their running child
+            status = JobStatus.CANCELLED
+            fields.update(status=status, completed_at=now)
+        transaction.update(job_ref, fields)
+        return status
+
+    return await cancel(client.transaction())
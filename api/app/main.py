@@ -1,31 +1,72 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Depends, Header, HTTPException
 from google.cloud.firestore import AsyncClient as FirestoreClient
 from google.cloud.run_v2 import JobsAsyncClient as CloudRunJobClient
 
+from app.config import settings
 from app.db import (
     get_firestore_client,
+    close_firestore_clients,
+    open_firestore_clients,
     list_user_tasks,
     user_has_access_to_task,
     user_has_access_to_job,
     get_job_status,
+    get_job_partials,
     get_task_details,
     create_job,
+    create_array_job,
+    cancel_job,
+    list_parameters_schemas,
+    watch_metadata,
 )
 from app.tasks import (
     get_jobs_client,
+    close_jobs_clients,
+    open_jobs_clients,
     execute_task,
+    execute_array_task,
 )
 from app.schema_validation import (
     validate_with_model_schema,
+    warm_model_cache,
 )
 from app.models import (
     Task,
     JobCreate,
     JobResult,
+    JobPartials,
+    JobStatus,
 )
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The clients are created once and shared by the requests
+    open_firestore_clients()
+    open_jobs_clients()
+    db = await get_firestore_client()
+    # Create the parameters models of the registered tasks before the first requests
+    try:
+        created = warm_model_cache(await list_parameters_schemas(db))
+        print(f"Created {created} parameters models")
+    except Exception as e:
+        print(f"Could not create the parameters models: {e}")
+    # Drop the cached user and task documents when they change
+    try:
+        stop_watch = await watch_metadata(db)
+    except Exception as e:
+        print(f"Could not watch the user and task documents, they expire after their TTL: {e}")
+        stop_watch = lambda: None
+    yield
+    stop_watch()
+    await close_firestore_clients()
+    await close_jobs_clients()
+
+
 # Load variables from environment
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 FirestoreClientDep = Depends(get_firestore_client)
 CloudRunJobClientDep = Depends(get_jobs_client)
@@ -74,13 +115,81 @@ async def execute(task_id: str, parameters: dict | None, x_user_email: str = Dep
     )
     return job_create
 
+
+@app.post("/execute/{task_id}/array")
+async def execute_array(task_id: str, parameters: list[dict], task_count: int | None = None, x_user_email: str = Depends(get_current_user), db: FirestoreClient = FirestoreClientDep, run: CloudRunJobClient = CloudRunJobClientDep) -> JobCreate:
+    """Execute a task for a user once per parameter set, as an array job run by `task_count` Cloud
+    Run task instances. The status of the array job aggregates its child jobs `{job_id}-{index}`."""
+    if not await user_has_access_to_task(db, x_user_email, task_id):
+        raise HTTPException(status_code=404, detail="Task not found")
+    if not 0 < len(parameters) <= settings.ARRAY_MAX_SIZE:
+        raise HTTPException(status_code=422, detail=f"Expected 1 to {settings.ARRAY_MAX_SIZE} parameter sets")
+    task_count = min(task_count or settings.ARRAY_TASK_COUNT, len(parameters))
+    if task_count < 1:
+        raise HTTPException(status_code=422, detail="Invalid task count")
+
+    # Validate parameters
+    task = await get_task_details(db, task_id)
+    try:
+        parameters_models = [validate_with_model_schema(task.parameters_schema, instance) for instance in parameters]
+    except ValueError:
+        raise HTTPException(status_code=402, detail="Invalid parameters")
+
+    # Create the array job in Firestore, the child jobs are created by the task instances
+    job_create = await create_array_job(
+        db,
+        x_user_email,
+        task_id,
+        parameters_models,
+        task_count,
+    )
+
+    # Submit job to Cloud Run Job
+    await execute_array_task(
+        run,
+        task,
+        job_create.id,
+        task_count,
+    )
+    return job_create
+
+
 @app.get("/jobs/{job_id}")
-async def get_job(job_id: str, x_user_email: str = Depends(get_current_user), db: FirestoreClient = FirestoreClientDep) -> JobResult:
-    """Get the status of a job"""
+async def get_job(job_id: str, cursor: int = -1, include_parameters: bool = True, include_result: bool = True, x_user_email: str = Depends(get_current_user), db: FirestoreClient = FirestoreClientDep) -> JobResult:
+    """Get the status of a job, with the step events after `cursor`. Set `include_parameters` and
+    `include_result` to false to poll the status without reading the payloads."""
     if not await user_has_access_to_job(db, x_user_email, job_id):
         raise HTTPException(status_code=404, detail="Job not found")
     try:
-        job_status = await get_job_status(db, job_id)
+        job_status = await get_job_status(db, job_id, cursor, include_parameters, include_result)
     except ValueError:
         raise HTTPException(status_code=404, detail="Job not found")
     return job_status
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel(job_id: str, x_user_email: str = Depends(get_current_user), db: FirestoreClient = FirestoreClientDep) -> JobResult:
+    """Cancel a job. A running job stops before its next step, or at its next `check_cancelled`, and
+    ends in the "cancelled" status. Finished jobs can not be cancelled."""
+    if not await user_has_access_to_job(db, x_user_email, job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    try:
+        status = await cancel_job(db, job_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if status in (JobStatus.COMPLETED, JobStatus.FAILED):
+        raise HTTPException(status_code=409, detail=f"Job already {status}")
+    return await get_job_status(db, job_id, include_parameters=False, include_result=False)
+
+
+@app.get("/jobs/{job_id}/partials")
+async def get_partials(job_id: str, offset: int = 0, limit: int = 1000, x_user_email: str = Depends(get_current_user), db: FirestoreClient = FirestoreClientDep) -> JobPartials:
+    """Get the partial results of a job from `offset`, while it runs. Use the returned
+    `next_offset` to only read newer partial results"""
+    if not await user_has_access_to_job(db, x_user_email, job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    try:
+        partials = await get_job_partials(db, job_id, offset, limit)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return partials
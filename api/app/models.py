@@ -44,20 +44,91 @@ class JobStatus(StrEnum):
     RUNNING = "running"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class JobStepMetrics(BaseModel):
+    """Resources used by a step"""
+    wall_time: float = Field(description="The wall time of the step, in seconds")
+    cpu_time: float = Field(description="The CPU time of the thread running the step, in seconds", default=0.0)
+    peak_rss_delta: int = Field(description="The increase of the process peak resident set size during the step, in bytes", default=0)
+    gpu_peak_memory: int | None = Field(description="The peak GPU memory allocated by torch during the step, in bytes", default=None)
+
+
+class JobMetrics(BaseModel):
+    """Resources used by the steps of a job, rolled up from the step metrics"""
+    step_wall_time: float = Field(description="The total wall time of the steps, in seconds", default=0.0)
+    step_cpu_time: float = Field(description="The total CPU time of the steps, in seconds", default=0.0)
+    peak_rss_delta: int = Field(description="The largest peak resident set size increase of a step, in bytes", default=0)
+    gpu_peak_memory: int | None = Field(description="The largest peak GPU memory of a step, in bytes", default=None)
+    slowest_step: int | None = Field(description="The sequence number of the step with the largest wall time", default=None)
+    slowest_step_name: str | None = Field(description="The name of the step with the largest wall time", default=None)
+    slowest_step_wall_time: float = Field(description="The wall time of the slowest step, in seconds", default=0.0)
+
+
+class JobProgressEvent(BaseModel):
+    """An event in the progress of a job, stored in the `steps` subcollection of the job. Events are
+    append-only, the status of a step is given by its latest event."""
+    seq: int = Field(description="The sequence number of the event in the job, starting at 0")
+    step: int = Field(description="The sequence number of the step in the job, starting at 0")
+    name: str = Field(description="The name of the step")
+    description: str = Field(description="The description of the step")
+    status: JobStatus = Field(description="The status of the step after the event")
+    timestamp: str = Field(description="The date of the event, in ISO format")
+    metrics: JobStepMetrics | None = Field(description="The resources used by the step, on its end event", default=None)
+    attempt: int = Field(description="The attempt of the step, starting at 0, retried steps have an event per attempt start and end", default=0)
+    error: str | None = Field(description="The error of a failed attempt", default=None)
 
 
-class JobProgressStep(BaseModel):
-    """A step in the progress of a job"""
-    name: str
-    description: str
-    started_at: str = Field(description="The start date of the step, in ISO format")
-    completed_at: str = Field(description="The completion date of the step, in ISO format")
-    status: JobStatus = Field(description="The status of the step", default=JobStatus.CREATED)
+class JobProgress(BaseModel):
+    """Progress counters for a job, stored in the job document"""
+    step_count: int = Field(description="The number of started steps", default=0)
+    event_count: int = Field(description="The number of step events", default=0)
+    partial_count: int = Field(description="The number of partial results", default=0)
+    partial_chunk_count: int = Field(description="The number of chunks of partial results", default=0)
 
 
-class JobProgress(BaseModel):
-    """Progress information for a job"""
-    steps: list[JobProgressStep] = Field(description="The detailed steps")
+class JobProgressEvents(JobProgress):
+    """Progress information for a job, with the step events after a cursor"""
+    events: list[JobProgressEvent] = Field(description="The step events after the cursor, in order")
+    cursor: int = Field(description="The sequence number of the last event, use it as cursor to only read newer events")
+
+
+class PayloadRef(BaseModel):
+    """Reference to a payload of a job (its parameters or result) stored in a blob store, used
+    instead of the inline JSON value when it is too large"""
+    store: str = Field(description="The URI of the blob store")
+    key: str = Field(description="The key of the payload in the blob store")
+    compression: str = Field(description="The compression of the stored payload, `gzip` or `zstd`")
+    size: int = Field(description="The size of the uncompressed JSON payload, in bytes")
+
+
+class JobPartialChunk(BaseModel):
+    """A chunk of partial results of a job, stored in the `partials` subcollection of the job"""
+    seq: int = Field(description="The sequence number of the chunk in the job, starting at 0")
+    offset: int = Field(description="The offset of the first partial result of the chunk in the job")
+    end: int = Field(description="The offset after the last partial result of the chunk")
+    items: list = Field(description="The partial results")
+
+
+class JobPartials(BaseModel):
+    """Partial results of a job from an offset, yielded by its generator steps"""
+    job_id: str = Field(description="The Firestore document ID")
+    status: JobStatus = Field(description="The current status of the job, no more partial results are added once finished")
+    offset: int = Field(description="The offset of the first returned partial result")
+    items: list = Field(description="The partial results from the offset, in order")
+    next_offset: int = Field(description="The offset to read the next partial results from")
+    partial_count: int = Field(description="The number of partial results written so far")
+
+
+class JobArray(BaseModel):
+    """Children of an array job, each parameter set of the array job runs as the child job
+    `{job_id}-{index}`"""
+    size: int = Field(description="The number of child jobs")
+    task_count: int = Field(description="The number of Cloud Run task instances sharing the child jobs", default=1)
+    completed: int = Field(description="The number of completed child jobs", default=0)
+    failed: int = Field(description="The number of failed child jobs", default=0)
+    cancelled: int = Field(description="The number of cancelled child jobs", default=0)
 
 
 class JobError(BaseModel):
@@ -81,7 +152,11 @@ class JobDocument(BaseModel):
         default=JobStatus.CREATED,
     )
     progress: JobProgress | None = Field(
-        description="The current detailed status of the job. It has the step-by-step progress.",
+        description="The progress counters of the job. The step events are in the `steps` subcollection.",
+        default=None,
+    )
+    metrics: JobMetrics | None = Field(
+        description="The resources used by the steps of the job",
         default=None,
     )
 
@@ -97,15 +172,40 @@ class JobDocument(BaseModel):
         description="The completion date of the job, in ISO format",
         default=None,
     )
+    heartbeat_at: str | None = Field(
+        description="The last heartbeat of the running job, in ISO format",
+        default=None,
+    )
+    cancel_requested_at: str | None = Field(
+        description="The date the cancellation of the job was requested, in ISO format",
+        default=None,
+    )
+
+    array: JobArray | None = Field(
+        description="The children of an array job, whose parameters are a list of parameter sets",
+        default=None,
+    )
+    parent_id: str | None = Field(
+        description="The array job ID of a child job",
+        default=None,
+    )
 
     parameters_json_value: str | None = Field(
         description="The parameters of the job in JSON format",
         default=None,
     )
+    parameters_ref: PayloadRef | None = Field(
+        description="The parameters of the job in the blob store, when too large to be inline",
+        default=None,
+    )
     result_json_value: str | None = Field(
         description="The result of the job in JSON format",
         default=None,
     )
+    result_ref: PayloadRef | None = Field(
+        description="The result of the job in the blob store, when too large to be inline",
+        default=None,
+    )
 
     error_json_value: str | None = Field(
         description="The error of the job in JSON format",
@@ -126,7 +226,8 @@ class JobCreate(BaseModel):
     )
     created_at: str = Field(description="The creation date of the job in ISO format")
 
-    parameters: dict | None = Field(description="The parameters of the job", default=None)
+    parameters: dict | list | None = Field(description="The parameters of the job, a list of parameter sets for an array job", default=None)
+    array: JobArray | None = Field(description="The children of an array job", default=None)
 
 
 class JobResult(BaseModel):
@@ -140,9 +241,16 @@ class JobResult(BaseModel):
     created_at: str = Field(description="The creation date of the job in ISO format")
     started_at: str | None = Field(description="The start date of the job in ISO format")
     completed_at: str | None = Field(description="The completion date of the job in ISO format")
+    heartbeat_at: str | None = Field(description="The last heartbeat of the running job in ISO format", default=None)
+    cancel_requested_at: str | None = Field(description="The date the cancellation of the job was requested in ISO format", default=None)
+
+    progress: JobProgressEvents | None = Field(description="The step-by-step progress of the job", default=None)
+    metrics: JobMetrics | None = Field(description="The resources used by the steps of the job", default=None)
+    array: JobArray | None = Field(description="The children of an array job", default=None)
+    parent_id: str | None = Field(description="The array job ID of a child job", default=None)
 
-    parameters: dict | None = Field(description="The parameters of the job", default=None)
-    result: dict | None = Field(description="The result of the job", default=None)
+    parameters: dict | list | None = Field(description="The parameters of the job, only when requested", default=None)
+    result: dict | None = Field(description="The result of the job, only when requested", default=None)
     error: JobError | None = Field(description="The error of the job", default=None)
 
 
@@ -1,9 +1,29 @@
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from enum import Enum
-from typing import Annotated, Any
+from typing import Annotated, Any, Iterable, NamedTuple
 from pydantic import BaseModel, create_model, Field
 from pydantic.json_schema import JsonSchemaValue
 from functools import reduce
+import hashlib
+import json
+import threading
+
+from app.config import settings
+
+
+class ModelCacheInfo(NamedTuple):
+    """Counters of the cache of models created from schemas"""
+    hits: int
+    misses: int
+    size: int
+    maxsize: int
+
+
+# Models created from schemas, by hash of the schema, in least recently used order
+_model_cache: OrderedDict[str, type[BaseModel]] = OrderedDict()
+_model_cache_lock = threading.Lock()
+_model_cache_hits = 0
+_model_cache_misses = 0
 
 
 def validate_with_model_schema(schema: JsonSchemaValue, values: dict, stric: bool = False) -> BaseModel:
@@ -26,10 +46,63 @@ def validate_with_model_schema(schema: JsonSchemaValue, values: dict, stric: boo
     ValueError
         If the values are invalid
     """
-    model = create_model_from_schema(schema)
+    model = get_model_from_schema(schema)
     return model.model_validate(values, strict=stric)
 
 
+def get_schema_hash(schema: JsonSchemaValue) -> str:
+    """Hash of a JSON schema, the same for equal schemas whatever the order of their keys"""
+    return hashlib.sha256(json.dumps(schema, sort_keys=True).encode()).hexdigest()
+
+
+def get_model_from_schema(schema: JsonSchemaValue) -> type[BaseModel]:
+    """Get the Pydantic model of a JSON schema, created once and kept in a LRU cache of at most
+    `SCHEMA_CACHE_SIZE` models, so validating parameters does not create new classes"""
+    global _model_cache_hits, _model_cache_misses
+    key = get_schema_hash(schema)
+    with _model_cache_lock:
+        model = _model_cache.get(key)
+        if model is not None:
+            _model_cache.move_to_end(key)
+            _model_cache_hits += 1
+            return model
+        _model_cache_misses += 1
+    model = create_model_from_schema(schema)
+    with _model_cache_lock:
+        _model_cache[key] = model
+        while len(_model_cache) > max(settings.SCHEMA_CACHE_SIZE, 0):
+            _model_cache.popitem(last=False)
+    return model
+
+
+def warm_model_cache(schemas: Iterable[JsonSchemaValue]) -> int:
+    """Create the models of the schemas ahead of the first requests. Returns the number of models
+    created, the invalid schemas are skipped"""
+    created = 0
+    for schema in schemas:
+        try:
+            get_model_from_schema(schema)
+        except Exception as e:
+            print(f"Invalid schema {schema.get('title')}: {e}")
+            continue
+        created += 1
+    return created
+
+
+def model_cache_info() -> ModelCacheInfo:
+    """Get the hits, misses and size of the cache of models"""
+    with _model_cache_lock:
+        return ModelCacheInfo(_model_cache_hits, _model_cache_misses, len(_model_cache), settings.SCHEMA_CACHE_SIZE)
+
+
+def clear_model_cache() -> None:
+    """Remove the cached models and reset the counters"""
+    global _model_cache_hits, _model_cache_misses
+    with _model_cache_lock:
+        _model_cache.clear()
+        _model_cache_hits = _model_cache_misses = 0
+
+
 def create_model_from_schema(schema: dict, type_mapper: dict | None = None) -> type[BaseModel]:
     """Create a Pydantic model from a JSON schema"""
     if type_mapper is None:
@@ -0,0 +1,43 @@
+import asyncio
+from typing import Any
+
+from tasks import payloads
+
+from app.config import settings
+from app.models import PayloadRef
+
+
+async def dump_payload(job_id: str, name: str, value_json: str) -> dict[str, Any]:
+    """
+    Get the job fields storing a payload, with the payload store of the API settings. See
+    `tasks.payloads.dump_payload`, shared with the task runtime.
+
+    Parameters:
+    -----------
+    job_id: str
+        ID of the job.
+    name: str
+        Name of the payload, `parameters` or `result`.
+    value_json: str
+        The payload in JSON format.
+
+    Returns:
+    --------
+    dict[str, Any]
+        The `{name}_json_value` and `{name}_ref` fields of the job.
+    """
+    # Compression and the blob store client are blocking
+    return await asyncio.to_thread(
+        payloads.dump_payload,
+        job_id,
+        name,
+        value_json,
+        store=settings.PAYLOAD_STORE,
+        inline_limit=settings.PAYLOAD_INLINE_LIMIT,
+        compression=settings.PAYLOAD_COMPRESSION,
+    )
+
+
+async def load_payload(ref: PayloadRef) -> str:
+    """Get a payload stored in a blob store, in JSON format."""
+    return await asyncio.to_thread(payloads.load_payload_ref, ref.model_dump())
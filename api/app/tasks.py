@@ -1,13 +1,17 @@
 from typing import Any
 
 from pydantic import BaseModel
-from google.cloud.run_v2 import JobsAsyncClient, RunJobRequest
+from google.cloud.run_v2 import EnvVar, JobsAsyncClient, RunJobRequest
+from google.cloud.run_v2.services.jobs.transports.grpc_asyncio import JobsGrpcAsyncIOTransport
 
+from app.clients import ClientPool, get_channel_options
+from app.config import settings
 from app.models import TaskDetails
 
 
 def _flatten_parameters(parameters: Any, prefix: str = "--") -> list[str]:
-    """Convert the parameters into a flat list of strings with '--' prefix."""
+    """Convert the parameters into a flat list of strings with '--' prefix. Only for the `args`
+    transport, types and nesting are lost."""
     if isinstance(parameters, dict):
         flatten = []
         prefix = f"{prefix}." if prefix != "--" else prefix
@@ -20,17 +24,53 @@ def _flatten_parameters(parameters: Any, prefix: str = "--") -> list[str]:
         return [prefix, str(parameters)]
 
 
+def _create_jobs_client() -> JobsAsyncClient:
+    channel = JobsGrpcAsyncIOTransport.create_channel(options=get_channel_options())
+    return JobsAsyncClient(transport=JobsGrpcAsyncIOTransport(channel=channel))
+
+
+async def _close_jobs_client(client: JobsAsyncClient) -> None:
+    await client.transport.close()
+
+
+_jobs_clients = ClientPool(_create_jobs_client, _close_jobs_client, settings.GRPC_POOL_SIZE)
+
+
+def open_jobs_clients() -> None:
+    """Create the Cloud Run jobs clients of the process pool, at startup"""
+    _jobs_clients.open()
+
+
 async def get_jobs_client() -> JobsAsyncClient:
-    return JobsAsyncClient()
+    """Get a Cloud Run jobs client of the process pool"""
+    return _jobs_clients.get()
+
+
+async def close_jobs_clients() -> None:
+    """Close the Cloud Run jobs clients of the process pool"""
+    await _jobs_clients.close()
 
 
 async def execute_task(client: JobsAsyncClient, task: TaskDetails, job_id: str, parameters: BaseModel | None) -> None:
-    """Create a Cloud Run Job for a task."""
+    """Create a Cloud Run Job for a task. The parameters are passed with the transport set in
+    `TASK_PARAMETERS_TRANSPORT`, by default flattened into arguments."""
     full_job_name = task.uri
 
-    parameters_values = {} if parameters is None else parameters.model_dump()
-    parameters_values["job_id"] = job_id
-    job_parameters = _flatten_parameters(parameters_values)
+    transport = settings.TASK_PARAMETERS_TRANSPORT
+    env = []
+    if transport == "job":
+        # Already stored in the job document by `create_job`
+        job_parameters = ["--job_id", job_id, "--parameters_from", "job"]
+    elif transport == "env":
+        parameters_json = "{}" if parameters is None else parameters.model_dump_json()
+        job_parameters = ["--job_id", job_id, "--parameters_from", "env"]
+        env = [EnvVar(name="TASK_PARAMETERS", value=parameters_json)]
+    elif transport == "args":
+        parameters_values = {} if parameters is None else parameters.model_dump()
+        parameters_values["job_id"] = job_id
+        job_parameters = _flatten_parameters(parameters_values)
+    else:
+        raise ValueError(f"Unsupported parameters transport: {transport}")
 
     # TODO: Add the logic to send it to the Vertex AI model endpoint
 
@@ -40,9 +80,27 @@ async def execute_task(client: JobsAsyncClient, task: TaskDetails, job_id: str,
         overrides=RunJobRequest.Overrides(
             container_overrides=[
                 RunJobRequest.Overrides.ContainerOverride(
-                    args=job_parameters
+                    args=job_parameters,
+                    env=env,
                 )
             ]
         )
     )
     await client.run_job(request=run_request)
+
+
+async def execute_array_task(client: JobsAsyncClient, task: TaskDetails, job_id: str, task_count: int) -> None:
+    """Create a Cloud Run Job execution with `task_count` task instances for an array job. Each
+    instance reads the parameter sets from the array job and runs its shard of the child jobs."""
+    run_request = RunJobRequest(
+        name=task.uri,
+        overrides=RunJobRequest.Overrides(
+            container_overrides=[
+                RunJobRequest.Overrides.ContainerOverride(
+                    args=["--job_id", job_id, "--array"]
+                )
+            ],
+            task_count=task_count,
+        )
+    )
+    await client.run_job(request=run_request)
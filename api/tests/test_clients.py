@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from app import db
+from app.clients import ClientPool
+
+
+class Client:
+    def __init__(self, index: int) -> None:
+        self.index = index
+        self.closed = False
+
+
+def _pool(size: int, fail_close: bool = False) -> tuple[ClientPool, list[Client]]:
+    created: list[Client] = []
+
+    def create() -> Client:
+        created.append(Client(len(created)))
+        return created[-1]
+
+    async def close(client: Client) -> None:
+        if fail_close:
+            raise RuntimeError("Already closed")
+        client.closed = True
+
+    return ClientPool(create, close, size), created
+
+
+def test_clients_are_used_in_turn():
+    pool, created = _pool(3)
+    pool.open()
+    pool.open()
+
+    assert [pool.get().index for _ in range(4)] == [0, 1, 2, 0]
+    assert len(created) == 3
+
+
+def test_clients_are_not_created_on_request():
+    pool, created = _pool(2)
+
+    with pytest.raises(RuntimeError, match="not open"):
+        pool.get()
+    assert created == []
+
+
+def test_clients_are_closed():
+    pool, created = _pool(2)
+    pool.open()
+
+    asyncio.run(pool.close())
+
+    assert all(client.closed for client in created)
+    with pytest.raises(RuntimeError, match="not open"):
+        pool.get()
+
+
+def test_close_errors_do_not_stop_the_shutdown():
+    pool, _ = _pool(2, fail_close=True)
+    pool.open()
+
+    asyncio.run(pool.close())
+
+    with pytest.raises(RuntimeError, match="not open"):
+        pool.get()
+
+
+def test_pool_has_at_least_one_client():
+    pool, _ = _pool(0)
+    pool.open()
+
+    assert pool.get() is pool.get()
+
+
+def test_firestore_client_is_shared(monkeypatch):
+    monkeypatch.setenv("FIRESTORE_EMULATOR_HOST", "localhost:8080")
+    monkeypatch.setattr(db.settings, "FIRESTORE_EMULATOR_HOST", "localhost:8080")
+    monkeypatch.setattr(db, "_firestore_clients", ClientPool(db._create_firestore_client, db._close_firestore_client, 1))
+
+    db.open_firestore_clients()
+    try:
+        assert asyncio.run(db.get_firestore_client()) is asyncio.run(db.get_firestore_client())
+    finally:
+        asyncio.run(db.close_firestore_clients())
+
+
+def test_firestore_channel_is_closed(monkeypatch):
+    pytest.importorskip("grpc")
+    from grpc import ChannelConnectivity
+    from benchmarks.firestore_fake import FakeFirestore
+
+    with FakeFirestore() as host:
+        monkeypatch.setenv("FIRESTORE_EMULATOR_HOST", host)
+        monkeypatch.setattr(db.settings, "FIRESTORE_EMULATOR_HOST", host)
+        monkeypatch.setattr(db, "_firestore_clients", ClientPool(db._create_firestore_client, db._close_firestore_client, 1))
+
+        async def use_and_close():
+            db.open_firestore_clients()
+            client = await db.get_firestore_client()
+            # The channel is created by the first call
+            assert not (await client.collection("tasks").document("task").get()).exists
+            channel = client._firestore_api.transport.grpc_channel
+            await db.close_firestore_clients()
+            return channel
+
+        channel = asyncio.run(use_and_close())
+
+    assert channel.get_state() == ChannelConnectivity.SHUTDOWN
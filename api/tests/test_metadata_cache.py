@@ -0,0 +1,101 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app import db
+from app.db import _invalidate_on_change, _MetadataCache
+
+
+class Loader:
+    """Load the current value of a document, counting the loads."""
+
+    def __init__(self, value: str, update_time: int = 1) -> None:
+        self.value = value
+        self.update_time = update_time
+        self.loads = 0
+
+    async def __call__(self) -> tuple[str, int]:
+        self.loads += 1
+        return self.value, self.update_time
+
+
+@pytest.fixture(autouse=True)
+def cache_ttl(monkeypatch):
+    monkeypatch.setattr(db.settings, "METADATA_CACHE_TTL", 60)
+
+
+def _get(cache: _MetadataCache, key: str, load) -> str:
+    return asyncio.run(cache.get(key, load))
+
+
+def test_document_is_loaded_once():
+    cache = _MetadataCache()
+    load = Loader("user")
+
+    assert _get(cache, "user@example.com", load) == "user"
+    assert _get(cache, "user@example.com", load) == "user"
+    assert load.loads == 1
+
+
+def test_document_is_loaded_again_after_the_ttl(monkeypatch):
+    cache = _MetadataCache()
+    load = Loader("user")
+    _get(cache, "user@example.com", load)
+
+    now = db.time.monotonic()
+    monkeypatch.setattr(db.time, "monotonic", lambda: now + 61)
+
+    _get(cache, "user@example.com", load)
+    assert load.loads == 2
+
+
+def test_nothing_is_cached_without_ttl(monkeypatch):
+    monkeypatch.setattr(db.settings, "METADATA_CACHE_TTL", 0)
+    cache = _MetadataCache()
+    load = Loader("user")
+
+    _get(cache, "user@example.com", load)
+    _get(cache, "user@example.com", load)
+
+    assert load.loads == 2
+
+
+def test_changed_document_is_loaded_again():
+    cache = _MetadataCache()
+    load = Loader("task")
+    _get(cache, "task", load)
+
+    load.value = "changed task"
+    _invalidate_on_change(cache)([], [SimpleNamespace(document=SimpleNamespace(id="task"))], None)
+
+    assert _get(cache, "task", load) == "changed task"
+
+
+def test_polled_update_times_drop_the_changed_documents():
+    cache = _MetadataCache()
+    kept, changed, deleted = Loader("kept"), Loader("changed"), Loader("deleted")
+    for key, load in (("kept", kept), ("changed", changed), ("deleted", deleted)):
+        _get(cache, key, load)
+
+    cache.invalidate_changed({"kept": 1, "changed": 2})
+
+    for key, load in (("kept", kept), ("changed", changed), ("deleted", deleted)):
+        _get(cache, key, load)
+    assert (kept.loads, changed.loads, deleted.loads) == (1, 2, 2)
+
+
+def test_load_started_before_a_change_is_not_cached():
+    cache = _MetadataCache()
+    load = Loader("task")
+
+    async def load_then_change() -> tuple[str, int]:
+        value = await load()
+        # The document changes while it is loaded
+        cache.invalidate("task")
+        return value
+
+    _get(cache, "task", load_then_change)
+    _get(cache, "task", load)
+
+    assert load.loads == 2
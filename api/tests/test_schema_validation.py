@@ -0,0 +1,71 @@
+import pytest
+from pydantic import BaseModel, Field, ValidationError
+
+from app import schema_validation
+from app.schema_validation import (
+    clear_model_cache,
+    get_model_from_schema,
+    get_schema_hash,
+    model_cache_info,
+    validate_with_model_schema,
+    warm_model_cache,
+)
+
+
+class Options(BaseModel):
+    language: str = Field(description="The language")
+
+
+class Parameters(BaseModel):
+    text: str = Field(description="The text")
+    count: int = Field(description="The count", default=1)
+    options: Options
+
+
+def _schema(title: str) -> dict:
+    return {**Parameters.model_json_schema(), "title": title}
+
+
+@pytest.fixture(autouse=True)
+def model_cache(monkeypatch):
+    monkeypatch.setattr(schema_validation.settings, "SCHEMA_CACHE_SIZE", 2)
+    clear_model_cache()
+    yield
+    clear_model_cache()
+
+
+def test_values_are_validated_with_the_schema():
+    model = validate_with_model_schema(Parameters.model_json_schema(), {"text": "a", "options": {"language": "fr"}})
+
+    assert model.model_dump() == {"text": "a", "count": 1, "options": {"language": "fr"}}
+    with pytest.raises(ValidationError):
+        validate_with_model_schema(Parameters.model_json_schema(), {"text": "a"})
+
+
+def test_model_is_created_once_per_schema():
+    first = get_model_from_schema(_schema("First"))
+    # The same schema with its keys in another order
+    reordered = dict(reversed(list(_schema("First").items())))
+
+    assert get_model_from_schema(reordered) is first
+    assert get_schema_hash(reordered) == get_schema_hash(_schema("First"))
+    assert model_cache_info() == (1, 1, 1, 2)
+
+
+def test_least_recently_used_model_is_evicted():
+    first = get_model_from_schema(_schema("First"))
+    second = get_model_from_schema(_schema("Second"))
+    get_model_from_schema(_schema("First"))
+    get_model_from_schema(_schema("Third"))
+
+    assert get_model_from_schema(_schema("First")) is first
+    assert get_model_from_schema(_schema("Second")) is not second
+    assert model_cache_info().size == 2
+
+
+def test_cache_is_warmed_with_the_valid_schemas():
+    assert warm_model_cache([_schema("First"), {"description": "No title"}, _schema("Second")]) == 2
+
+    get_model_from_schema(_schema("Second"))
+
+    assert model_cache_info() == (1, 3, 2, 2)
@@ -0,0 +1,29 @@
+import asyncio
+import json
+
+from app import storage
+from app.models import PayloadRef
+
+LARGE = json.dumps({"text": "word " * 1000})
+
+
+def test_payloads_use_the_api_settings(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage.settings, "PAYLOAD_STORE", str(tmp_path))
+    monkeypatch.setattr(storage.settings, "PAYLOAD_INLINE_LIMIT", 1024)
+
+    small = asyncio.run(storage.dump_payload("job", "parameters", '{"text": "word"}'))
+    large = asyncio.run(storage.dump_payload("job", "parameters", LARGE))
+
+    assert small == {"parameters_json_value": '{"text": "word"}', "parameters_ref": None}
+    assert large["parameters_json_value"] is None
+    assert large["parameters_ref"]["store"] == str(tmp_path)
+    ref = PayloadRef.model_validate(large["parameters_ref"])
+    assert asyncio.run(storage.load_payload(ref)) == LARGE
+
+
+def test_payloads_are_inline_without_store(monkeypatch):
+    monkeypatch.setattr(storage.settings, "PAYLOAD_STORE", "")
+
+    fields = asyncio.run(storage.dump_payload("job", "parameters", LARGE))
+
+    assert fields == {"parameters_json_value": LARGE, "parameters_ref": None}
@@ -0,0 +1,72 @@
+import asyncio
+import json
+
+import pytest
+from pydantic import BaseModel
+
+from app import tasks
+from app.models import TaskDetails
+from app.tasks import _flatten_parameters, execute_task
+
+
+class Parameters(BaseModel):
+    text: str
+    count: int
+
+
+class RecordingJobsClient:
+    """Cloud Run jobs client keeping the run requests."""
+
+    def __init__(self) -> None:
+        self.requests = []
+
+    async def run_job(self, request) -> None:
+        self.requests.append(request)
+
+
+def _task() -> TaskDetails:
+    return TaskDetails.model_construct(uri="projects/project/locations/region/jobs/task")
+
+
+def _run(transport: str, monkeypatch) -> tuple[list[str], dict[str, str]]:
+    monkeypatch.setattr(tasks.settings, "TASK_PARAMETERS_TRANSPORT", transport)
+    client = RecordingJobsClient()
+
+    asyncio.run(execute_task(client, _task(), "job", Parameters(text="a b", count=2)))
+
+    container = client.requests[0].overrides.container_overrides[0]
+    return list(container.args), {variable.name: variable.value for variable in container.env}
+
+
+def test_parameters_are_flattened_into_arguments():
+    assert _flatten_parameters({"text": "a", "options": {"size": 2}, "tags": ["x"]}) == [
+        "--text", "a", "--options.size", "2", "--tags", "\"['x']\"",
+    ]
+
+
+def test_parameters_are_passed_as_arguments_by_default(monkeypatch):
+    assert tasks.settings.TASK_PARAMETERS_TRANSPORT == "args"
+
+    args, env = _run("args", monkeypatch)
+
+    assert args == ["--text", "a b", "--count", "2", "--job_id", "job"]
+    assert env == {}
+
+
+def test_parameters_are_read_from_the_job(monkeypatch):
+    args, env = _run("job", monkeypatch)
+
+    assert args == ["--job_id", "job", "--parameters_from", "job"]
+    assert env == {}
+
+
+def test_parameters_are_passed_in_the_environment(monkeypatch):
+    args, env = _run("env", monkeypatch)
+
+    assert args == ["--job_id", "job", "--parameters_from", "env"]
+    assert json.loads(env["TASK_PARAMETERS"]) == {"text": "a b", "count": 2}
+
+
+def test_unsupported_transport_is_rejected(monkeypatch):
+    with pytest.raises(ValueError, match="Unsupported parameters transport"):
+        _run("stdin", monkeypatch)
@@ -128,6 +128,25 @@ resource "google_firestore_document" "tasks_firestore_db_collections" {
   depends_on = [google_firestore_database.tasks_firestore_db]
 }
 
+## Running jobs by heartbeat, for the stale job reaper (`tasks-reap`)
+resource "google_firestore_index" "tasks_firestore_db_jobs_heartbeat" {
+  project    = data.google_project.current.project_id
+  database   = google_firestore_database.tasks_firestore_db.name
+  collection = "jobs"
+
+  fields {
+    field_path = "status"
+    order      = "ASCENDING"
+  }
+
+  fields {
+    field_path = "heartbeat_at"
+    order      = "ASCENDING"
+  }
+
+  depends_on = [google_firestore_database.tasks_firestore_db]
+}
+
 resource "google_project_iam_binding" "tasks_firestore_db_access" {
   project = data.google_project.current.project_id
   role    = "roles/datastore.user"
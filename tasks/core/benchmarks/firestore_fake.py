@@ -0,0 +1,293 @@
+"""
+In-process fake of the Firestore service, for the benchmarks of the `firestore` job backend without
+the emulator.
+
+The fake serves the Firestore gRPC API on a local port, so the real client library is used as with
+the emulator: `FirestoreJobBackend` pays the serialization of its documents, its batches and
+transactions, and a gRPC round trip per call. Only what the job backend uses is served (documents,
+batched writes with field masks, transactions, queries with field filters and listing), the
+documents live in memory, transactions are not isolated and `Listen` streams never send changes. It
+measures the client side cost, not the latency of the real service.
+
+```python
+with FakeFirestore() as host:
+    os.environ["FIRESTORE_EMULATOR_HOST"] = host
+```
+"""
+import operator
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator
+
+import grpc
+from google.cloud.firestore_v1.types import document, firestore, query, write
+from google.protobuf import empty_pb2, timestamp_pb2
+
+SERVICE = "google.firestore.v1.Firestore"
+
+Document = document.Document.pb()
+StructuredQuery = query.StructuredQuery.pb()
+
+# Operators of the field filters, by name
+OPERATORS = {
+    "EQUAL": operator.eq,
+    "NOT_EQUAL": operator.ne,
+    "LESS_THAN": operator.lt,
+    "LESS_THAN_OR_EQUAL": operator.le,
+    "GREATER_THAN": operator.gt,
+    "GREATER_THAN_OR_EQUAL": operator.ge,
+}
+
+
+def _now() -> timestamp_pb2.Timestamp:
+    timestamp = timestamp_pb2.Timestamp()
+    timestamp.GetCurrentTime()
+    return timestamp
+
+
+def _split_field_path(field_path: str) -> list[str]:
+    """Split a field path in its names, the names with special characters are quoted with
+    backticks."""
+    names: list[str] = []
+    name = ""
+    quoted = False
+    for char in field_path:
+        if char == "`":
+            quoted = not quoted
+        elif char == "." and not quoted:
+            names.append(name)
+            name = ""
+        else:
+            name += char
+    names.append(name)
+    return names
+
+
+def _get_field(fields: Any, names: list[str]) -> Any | None:
+    for name in names[:-1]:
+        if name not in fields or fields[name].WhichOneof("value_type") != "map_value":
+            return None
+        fields = fields[name].map_value.fields
+    return fields[names[-1]] if names[-1] in fields else None
+
+
+def _set_field(fields: Any, names: list[str], value: Any | None) -> None:
+    for name in names[:-1]:
+        if name not in fields or fields[name].WhichOneof("value_type") != "map_value":
+            if value is None:
+                return
+            fields[name].map_value.SetInParent()
+        fields = fields[name].map_value.fields
+    if value is None:
+        fields.pop(names[-1], None)
+    else:
+        fields[names[-1]].CopyFrom(value)
+
+
+def _python_value(value: Any | None) -> Any:
+    """Get a comparable Python value of a Firestore value, `None` when missing."""
+    if value is None:
+        return None
+    kind = value.WhichOneof("value_type")
+    if kind == "timestamp_value":
+        return (value.timestamp_value.seconds, value.timestamp_value.nanos)
+    if kind in ("null_value", None):
+        return None
+    if kind in ("map_value", "array_value"):
+        return str(value)
+    return getattr(value, kind)
+
+
+def _matches(doc: Any, where: Any) -> bool:
+    kind = where.WhichOneof("filter_type")
+    if kind is None:
+        return True
+    if kind == "composite_filter":
+        return all(_matches(doc, sub_filter) for sub_filter in where.composite_filter.filters)
+    if kind == "field_filter":
+        field_filter = where.field_filter
+        actual = _python_value(_get_field(doc.fields, _split_field_path(field_filter.field.field_path)))
+        expected = _python_value(field_filter.value)
+        if actual is None or type(actual) is not type(expected):
+            return False
+        op = StructuredQuery.FieldFilter.Operator.Name(field_filter.op)
+        return OPERATORS[op](actual, expected)
+    raise NotImplementedError(f"Unsupported filter {kind}")
+
+
+def _project(doc: Any, field_paths: list[str]) -> Any:
+    projected = Document(name=doc.name, create_time=doc.create_time, update_time=doc.update_time)
+    for field_path in field_paths:
+        names = _split_field_path(field_path)
+        _set_field(projected.fields, names, _get_field(doc.fields, names))
+    return projected
+
+
+class FakeFirestore:
+    """
+    In-process fake of the Firestore service, served on a local port until stopped.
+
+    Parameters:
+    -----------
+    max_workers: int
+        Number of threads serving the calls.
+    """
+
+    def __init__(self, max_workers: int = 16) -> None:
+        self.max_workers = max_workers
+        self.host: str | None = None
+        self._documents: dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._server: grpc.Server | None = None
+
+    def start(self) -> str:
+        """Start serving, returns the host to set in `FIRESTORE_EMULATOR_HOST`."""
+        handlers = {
+            "BatchGetDocuments": grpc.unary_stream_rpc_method_handler(
+                self._batch_get_documents,
+                request_deserializer=firestore.BatchGetDocumentsRequest.pb().FromString,
+                response_serializer=firestore.BatchGetDocumentsResponse.pb().SerializeToString,
+            ),
+            "BeginTransaction": grpc.unary_unary_rpc_method_handler(
+                self._begin_transaction,
+                request_deserializer=firestore.BeginTransactionRequest.pb().FromString,
+                response_serializer=firestore.BeginTransactionResponse.pb().SerializeToString,
+            ),
+            "Commit": grpc.unary_unary_rpc_method_handler(
+                self._commit,
+                request_deserializer=firestore.CommitRequest.pb().FromString,
+                response_serializer=firestore.CommitResponse.pb().SerializeToString,
+            ),
+            "Rollback": grpc.unary_unary_rpc_method_handler(
+                self._rollback,
+                request_deserializer=firestore.RollbackRequest.pb().FromString,
+                response_serializer=empty_pb2.Empty.SerializeToString,
+            ),
+            "RunQuery": grpc.unary_stream_rpc_method_handler(
+                self._run_query,
+                request_deserializer=firestore.RunQueryRequest.pb().FromString,
+                response_serializer=firestore.RunQueryResponse.pb().SerializeToString,
+            ),
+            "ListDocuments": grpc.unary_unary_rpc_method_handler(
+                self._list_documents,
+                request_deserializer=firestore.ListDocumentsRequest.pb().FromString,
+                response_serializer=firestore.ListDocumentsResponse.pb().SerializeToString,
+            ),
+            "Listen": grpc.stream_stream_rpc_method_handler(
+                self._listen,
+                request_deserializer=firestore.ListenRequest.pb().FromString,
+                response_serializer=firestore.ListenResponse.pb().SerializeToString,
+            ),
+        }
+        self._server = grpc.server(ThreadPoolExecutor(max_workers=self.max_workers))
+        self._server.add_generic_rpc_handlers((grpc.method_handlers_generic_handler(SERVICE, handlers),))
+        port = self._server.add_insecure_port("localhost:0")
+        self._server.start()
+        self.host = f"localhost:{port}"
+        return self.host
+
+    def stop(self) -> None:
+        """Stop serving, the open streams are cancelled."""
+        if self._server is not None:
+            self._server.stop(grace=None)
+            self._server = None
+
+    def __enter__(self) -> str:
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    def _collection(self, parent: str, collection_id: str) -> list[Any]:
+        prefix = f"{parent}/{collection_id}/"
+        return [
+            doc for name, doc in sorted(self._documents.items())
+            if name.startswith(prefix) and "/" not in name[len(prefix):]
+        ]
+
+    def _batch_get_documents(self, request: Any, context: grpc.ServicerContext) -> Iterator[Any]:
+        BatchGetDocumentsResponse = firestore.BatchGetDocumentsResponse.pb()
+        transaction = uuid.uuid4().bytes if request.HasField("new_transaction") else b""
+        with self._lock:
+            docs = [(name, self._documents.get(name)) for name in request.documents]
+        for name, doc in docs:
+            if doc is None:
+                yield BatchGetDocumentsResponse(missing=name, read_time=_now(), transaction=transaction)
+                continue
+            if request.HasField("mask"):
+                doc = _project(doc, list(request.mask.field_paths))
+            yield BatchGetDocumentsResponse(found=doc, read_time=_now(), transaction=transaction)
+
+    def _begin_transaction(self, request: Any, context: grpc.ServicerContext) -> Any:
+        return firestore.BeginTransactionResponse.pb()(transaction=uuid.uuid4().bytes)
+
+    def _rollback(self, request: Any, context: grpc.ServicerContext) -> Any:
+        return empty_pb2.Empty()
+
+    def _commit(self, request: Any, context: grpc.ServicerContext) -> Any:
+        WriteResult = write.WriteResult.pb()
+        commit_time = _now()
+        with self._lock:
+            for doc_write in request.writes:
+                kind = doc_write.WhichOneof("operation")
+                if kind == "delete":
+                    self._documents.pop(doc_write.delete, None)
+                    continue
+                if kind != "update":
+                    context.abort(grpc.StatusCode.UNIMPLEMENTED, f"Unsupported write {kind}")
+                name = doc_write.update.name
+                current = self._documents.get(name)
+                precondition = doc_write.current_document
+                if precondition.HasField("exists") and precondition.exists != (current is not None):
+                    context.abort(grpc.StatusCode.NOT_FOUND if precondition.exists else grpc.StatusCode.ALREADY_EXISTS, name)
+                doc = Document(name=name, update_time=commit_time)
+                doc.create_time.CopyFrom(current.create_time if current is not None else commit_time)
+                if doc_write.HasField("update_mask"):
+                    if current is not None:
+                        doc.fields.MergeFrom(current.fields)
+                    for field_path in doc_write.update_mask.field_paths:
+                        names = _split_field_path(field_path)
+                        _set_field(doc.fields, names, _get_field(doc_write.update.fields, names))
+                else:
+                    doc.fields.MergeFrom(doc_write.update.fields)
+                self._documents[name] = doc
+        return firestore.CommitResponse.pb()(
+            write_results=[WriteResult(update_time=commit_time) for _ in request.writes],
+            commit_time=commit_time,
+        )
+
+    def _run_query(self, request: Any, context: grpc.ServicerContext) -> Iterator[Any]:
+        RunQueryResponse = firestore.RunQueryResponse.pb()
+        structured_query = request.structured_query
+        collection_id = structured_query.from_[0].collection_id
+        with self._lock:
+            docs = [doc for doc in self._collection(request.parent, collection_id) if _matches(doc, structured_query.where)]
+        for order in reversed(structured_query.order_by):
+            if order.field.field_path == "__name__":
+                continue
+            names = _split_field_path(order.field.field_path)
+            docs.sort(
+                key=lambda doc: _python_value(_get_field(doc.fields, names)),
+                reverse=order.direction == StructuredQuery.Direction.DESCENDING,
+            )
+        if structured_query.HasField("limit"):
+            docs = docs[:structured_query.limit.value]
+        if structured_query.HasField("select"):
+            field_paths = [field.field_path for field in structured_query.select.fields]
+            docs = [_project(doc, field_paths) for doc in docs]
+        for doc in docs:
+            yield RunQueryResponse(document=doc, read_time=_now())
+        if not docs:
+            yield RunQueryResponse(read_time=_now())
+
+    def _list_documents(self, request: Any, context: grpc.ServicerContext) -> Any:
+        with self._lock:
+            docs = self._collection(request.parent, request.collection_id)
+        return firestore.ListDocumentsResponse.pb()(documents=[Document(name=doc.name) for doc in docs])
+
+    def _listen(self, request_iterator: Iterator[Any], context: grpc.ServicerContext) -> Iterator[Any]:
+        # Held open without changes until the client closes it
+        for _ in request_iterator:
+            pass
+        return iter(())
@@ -0,0 +1,184 @@
+"""
+Microbenchmarks of the runtime overhead of `@task` and `@step`.
+
+Measures, in process, the overhead of a step (with the default write-behind status writer and
+written through), of an async step, the cost of `setup_context` and `create_or_check_job` for a new
+job, the overhead of a job without steps, and the time of jobs with more and more steps. The job
+backend is the in-process `memory` backend by default, `sqlite` for a SQLite file, or `firestore`
+for the emulator set in `FIRESTORE_EMULATOR_HOST`.
+
+Results are printed as JSON, in seconds (medians of `--repeat` runs). Save them with `--save` and
+compare a later run with `--baseline`, the benchmark exits with an error when a result is slower
+than the baseline by more than `--tolerance`.
+
+```bash
+python -m benchmarks.runtime --save /tmp/runtime-before.json
+python -m benchmarks.runtime --baseline /tmp/runtime-before.json
+```
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from typing import Callable
+
+# Step counts of the scaling measures
+SCALING_STEPS = (1, 10, 100, 1000)
+
+
+def _job_id() -> str:
+    return f"runtime-benchmark-{uuid.uuid4().hex}"
+
+
+def _median(measure: Callable[[], float], repeat: int) -> float:
+    return statistics.median(measure() for _ in range(repeat))
+
+
+def run_benchmarks(steps: int, repeat: int) -> dict[str, float]:
+    """Run the measures with the job backend selected by `JOBS_BACKEND`."""
+    # Imported here, after the environment of the job backend is set
+    from tasks import task, step, BaseParameters, BaseResult
+    from tasks.config import settings
+    from tasks.db import setup_context, create_or_check_job, get_job_backend
+
+    class Parameters(BaseParameters):
+        steps: int
+
+    class Results(BaseResult):
+        total: int
+
+    @step(name="Noop", description="Step doing nothing")
+    def noop(value: int) -> int:
+        return value + 1
+
+    @step(name="Async Noop", description="Async step doing nothing")
+    async def async_noop(value: int) -> int:
+        return value + 1
+
+    @task(name="Runtime Benchmark", description="Task calling a no-op step `steps` times")
+    def steps_task(parameters: Parameters) -> Results:
+        total = 0
+        for _ in range(parameters.steps):
+            total = noop(total)
+        return Results(total=total)
+
+    @task(name="Async Runtime Benchmark", description="Task awaiting a no-op step `steps` times")
+    async def async_steps_task(parameters: Parameters) -> Results:
+        total = 0
+        for _ in range(parameters.steps):
+            total = await async_noop(total)
+        return Results(total=total)
+
+    def time_job(count: int) -> float:
+        started = time.perf_counter()
+        steps_task(_job_id(), Parameters(steps=count))
+        return time.perf_counter() - started
+
+    def time_async_job(count: int) -> float:
+        async def run() -> float:
+            started = time.perf_counter()
+            await async_steps_task(_job_id(), Parameters(steps=count))
+            return time.perf_counter() - started
+        return asyncio.run(run())
+
+    def per_step(time_steps: Callable[[int], float]) -> float:
+        # The overhead of the job itself is removed with a job without steps
+        return max(time_steps(steps) - time_steps(0), 0.0) / steps
+
+    def time_setup_context() -> float:
+        started = time.perf_counter()
+        ctx = setup_context(_job_id(), "runtime_benchmark", Parameters(steps=0))
+        elapsed = time.perf_counter() - started
+        ctx.writer.close()
+        return elapsed
+
+    def time_create_or_check_job() -> float:
+        started = time.perf_counter()
+        create_or_check_job(backend, _job_id(), "runtime_benchmark", Parameters(steps=0))
+        return time.perf_counter() - started
+
+    backend = get_job_backend()
+    # Warm up the backend and the imports of the first job
+    time_job(1)
+
+    results: dict[str, float] = {}
+    results["step_overhead"] = _median(lambda: per_step(time_job), repeat)
+    results["async_step_overhead"] = _median(lambda: per_step(time_async_job), repeat)
+    write_interval = settings.STATUS_WRITE_INTERVAL
+    settings.STATUS_WRITE_INTERVAL = 0
+    try:
+        results["step_overhead_write_through"] = _median(lambda: per_step(time_job), repeat)
+    finally:
+        settings.STATUS_WRITE_INTERVAL = write_interval
+    results["setup_context"] = _median(time_setup_context, repeat)
+    results["create_or_check_job"] = _median(time_create_or_check_job, repeat)
+    results["job_overhead"] = _median(lambda: time_job(0), repeat)
+    for count in SCALING_STEPS:
+        results[f"job_{count}_steps"] = _median(lambda: time_job(count), repeat)
+    return results
+
+
+def compare(results: dict[str, float], baseline: dict[str, float], tolerance: float) -> list[str]:
+    """Return the results slower than their baseline by more than `tolerance`, a ratio."""
+    return [
+        f"{name}: {value * 1e6:.1f}us > {baseline[name] * 1e6:.1f}us (+{value / baseline[name] - 1:.0%})"
+        for name, value in results.items()
+        if baseline.get(name) and value > baseline[name] * (1 + tolerance)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the runtime overhead of tasks and steps")
+    parser.add_argument("--backend", choices=("memory", "sqlite", "firestore", "firestore-fake"), default="memory", help="Job backend (default: memory)")
+    parser.add_argument("--steps", type=int, default=200, help="Number of steps of the step overhead measures (default: 200)")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs of each measure (default: 5)")
+    parser.add_argument("--save", help="Write the results to this JSON file, to use as a baseline")
+    parser.add_argument("--baseline", help="Compare the results with this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown over the baseline, as a ratio (default: 0.2)")
+    args = parser.parse_args()
+
+    # The step logs would measure the log stream, keep them quiet unless asked for
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    with tempfile.TemporaryDirectory() as tmp, contextlib.ExitStack() as stack:
+        if args.backend == "sqlite":
+            os.environ["JOBS_BACKEND"] = f"sqlite://{os.path.join(tmp, 'jobs.db')}"
+        elif args.backend == "firestore":
+            if not os.environ.get("FIRESTORE_EMULATOR_HOST"):
+                parser.error("the firestore backend needs the emulator, set FIRESTORE_EMULATOR_HOST")
+            os.environ["JOBS_BACKEND"] = "firestore"
+        elif args.backend == "firestore-fake":
+            from benchmarks.firestore_fake import FakeFirestore
+
+            os.environ["FIRESTORE_EMULATOR_HOST"] = stack.enter_context(FakeFirestore())
+            os.environ["JOBS_BACKEND"] = "firestore"
+        else:
+            os.environ["JOBS_BACKEND"] = "memory"
+        results = run_benchmarks(args.steps, args.repeat)
+
+    output = {"backend": args.backend, "results": results}
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(output, f, indent=4)
+            f.write("\n")
+    regressions: list[str] = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("backend") != args.backend:
+            print(f"Baseline measured with the {baseline.get('backend')} backend", file=sys.stderr)
+        output["baseline"] = baseline["results"]
+        regressions = compare(results, baseline["results"], args.tolerance)
+        output["regressions"] = regressions
+    print(json.dumps(output, indent=4))
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Startup benchmark of the `tasks-run` entry point.
+
+Measures, in fresh interpreters, the time to import `tasks` and `tasks.scripts`, checks that the
+serve-only dependencies and the Firestore client are not imported by them, and measures the time
+from the process start to the first step of a task run with `tasks-run`, with the in-memory job
+backend. With a Firestore emulator (`FIRESTORE_EMULATOR_HOST`) it is also measured with the
+Firestore job backend.
+
+The medians are compared with `benchmarks/thresholds.json`, and the benchmark exits with an error
+when one of them is over its threshold.
+
+```bash
+python -m benchmarks.startup --runs 5
+```
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+CORE_DIR = os.path.dirname(BENCHMARKS_DIR)
+THRESHOLDS_FILE = os.path.join(BENCHMARKS_DIR, "thresholds.json")
+
+# Modules that the run path must not import
+LAZY_MODULES = ("fastapi", "uvicorn", "google.cloud.firestore")
+
+IMPORT_CODE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"elapsed": elapsed, "loaded": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def _env() -> dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [CORE_DIR, env.get("PYTHONPATH")]))
+    return env
+
+
+def measure_import(module: str, runs: int) -> tuple[float, list[str]]:
+    """Return the median time to import a module in a fresh interpreter, and the lazy modules it
+    loaded."""
+    times = []
+    loaded: set[str] = set()
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_CODE.format(module=module, lazy=LAZY_MODULES)],
+            env=_env(), check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        times.append(result["elapsed"])
+        loaded.update(result["loaded"])
+    return statistics.median(times), sorted(loaded)
+
+
+def measure_first_step(runs: int, jobs_backend: str) -> float:
+    """Return the median time from starting `tasks-run` to the start of the first step."""
+    times = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for index in range(runs):
+            first_step_file = os.path.join(tmp, f"first-step-{index}")
+            env = _env()
+            env["TASK_MODULE"] = "benchmarks.startup_task"
+            env["BENCHMARK_FIRST_STEP_FILE"] = first_step_file
+            env["JOBS_BACKEND"] = jobs_backend
+            job_id = f"startup-benchmark-{uuid.uuid4().hex}"
+            started_at = time.time()
+            subprocess.run(
+                [sys.executable, "-c", "from tasks import run; run()", "--job_id", job_id],
+                env=env, check=True, capture_output=True,
+            )
+            with open(first_step_file) as f:
+                times.append(float(f.read()) - started_at)
+    return statistics.median(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Startup benchmark of tasks-run")
+    parser.add_argument("--runs", type=int, default=5, help="Number of runs of each measure (default: 5)")
+    parser.add_argument("--update", action="store_true", help="Write the measures as the new thresholds, with a 50%% margin")
+    args = parser.parse_args()
+
+    results: dict[str, float] = {}
+    lazy_loaded: dict[str, list[str]] = {}
+    for name, module in (("import_tasks", "tasks"), ("import_scripts", "tasks.scripts")):
+        results[name], lazy_loaded[name] = measure_import(module, args.runs)
+    results["time_to_first_step"] = measure_first_step(args.runs, "memory")
+    if os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        results["time_to_first_step_firestore"] = measure_first_step(args.runs, "firestore")
+    else:
+        print("FIRESTORE_EMULATOR_HOST not set, skipping time_to_first_step_firestore", file=sys.stderr)
+
+    if args.update:
+        with open(THRESHOLDS_FILE) as f:
+            thresholds = json.load(f)
+        thresholds.update({name: round(value * 1.5, 3) for name, value in results.items()})
+        with open(THRESHOLDS_FILE, "w") as f:
+            json.dump(thresholds, f, indent=4)
+            f.write("\n")
+
+    with open(THRESHOLDS_FILE) as f:
+        thresholds = json.load(f)
+    regressions = [
+        f"{name}: {value:.3f}s > {thresholds[name]:.3f}s"
+        for name, value in results.items() if name in thresholds and value > thresholds[name]
+    ]
+    regressions += [f"{name}: imports {', '.join(modules)}" for name, modules in lazy_loaded.items() if modules]
+    print(json.dumps({"results": results, "thresholds": thresholds, "regressions": regressions}, indent=4))
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+import os
+import time
+
+from tasks import task as _task, step, BaseParameters, BaseResult
+
+
+class Parameters(BaseParameters):
+    pass
+
+
+class Results(BaseResult):
+    first_step_at: float
+
+
+@step(name="First Step", description="Record when the first step starts")
+def first_step() -> float:
+    started_at = time.time()
+    path = os.environ.get("BENCHMARK_FIRST_STEP_FILE")
+    if path:
+        with open(path, "w") as f:
+            f.write(str(started_at))
+    return started_at
+
+
+@_task(name="Startup Benchmark", description="Task measuring the time to the first step")
+def task(parameters: Parameters) -> Results:
+    return Results(first_step_at=first_step())
@@ -3,11 +3,11 @@
 set -e
 
 # Validate allowed commands
-if [ "$TASK_COMMAND" = "tasks-run" ] || [ "$TASK_COMMAND" = "tasks-serve" ] || [ "$TASK_COMMAND" = "tasks-register" ]; then
+if [ "$TASK_COMMAND" = "tasks-run" ] || [ "$TASK_COMMAND" = "tasks-serve" ] || [ "$TASK_COMMAND" = "tasks-register" ] || [ "$TASK_COMMAND" = "tasks-worker" ] || [ "$TASK_COMMAND" = "tasks-enqueue" ] || [ "$TASK_COMMAND" = "tasks-reap" ]; then
     echo "Running: $TASK_COMMAND with arguments: $@"
     exec "$TASK_COMMAND" "$@"
 else
     echo "Error: Invalid TASK_COMMAND value: '$TASK_COMMAND'"
-    echo "Allowed values: tasks-run, tasks-serve, tasks-register"
+    echo "Allowed values: tasks-run, tasks-serve, tasks-register, tasks-worker, tasks-enqueue, tasks-reap"
     exit 1
 fi
\ No newline at end of file
@@ -1,4 +1,15 @@
-from tasks.tasks import step, task  # noqa: F401
-from tasks.types import BaseParameters, BaseResult  # noqa: F401
+from tasks.tasks import step, task, check_cancelled  # noqa: F401
+from tasks.batching import batched  # noqa: F401
+from tasks.resources import resource  # noqa: F401
+from tasks.types import BaseParameters, BaseResult, JobCancelled  # noqa: F401
 from tasks.utils import get_logger  # noqa: F401
-from tasks.scripts import run, register, serve  # noqa: F401
\ No newline at end of file
+
+# The entry points are imported on first use, so importing the decorators stays cheap
+_SCRIPTS = ("run", "register", "serve", "worker", "enqueue", "reap")
+
+
+def __getattr__(name: str):
+    if name in _SCRIPTS:
+        from tasks import scripts
+        return getattr(scripts, name)
+    raise AttributeError(f"module 'tasks' has no attribute {name!r}")
@@ -0,0 +1,351 @@
+import json
+import threading
+import time
+from typing import Any, Callable
+
+from tasks.backends import JobBackend
+from tasks.cancellation import JobCancellation, request_cancel
+from tasks.config import settings
+from tasks.db import get_job_backend
+from tasks.models import CreateJob, JobArray, JobArrayCounts, JobError, JobStatus, get_timestamp
+from tasks.payloads import dump_payload, load_payload
+from tasks.tasks import run_task_pipeline
+from tasks.types import TaskWithJobIdType, BaseParameters, JobIDType
+from tasks.utils import get_logger
+
+logger = get_logger(__name__)
+
+# Error code of the array jobs with failed children
+ARRAY_CHILD_FAILED = "ArrayChildFailed"
+
+
+def get_child_job_id(job_id: JobIDType, index: int) -> JobIDType:
+    """Get the job ID of the child `index` of an array job."""
+    return f"{job_id}-{index}"
+
+
+def get_shard_indexes(size: int, task_index: int, task_count: int) -> range:
+    """Get the indexes of the children of an array job run by the task instance `task_index` of
+    `task_count`. Children are dealt in turn, so every instance gets the same share of the slow
+    and fast parameter sets of a sorted list."""
+    if task_count < 1 or not 0 <= task_index < task_count:
+        raise ValueError(f"Invalid task index {task_index} of {task_count}")
+    return range(task_index, size, task_count)
+
+
+def get_child_index(job_id: JobIDType, child_id: JobIDType) -> int:
+    """Get the index of the child `child_id` of the array job `job_id`."""
+    return int(child_id.removeprefix(f"{job_id}-"))
+
+
+def _count_child(counts: JobArrayCounts, status: str | None) -> None:
+    # Children not ended, or never created, are counted as failed
+    if status == JobStatus.COMPLETED:
+        counts.completed += 1
+    elif status == JobStatus.CANCELLED:
+        counts.cancelled += 1
+    else:
+        counts.failed += 1
+
+
+def _end_array(job: dict[str, Any], array: JobArray, lost: int = 0) -> dict[str, Any]:
+    """Get the fields ending the array job once all its children are counted."""
+    ended = job.get("status") in (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED)
+    if ended or array.completed + array.failed + array.cancelled < array.size:
+        return {}
+    error = None
+    if array.failed:
+        message = f"{array.failed} of {array.size} child jobs failed"
+        if lost:
+            message += f", {lost} of them were not run to the end"
+        error = JobError(
+            code=ARRAY_CHILD_FAILED,
+            message=message,
+            additional_info={"failed": array.failed, "lost": lost},
+        ).model_dump_json()
+    # Children cancelled on their own do not fail the array job
+    status = JobStatus.FAILED if array.failed else JobStatus.COMPLETED
+    return {"status": status, "completed_at": get_timestamp(), "error_json_value": error}
+
+
+def _sum_shards(array: JobArray) -> None:
+    array.completed = sum(counts.completed for counts in array.shards.values())
+    array.failed = sum(counts.failed for counts in array.shards.values())
+    array.cancelled = sum(counts.cancelled for counts in array.shards.values())
+
+
+def _start_array(resume: bool):
+    def update(job: dict[str, Any]) -> dict[str, Any] | None:
+        status = job.get("status")
+        array = JobArray.model_validate(job["array"])
+        if array.size == 0:
+            return {"status": JobStatus.COMPLETED, "started_at": get_timestamp(), "completed_at": get_timestamp()}
+        if status == JobStatus.CREATED:
+            return {"status": JobStatus.RUNNING, "started_at": get_timestamp(), "heartbeat_at": get_timestamp()}
+        if resume and status == JobStatus.FAILED:
+            # The failed children are run again and counted anew by their shards
+            for counts in array.shards.values():
+                counts.failed = 0
+            _sum_shards(array)
+            return {
+                "status": JobStatus.RUNNING,
+                "completed_at": None,
+                "error_json_value": None,
+                "heartbeat_at": get_timestamp(),
+                "array": array.model_dump(),
+            }
+        if status == JobStatus.RUNNING:
+            return {"heartbeat_at": get_timestamp()}
+        return None
+    return update
+
+
+def _set_shard_counts(task_index: int, counts: JobArrayCounts):
+    def update(job: dict[str, Any]) -> dict[str, Any]:
+        array = JobArray.model_validate(job["array"])
+        array.shards[str(task_index)] = counts
+        _sum_shards(array)
+        fields: dict[str, Any] = {"array": array.model_dump()}
+        if job.get("status") == JobStatus.RUNNING:
+            fields["heartbeat_at"] = get_timestamp()
+        return {**fields, **_end_array(job, array)}
+    return update
+
+
+def _add_failed_child(index: int):
+    def update(job: dict[str, Any]) -> dict[str, Any]:
+        array = JobArray.model_validate(job["array"])
+        array.shards.setdefault(str(index % array.task_count), JobArrayCounts()).failed += 1
+        _sum_shards(array)
+        return {"array": array.model_dump(), **_end_array(job, array)}
+    return update
+
+
+def _heartbeat(job: dict[str, Any]) -> dict[str, Any] | None:
+    if job.get("status") != JobStatus.RUNNING:
+        return None
+    return {"heartbeat_at": get_timestamp()}
+
+
+def set_shard_counts(backend: JobBackend, job_id: JobIDType, task_index: int, counts: JobArrayCounts) -> None:
+    """
+    Set the counts of the ended children of a shard of an array job, atomically, and send the
+    heartbeat of the array job. The counts of a shard are set as a whole, so a shard run again
+    counts its children anew. The running array job ends once all its children are counted, failed
+    if any of them failed.
+
+    Parameters:
+    -----------
+    backend: JobBackend
+        Backend storing the jobs.
+    job_id: JobIDType
+        ID of the array job.
+    task_index: int
+        Index of the task instance of the shard.
+    counts: JobArrayCounts
+        Counts of the ended children of the shard.
+    """
+    fields = backend.update_job(job_id, _set_shard_counts(task_index, counts))
+    if "status" in fields:
+        logger.info("Array job %s %s", job_id, fields["status"])
+
+
+def count_failed_child(backend: JobBackend, job_id: JobIDType, child_id: JobIDType) -> None:
+    """
+    Count a child of an array job failed outside of its shard, e.g. by `tasks-reap`, atomically.
+
+    Parameters:
+    -----------
+    backend: JobBackend
+        Backend storing the jobs.
+    job_id: JobIDType
+        ID of the array job.
+    child_id: JobIDType
+        ID of the failed child job.
+    """
+    fields = backend.update_job(job_id, _add_failed_child(get_child_index(job_id, child_id)))
+    if "status" in fields:
+        logger.info("Array job %s %s", job_id, fields["status"])
+
+
+def settle_array(backend: JobBackend, job_id: JobIDType, heartbeat_before: str) -> bool:
+    """
+    End an array job without heartbeat since `heartbeat_before`, all its task instances were lost.
+    The children are counted from their statuses, the children not ended or never created by a lost
+    instance are counted as failed.
+
+    Parameters:
+    -----------
+    backend: JobBackend
+        Backend storing the jobs.
+    job_id: JobIDType
+        ID of the array job.
+    heartbeat_before: str
+        ISO timestamp, the array job is ended only if its last heartbeat is older.
+
+    Returns:
+    --------
+    bool
+        Whether the array job was ended, it may have sent a heartbeat since.
+    """
+    job = backend.get_job(job_id)
+    if job is None or job.get("array") is None:
+        return False
+    array = JobArray.model_validate(job["array"])
+    counts = JobArrayCounts()
+    lost = 0
+    for index in range(array.size):
+        child = backend.get_job(get_child_job_id(job_id, index))
+        status = child.get("status") if child is not None else None
+        if status not in (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED):
+            lost += 1
+        _count_child(counts, status)
+    array.completed, array.failed, array.cancelled = counts.completed, counts.failed, counts.cancelled
+    fields = {"array": array.model_dump(), **_end_array({}, array, lost)}
+    ended = backend.fail_stale_job(job_id, heartbeat_before, fields)
+    if ended:
+        logger.warning("Array job %s %s, its task instances were lost with %s child jobs not run", job_id, fields["status"], lost)
+    return ended
+
+
+def _beat(backend: JobBackend, job_id: JobIDType, interval: float) -> Callable[[], None]:
+    """Send the heartbeat of an array job every `interval` seconds in a thread, until the
+    returned function is called."""
+    stopped = threading.Event()
+
+    def beat() -> None:
+        while not stopped.wait(interval):
+            try:
+                backend.update_job(job_id, _heartbeat)
+            except Exception:
+                logger.exception("Failed to send the heartbeat of array job %s", job_id)
+
+    if interval > 0:
+        threading.Thread(target=beat, name=f"array-heartbeat-{job_id}", daemon=True).start()
+    return stopped.set
+
+
+def _fail_child(backend: JobBackend, job_id: JobIDType, e: Exception) -> None:
+    error = JobError(code=type(e).__name__, message=str(e))
+    backend.update_job(job_id, lambda job: {
+        "status": JobStatus.FAILED,
+        "completed_at": get_timestamp(),
+        "error_json_value": error.model_dump_json(),
+    })
+
+
+def run_array_shard(task_pipeline: TaskWithJobIdType, parameters_model: type[BaseParameters], job_id: JobIDType, resume: bool = False, task_index: int | None = None, task_count: int | None = None) -> None:
+    """
+    Run the shard of an array job of this task instance. The array job is created beforehand with
+    the list of parameter sets as parameters, each one is run in order as a child job, and the
+    counts of completed, failed and cancelled children of the shard are set in the array job at
+    most every `STATUS_WRITE_INTERVAL` seconds. The shard sends the heartbeat of the array job
+    while it runs, once all its instances are lost `tasks-reap` ends it.
+
+    Completed and cancelled children are skipped, so a shard can run again and count them anew.
+    Failed children are run again only when resumed. Running children were left by a lost instance,
+    they are skipped and counted once `tasks-reap` fails them. Once the array job is cancelled, no
+    more children are started, and the cancellation of the running child is requested.
+
+    Parameters:
+    -----------
+    task_pipeline: TaskWithJobIdType
+        Task pipeline function.
+    parameters_model: type[BaseParameters]
+        Parameters model for the task.
+    job_id: JobIDType
+        ID of the array job.
+    resume: bool
+        Run the failed children again, resuming them from their checkpoints.
+    task_index: int | None
+        Index of this task instance, defaults to `CLOUD_RUN_TASK_INDEX`.
+    task_count: int | None
+        Number of task instances, defaults to `CLOUD_RUN_TASK_COUNT`.
+    """
+    task_index = settings.CLOUD_RUN_TASK_INDEX if task_index is None else task_index
+    task_count = settings.CLOUD_RUN_TASK_COUNT if task_count is None else task_count
+    backend = get_job_backend()
+    job = backend.get_job(job_id)
+    if job is None or job.get("array") is None:
+        raise ValueError(f"Array job {job_id} not found")
+    instances = json.loads(load_payload(job, "parameters") or "[]")
+    indexes = get_shard_indexes(len(instances), task_index, task_count)
+    logger.info("Running %s of %s child jobs of array job %s, task %s of %s", len(indexes), len(instances), job_id, task_index, task_count)
+    if job.get("status") == JobStatus.CANCELLED:
+        logger.info("Array job %s was cancelled before it started, skipping it", job_id)
+        return
+    backend.update_job(job_id, _start_array(resume))
+    # The running child only watches its own job, the cancellation of the array job is forwarded
+    current_child: list[JobIDType | None] = [None]
+    current_lock = threading.Lock()
+
+    def cancel_current_child() -> None:
+        with current_lock:
+            child_id = current_child[0]
+        if child_id is None:
+            return
+        try:
+            request_cancel(backend, child_id)
+        except Exception:
+            logger.exception("Failed to request the cancellation of child job %s", child_id)
+
+    cancellation = JobCancellation(job_id, on_cancel=cancel_current_child)
+    cancellation.watch(backend, settings.CANCEL_POLL_INTERVAL)
+
+    stop_heartbeat = _beat(backend, job_id, settings.HEARTBEAT_INTERVAL)
+
+    counts = JobArrayCounts()
+    running: list[JobIDType] = []
+    last_count = time.monotonic()
+    for index in indexes:
+        if cancellation.cancelled:
+            logger.warning("Array job %s cancelled, skipping its remaining child jobs", job_id)
+            break
+        child_id = get_child_job_id(job_id, index)
+        child = backend.get_job(child_id)
+        previous = child.get("status") if child is not None else None
+        if previous in (JobStatus.COMPLETED, JobStatus.CANCELLED) or (previous == JobStatus.FAILED and not resume):
+            _count_child(counts, previous)
+            continue
+        if previous == JobStatus.RUNNING:
+            logger.warning("Child job %s is running, skipping it", child_id)
+            running.append(child_id)
+            continue
+        if child is None:
+            backend.create_job(child_id, {
+                **CreateJob(
+                    task_id=job["task_id"],
+                    **dump_payload(child_id, "parameters", json.dumps(instances[index])),
+                ).model_dump(),
+                "user_id": job.get("user_id"),
+                "parent_id": job_id,
+            })
+        with current_lock:
+            current_child[0] = child_id
+        if cancellation.cancelled:
+            # Cancelled while the child was prepared, the watcher may not have seen it
+            request_cancel(backend, child_id)
+            _count_child(counts, (backend.get_job(child_id) or {}).get("status"))
+            break
+        try:
+            parameters = parameters_model.model_validate(instances[index])
+            run_task_pipeline(task_pipeline, child_id, parameters, resume=previous == JobStatus.FAILED)
+        except Exception as e:
+            # The child could not start, the task writes the status of the children that ran
+            logger.exception("Child job %s could not run", child_id)
+            _fail_child(backend, child_id, e)
+        with current_lock:
+            current_child[0] = None
+        _count_child(counts, (backend.get_job(child_id) or {}).get("status"))
+        if time.monotonic() - last_count >= settings.STATUS_WRITE_INTERVAL:
+            set_shard_counts(backend, job_id, task_index, counts.model_copy())
+            last_count = time.monotonic()
+    cancellation.stop()
+    stop_heartbeat()
+    # The running children may have been failed by `tasks-reap` since
+    for child_id in running:
+        status = (backend.get_job(child_id) or {}).get("status")
+        if status in (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED):
+            _count_child(counts, status)
+    # Always counted, the array job may end with the resumed children of this shard
+    set_shard_counts(backend, job_id, task_index, counts)
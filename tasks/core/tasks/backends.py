@@ -0,0 +1,471 @@
+import copy
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Any, Callable
+
+from tasks.models import JobStatus, JobProgressEvent, JobPartialChunk
+from tasks.utils import get_logger
+
+if TYPE_CHECKING:
+    from google.cloud.firestore import Client
+
+TASKS_COLLECTION = "tasks"
+JOBS_COLLECTION = "jobs"
+STEPS_COLLECTION = "steps"
+PARTIALS_COLLECTION = "partials"
+
+logger = get_logger(__name__)
+
+# Firestore limit of writes in a single batch
+MAX_BATCH_WRITES = 500
+# Stay under the Firestore limit of 10 MiB per request
+MAX_BATCH_BYTES = 8 * 1024 * 1024
+
+
+class JobBackend(ABC):
+    """
+    Storage of the tasks and the state of their jobs. A job is a document of fields, as written by
+    `create_job` and updated by `write_job`, with an append-only list of step events ordered by their
+    sequence number, and an append-only list of chunks of partial results.
+    """
+
+    @abstractmethod
+    def create_task(self, task_id: str, task: dict[str, Any]) -> None:
+        """Create or replace the registration of a task."""
+
+    @abstractmethod
+    def get_job(self, job_id: str) -> dict[str, Any] | None:
+        """Get the fields of a job, or `None` if it does not exist."""
+
+    @abstractmethod
+    def create_job(self, job_id: str, job: dict[str, Any]) -> None:
+        """Create or replace a job."""
+
+    @abstractmethod
+    def write_job(self, job_id: str, fields: dict[str, Any], events: list[JobProgressEvent], chunks: list[JobPartialChunk] | None = None) -> None:
+        """Append step events and chunks of partial results to an existing job and update its
+        fields. Writing an event or a chunk again with the same sequence number replaces it, so a
+        failed write can be retried."""
+
+    @abstractmethod
+    def get_stale_jobs(self, heartbeat_before: str) -> list[str]:
+        """Get the IDs of the running jobs whose last heartbeat is older than `heartbeat_before`, an
+        ISO timestamp."""
+
+    @abstractmethod
+    def fail_stale_job(self, job_id: str, heartbeat_before: str, fields: dict[str, Any]) -> bool:
+        """Update the fields of a job only if it is still running with a heartbeat older than
+        `heartbeat_before`, atomically. Returns if the job was updated."""
+
+    @abstractmethod
+    def update_job(self, job_id: str, update: Callable[[dict[str, Any]], dict[str, Any] | None]) -> dict[str, Any] | None:
+        """Read the fields of an existing job and update it with the fields returned by `update`,
+        atomically. `update` may be called more than once when the job is updated concurrently, and
+        returns `None` to leave the job unchanged. Returns the updated fields."""
+
+    @abstractmethod
+    def get_job_events(self, job_id: str, after: int = -1) -> list[JobProgressEvent]:
+        """Get the step events of a job with a sequence number greater than `after`, in order."""
+
+    @abstractmethod
+    def get_job_partials(self, job_id: str, offset: int = 0) -> list[JobPartialChunk]:
+        """Get the chunks of partial results of a job ending after `offset`, in order."""
+
+    def watch_job(self, job_id: str, on_change: Callable[[dict[str, Any]], None], interval: float) -> Callable[[], None]:
+        """Call `on_change` with the fields of a job when they may have changed, from another thread,
+        until the returned function is called. The job is read every `interval` seconds, backends
+        with change notifications override it."""
+        stopped = threading.Event()
+
+        def poll() -> None:
+            while not stopped.wait(interval):
+                try:
+                    job = self.get_job(job_id)
+                except Exception:
+                    logger.exception("Failed to read job %s", job_id)
+                    continue
+                if job is not None:
+                    on_change(job)
+
+        threading.Thread(target=poll, name=f"job-watch-{job_id}", daemon=True).start()
+        return stopped.set
+
+
+def _is_stale(job: dict[str, Any], heartbeat_before: str) -> bool:
+    """Check if a job is running with a heartbeat older than `heartbeat_before`."""
+    heartbeat_at = job.get("heartbeat_at")
+    return job.get("status") == JobStatus.RUNNING and heartbeat_at is not None and heartbeat_at < heartbeat_before
+
+
+class FirestoreJobBackend(JobBackend):
+    """
+    Job backend storing the tasks and jobs in Firestore, the job step events in the `steps`
+    subcollection of the job document and the chunks of partial results in its `partials`
+    subcollection.
+
+    Parameters:
+    -----------
+    client: Client
+        Firestore client.
+    """
+
+    def __init__(self, client: "Client") -> None:
+        self.client = client
+
+    def create_task(self, task_id: str, task: dict[str, Any]) -> None:
+        self.client.collection(TASKS_COLLECTION).document(task_id).set(task)
+
+    def get_job(self, job_id: str) -> dict[str, Any] | None:
+        job_doc = self.client.collection(JOBS_COLLECTION).document(job_id).get()
+        if not job_doc.exists:
+            return None
+        return job_doc.to_dict()
+
+    def create_job(self, job_id: str, job: dict[str, Any]) -> None:
+        """Delete the step events and partial results of a previous run of the job, the job
+        document is replaced in the last batch."""
+        job_ref = self.client.collection(JOBS_COLLECTION).document(job_id)
+        refs = [
+            *job_ref.collection(STEPS_COLLECTION).list_documents(),
+            *job_ref.collection(PARTIALS_COLLECTION).list_documents(),
+        ]
+        # Leave room for the job document in the last batch
+        batches = [refs[i:i + MAX_BATCH_WRITES - 1] for i in range(0, len(refs), MAX_BATCH_WRITES - 1)] or [[]]
+        for index, batch_refs in enumerate(batches):
+            batch = self.client.batch()
+            for ref in batch_refs:
+                batch.delete(ref)
+            if index == len(batches) - 1:
+                batch.set(job_ref, job)
+            batch.commit()
+
+    def write_job(self, job_id: str, fields: dict[str, Any], events: list[JobProgressEvent], chunks: list[JobPartialChunk] | None = None) -> None:
+        """Write the events, chunks and fields in as few batches as possible, the job document is
+        updated in the last batch."""
+        job_ref = self.client.collection(JOBS_COLLECTION).document(job_id)
+        steps_ref = job_ref.collection(STEPS_COLLECTION)
+        partials_ref = job_ref.collection(PARTIALS_COLLECTION)
+        # Documents to write with their approximate size, events are small
+        writes = [(steps_ref.document(f"{event.seq:010d}"), event.model_dump(), 0) for event in events]
+        writes += [
+            (partials_ref.document(f"{chunk.seq:010d}"), chunk.model_dump(), len(chunk.model_dump_json()))
+            for chunk in chunks or []
+        ]
+        # Leave room for the job document update in the last batch
+        batches: list[list] = [[]]
+        batch_bytes = 0
+        for write in writes:
+            if len(batches[-1]) >= MAX_BATCH_WRITES - 1 or (batches[-1] and batch_bytes + write[2] > MAX_BATCH_BYTES):
+                batches.append([])
+                batch_bytes = 0
+            batches[-1].append(write)
+            batch_bytes += write[2]
+        for index, batch_writes in enumerate(batches):
+            batch = self.client.batch()
+            for ref, data, _ in batch_writes:
+                batch.set(ref, data)
+            if index == len(batches) - 1 and fields:
+                batch.update(job_ref, fields)
+            batch.commit()
+
+    def get_stale_jobs(self, heartbeat_before: str) -> list[str]:
+        """Needs the composite index on `status` and `heartbeat_at` of the jobs collection, created
+        by the Terraform infrastructure."""
+        from google.cloud.firestore import FieldFilter
+
+        query = (
+            self.client.collection(JOBS_COLLECTION)
+            .where(filter=FieldFilter("status", "==", JobStatus.RUNNING.value))
+            .where(filter=FieldFilter("heartbeat_at", "<", heartbeat_before))
+            .select(["heartbeat_at"])
+        )
+        return [doc.id for doc in query.stream()]
+
+    def fail_stale_job(self, job_id: str, heartbeat_before: str, fields: dict[str, Any]) -> bool:
+        from google.cloud.firestore import transactional
+
+        job_ref = self.client.collection(JOBS_COLLECTION).document(job_id)
+
+        @transactional
+        def update(transaction) -> bool:
+            job_doc = job_ref.get(field_paths=["status", "heartbeat_at"], transaction=transaction)
+            if not job_doc.exists or not _is_stale(job_doc.to_dict() or {}, heartbeat_before):
+                return False
+            transaction.update(job_ref, fields)
+            return True
+
+        return update(self.client.transaction())
+
+    def update_job(self, job_id: str, update: Callable[[dict[str, Any]], dict[str, Any] | None]) -> dict[str, Any] | None:
+        from google.cloud.firestore import transactional
+
+        job_ref = self.client.collection(JOBS_COLLECTION).document(job_id)
+
+        @transactional
+        def run(transaction) -> dict[str, Any] | None:
+            job_doc = job_ref.get(transaction=transaction)
+            if not job_doc.exists:
+                raise ValueError(f"Job {job_id} not found")
+            fields = update(job_doc.to_dict() or {})
+            if fields:
+                transaction.update(job_ref, fields)
+            return fields
+
+        return run(self.client.transaction())
+
+    def watch_job(self, job_id: str, on_change: Callable[[dict[str, Any]], None], interval: float) -> Callable[[], None]:
+        """Listen to the snapshots of the job document instead of reading it."""
+        job_ref = self.client.collection(JOBS_COLLECTION).document(job_id)
+
+        def on_snapshot(snapshots, changes, read_time) -> None:
+            for snapshot in snapshots:
+                if snapshot.exists:
+                    on_change(snapshot.to_dict() or {})
+
+        watch = job_ref.on_snapshot(on_snapshot)
+        return watch.unsubscribe
+
+    def get_job_events(self, job_id: str, after: int = -1) -> list[JobProgressEvent]:
+        from google.cloud.firestore import FieldFilter
+
+        steps_ref = self.client.collection(JOBS_COLLECTION).document(job_id).collection(STEPS_COLLECTION)
+        query = steps_ref.where(filter=FieldFilter("seq", ">", after)).order_by("seq")
+        return [JobProgressEvent.model_validate(doc.to_dict()) for doc in query.stream()]
+
+    def get_job_partials(self, job_id: str, offset: int = 0) -> list[JobPartialChunk]:
+        from google.cloud.firestore import FieldFilter
+
+        partials_ref = self.client.collection(JOBS_COLLECTION).document(job_id).collection(PARTIALS_COLLECTION)
+        query = partials_ref.where(filter=FieldFilter("end", ">", offset)).order_by("end")
+        return [JobPartialChunk.model_validate(doc.to_dict()) for doc in query.stream()]
+
+
+class InMemoryJobBackend(JobBackend):
+    """Job backend living in the process, for tests, benchmarks and the worker with an in-memory
+    queue. Nothing is persisted."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._tasks: dict[str, dict[str, Any]] = {}
+        self._jobs: dict[str, dict[str, Any]] = {}
+        self._events: dict[str, dict[int, JobProgressEvent]] = {}
+        self._partials: dict[str, dict[int, JobPartialChunk]] = {}
+
+    def create_task(self, task_id: str, task: dict[str, Any]) -> None:
+        with self._lock:
+            self._tasks[task_id] = copy.deepcopy(task)
+
+    def get_job(self, job_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return copy.deepcopy(job) if job is not None else None
+
+    def create_job(self, job_id: str, job: dict[str, Any]) -> None:
+        with self._lock:
+            self._jobs[job_id] = copy.deepcopy(job)
+            self._events[job_id] = {}
+            self._partials[job_id] = {}
+
+    def write_job(self, job_id: str, fields: dict[str, Any], events: list[JobProgressEvent], chunks: list[JobPartialChunk] | None = None) -> None:
+        with self._lock:
+            if job_id not in self._jobs:
+                raise ValueError(f"Job {job_id} not found")
+            self._events[job_id].update((event.seq, event) for event in events)
+            self._partials[job_id].update((chunk.seq, chunk) for chunk in chunks or [])
+            self._jobs[job_id].update(copy.deepcopy(fields))
+
+    def get_stale_jobs(self, heartbeat_before: str) -> list[str]:
+        with self._lock:
+            return [job_id for job_id, job in self._jobs.items() if _is_stale(job, heartbeat_before)]
+
+    def fail_stale_job(self, job_id: str, heartbeat_before: str, fields: dict[str, Any]) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or not _is_stale(job, heartbeat_before):
+                return False
+            job.update(copy.deepcopy(fields))
+            return True
+
+    def update_job(self, job_id: str, update: Callable[[dict[str, Any]], dict[str, Any] | None]) -> dict[str, Any] | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                raise ValueError(f"Job {job_id} not found")
+            fields = update(copy.deepcopy(job))
+            if fields:
+                job.update(copy.deepcopy(fields))
+            return fields
+
+    def get_job_events(self, job_id: str, after: int = -1) -> list[JobProgressEvent]:
+        with self._lock:
+            events = self._events.get(job_id, {})
+            return [events[seq] for seq in sorted(events) if seq > after]
+
+    def get_job_partials(self, job_id: str, offset: int = 0) -> list[JobPartialChunk]:
+        with self._lock:
+            chunks = self._partials.get(job_id, {})
+            return [chunks[seq] for seq in sorted(chunks) if chunks[seq].end > offset]
+
+
+class SQLiteJobBackend(JobBackend):
+    """
+    Job backend storing the tasks and jobs as JSON documents in a SQLite database, shared by the
+    processes of the same machine.
+
+    Parameters:
+    -----------
+    path: str
+        Path to the database file.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS tasks (id TEXT PRIMARY KEY, document TEXT NOT NULL)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, document TEXT NOT NULL)")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS job_events (
+                job_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                document TEXT NOT NULL,
+                PRIMARY KEY (job_id, seq)
+            )
+            """
+        )
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS job_partials (
+                job_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                end_offset INTEGER NOT NULL,
+                document TEXT NOT NULL,
+                PRIMARY KEY (job_id, seq)
+            )
+            """
+        )
+
+    def create_task(self, task_id: str, task: dict[str, Any]) -> None:
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO tasks (id, document) VALUES (?, ?)",
+                (task_id, json.dumps(task)),
+            )
+
+    def get_job(self, job_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            row = self._connection.execute("SELECT document FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def create_job(self, job_id: str, job: dict[str, Any]) -> None:
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO jobs (id, document) VALUES (?, ?)",
+                    (job_id, json.dumps(job)),
+                )
+                self._connection.execute("DELETE FROM job_events WHERE job_id = ?", (job_id,))
+                self._connection.execute("DELETE FROM job_partials WHERE job_id = ?", (job_id,))
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def write_job(self, job_id: str, fields: dict[str, Any], events: list[JobProgressEvent], chunks: list[JobPartialChunk] | None = None) -> None:
+        with self._lock:
+            # Reserve the write lock first, other processes may update the same job
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._connection.execute("SELECT document FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                if row is None:
+                    raise ValueError(f"Job {job_id} not found")
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO job_events (job_id, seq, document) VALUES (?, ?, ?)",
+                    [(job_id, event.seq, event.model_dump_json()) for event in events],
+                )
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO job_partials (job_id, seq, end_offset, document) VALUES (?, ?, ?, ?)",
+                    [(job_id, chunk.seq, chunk.end, chunk.model_dump_json()) for chunk in chunks or []],
+                )
+                if fields:
+                    job = {**json.loads(row[0]), **fields}
+                    self._connection.execute(
+                        "UPDATE jobs SET document = ? WHERE id = ?",
+                        (json.dumps(job), job_id),
+                    )
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def get_stale_jobs(self, heartbeat_before: str) -> list[str]:
+        with self._lock:
+            rows = self._connection.execute(
+                """
+                SELECT id FROM jobs
+                WHERE json_extract(document, '$.status') = ? AND json_extract(document, '$.heartbeat_at') < ?
+                """,
+                (JobStatus.RUNNING.value, heartbeat_before),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def fail_stale_job(self, job_id: str, heartbeat_before: str, fields: dict[str, Any]) -> bool:
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._connection.execute("SELECT document FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                job = json.loads(row[0]) if row is not None else None
+                if job is None or not _is_stale(job, heartbeat_before):
+                    self._connection.execute("ROLLBACK")
+                    return False
+                self._connection.execute(
+                    "UPDATE jobs SET document = ? WHERE id = ?",
+                    (json.dumps({**job, **fields}), job_id),
+                )
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+            return True
+
+    def update_job(self, job_id: str, update: Callable[[dict[str, Any]], dict[str, Any] | None]) -> dict[str, Any] | None:
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._connection.execute("SELECT document FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                if row is None:
+                    raise ValueError(f"Job {job_id} not found")
+                job = json.loads(row[0])
+                fields = update(job)
+                if fields:
+                    self._connection.execute(
+                        "UPDATE jobs SET document = ? WHERE id = ?",
+                        (json.dumps({**job, **fields}), job_id),
+                    )
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+            return fields
+
+    def get_job_events(self, job_id: str, after: int = -1) -> list[JobProgressEvent]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT document FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after),
+            ).fetchall()
+        return [JobProgressEvent.model_validate_json(row[0]) for row in rows]
+
+    def get_job_partials(self, job_id: str, offset: int = 0) -> list[JobPartialChunk]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT document FROM job_partials WHERE job_id = ? AND end_offset > ? ORDER BY seq",
+                (job_id, offset),
+            ).fetchall()
+        return [JobPartialChunk.model_validate_json(row[0]) for row in rows]
@@ -0,0 +1,112 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+from tasks.types import BatchTaskType
+from tasks.utils import get_logger
+
+logger = get_logger(__name__)
+
+
+def batched(max_batch_size: int = 8, max_wait: float = 0.01) -> Callable[[BatchTaskType], BatchTaskType]:
+    """
+    Decorator to declare the batched function of a task, served as `batch_task` by the task module.
+    It takes a list of parameters and returns the list of results in the same order.
+
+    Parameters:
+    -----------
+    max_batch_size: int
+        Maximum number of instances in a batch.
+    max_wait: float
+        Maximum number of seconds to wait for a batch to fill after its first instance.
+    """
+    def decorator(batch_func: BatchTaskType) -> BatchTaskType:
+        batch_func.max_batch_size = max_batch_size  # type: ignore
+        batch_func.max_wait = max_wait  # type: ignore
+        return batch_func
+    return decorator
+
+
+class MicroBatcher:
+    """
+    Collect items submitted concurrently into batches, up to `max_batch_size` items or `max_wait`
+    seconds after the first item, call `batch_func` once per batch and scatter the results back to
+    the submitters. Up to `max_concurrency` batches run at the same time, and the next batch is
+    collected while they run.
+
+    Parameters:
+    -----------
+    batch_func: Callable[[list], Awaitable[list]]
+        Coroutine function taking a batch of items and returning their results in the same order.
+    max_batch_size: int
+        Maximum number of items in a batch.
+    max_wait: float
+        Maximum number of seconds to wait for a batch to fill after its first item.
+    max_concurrency: int
+        Maximum number of batches running at the same time.
+    """
+
+    def __init__(self, batch_func: Callable[[list], Awaitable[list]], max_batch_size: int, max_wait: float, max_concurrency: int = 1) -> None:
+        if max_batch_size < 1:
+            raise ValueError(f"Invalid max batch size: {max_batch_size}")
+        if max_concurrency < 1:
+            raise ValueError(f"Invalid max concurrency: {max_concurrency}")
+        self.batch_func = batch_func
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_concurrency = max_concurrency
+        self._queue: asyncio.Queue[tuple[Any, asyncio.Future]] | None = None
+        self._worker: asyncio.Task | None = None
+        # Running batches, referenced until done
+        self._batches: set[asyncio.Task] = set()
+
+    async def submit(self, item: Any) -> Any:
+        """Submit an item and wait for its result."""
+        if self._worker is None or self._worker.done():
+            # Started lazily to bind to the running event loop
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        assert self._queue is not None
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self) -> list[tuple[Any, asyncio.Future]]:
+        assert self._queue is not None
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        slots = asyncio.Semaphore(self.max_concurrency)
+        while True:
+            batch = await self._collect()
+            await slots.acquire()
+            task = asyncio.create_task(self._run_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+    async def _run_batch(self, batch: list[tuple[Any, asyncio.Future]]) -> None:
+        items = [item for item, _ in batch]
+        logger.debug("Running batch of %d items", len(items))
+        try:
+            results = await self.batch_func(items)
+            if len(results) != len(items):
+                raise ValueError(f"Batch function returned {len(results)} results for {len(items)} items")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
@@ -0,0 +1,78 @@
+import threading
+from typing import Any, Callable
+
+from tasks.backends import JobBackend
+from tasks.models import JobStatus, get_timestamp
+from tasks.types import JobCancelled
+from tasks.utils import get_logger
+
+logger = get_logger(__name__)
+
+
+class JobCancellation:
+    """
+    Cancellation flag of a job, set once its `cancel_requested_at` field is written or it is
+    cancelled. The job is watched in the background, so checking the flag never reads the backend.
+
+    Parameters:
+    -----------
+    job_id: str
+        ID of the job.
+    on_cancel: Callable[[], None] | None
+        Function called once, from the watching thread, after the flag is set.
+    """
+
+    def __init__(self, job_id: str, on_cancel: Callable[[], None] | None = None) -> None:
+        self.job_id = job_id
+        self.on_cancel = on_cancel
+        self._cancelled = threading.Event()
+        self._unwatch: Callable[[], None] | None = None
+
+    @property
+    def cancelled(self) -> bool:
+        """If the cancellation of the job was requested."""
+        return self._cancelled.is_set()
+
+    def check(self) -> None:
+        """Raise `JobCancelled` if the cancellation of the job was requested."""
+        if self._cancelled.is_set():
+            raise JobCancelled(f"Job {self.job_id} was cancelled")
+
+    def watch(self, backend: JobBackend, interval: float) -> None:
+        """Start watching the job, reading it every `interval` seconds on the backends without change
+        notifications."""
+        if self._unwatch is None:
+            self._unwatch = backend.watch_job(self.job_id, self._on_change, interval)
+
+    def stop(self) -> None:
+        """Stop watching the job."""
+        if self._unwatch is not None:
+            self._unwatch()
+            self._unwatch = None
+
+    def _on_change(self, job: dict[str, Any]) -> None:
+        if self._cancelled.is_set():
+            return
+        if job.get("cancel_requested_at") is not None or job.get("status") == JobStatus.CANCELLED:
+            logger.warning("Cancellation of job %s requested", self.job_id)
+            self._cancelled.set()
+            if self.on_cancel is not None:
+                self.on_cancel()
+
+
+def _cancel(job: dict[str, Any]) -> dict[str, Any] | None:
+    if job.get("status") in (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED):
+        return None
+    now = get_timestamp()
+    fields: dict[str, Any] = {"cancel_requested_at": job.get("cancel_requested_at") or now}
+    if job.get("status") != JobStatus.RUNNING:
+        # Nothing runs the job yet, it is skipped when it starts
+        fields.update(status=JobStatus.CANCELLED, completed_at=now)
+    return fields
+
+
+def request_cancel(backend: JobBackend, job_id: str) -> None:
+    """Request the cancellation of a job, atomically, like the API does. A job not started yet is
+    cancelled right away, a running job gets `cancel_requested_at` and ends in the "cancelled"
+    status once its runtime sees it. Ended jobs are left as is."""
+    backend.update_job(job_id, _cancel)
@@ -0,0 +1,53 @@
+import hashlib
+import pickle
+from typing import Any
+
+from tasks.storage import BlobStore
+from tasks.utils import get_logger
+
+logger = get_logger(__name__)
+
+CHECKPOINTS_PREFIX = "checkpoints"
+
+
+class Checkpoints:
+    """
+    Step output checkpoints of a job. Results are pickled and stored in a blob store, keyed by the
+    step and a hash of its pickled inputs, so a resumed job skips the steps it already completed
+    with the same inputs.
+
+    Parameters:
+    -----------
+    store: BlobStore
+        Blob store for the pickled step results.
+    job_id: str
+        The job ID, checkpoints are scoped to a job.
+    """
+
+    def __init__(self, store: BlobStore, job_id: str) -> None:
+        self.store = store
+        self.job_id = job_id
+
+    def key(self, step_id: str, args: tuple, kwargs: dict) -> str | None:
+        """Get the checkpoint key of a step call, or `None` if its inputs can not be hashed."""
+        try:
+            inputs = pickle.dumps((args, sorted(kwargs.items())), protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.warning("Inputs of step %s can not be pickled, skipping checkpoint: %s", step_id, e)
+            return None
+        digest = hashlib.sha256(inputs).hexdigest()
+        return f"{CHECKPOINTS_PREFIX}/{self.job_id}/{step_id}/{digest}.pkl"
+
+    def load(self, key: str) -> tuple[bool, Any]:
+        """Load a checkpoint, returns if it was found and the step result."""
+        data = self.store.get(key)
+        if data is None:
+            return False, None
+        return True, pickle.loads(data)
+
+    def save(self, key: str, result: Any) -> None:
+        """Save the result of a step. Failures are logged, a checkpoint never fails a step."""
+        try:
+            self.store.put(key, pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception as e:
+            logger.warning("Failed to save checkpoint %s: %s", key, e)
@@ -11,16 +11,67 @@ class Settings(BaseSettings):
 
     FIRESTORE_EMULATOR_HOST: str | None = None
 
+    # Job state backend, `firestore`, `memory` (in-process) or `sqlite://<path>`
+    JOBS_BACKEND: str = "firestore"
+
     # Task info
     TASK_PROJECT_ID: str | None = None
     TASK_REGION: str | None = None
     TASK_JOB_NAME: str | None = None
 
+    # Parameters of `tasks-run --parameters_from env`, in JSON format
+    TASK_PARAMETERS: str | None = None
+
+    # Array jobs, index and number of the task instances of the job execution, set by Cloud Run
+    CLOUD_RUN_TASK_INDEX: int = 0
+    CLOUD_RUN_TASK_COUNT: int = 1
+
+    # Job status writer, minimum seconds between two writes of the job document (0 writes through)
+    STATUS_WRITE_INTERVAL: float = 1.0
+
+    # Heartbeats of running jobs, seconds between two heartbeats (0 disables them), and seconds
+    # without heartbeat after which `tasks-reap` marks a running job as failed
+    HEARTBEAT_INTERVAL: float = 30.0
+    STALE_JOB_TIMEOUT: float = 300.0
+
+    # Cancellation of running jobs, seconds between two reads of the job by the backends that can not
+    # watch it (Firestore listens to its changes)
+    CANCEL_POLL_INTERVAL: float = 2.0
+
+    # Partial results of generator steps are written in chunks of at most this size, in JSON bytes
+    PARTIALS_CHUNK_SIZE: int = 256 * 1024
+
+    # Step checkpoints, local directory or URI of the blob store (disabled when not set)
+    CHECKPOINT_STORE: str | None = None
+
+    # Job payloads (parameters and results) larger than `PAYLOAD_INLINE_LIMIT` bytes are compressed
+    # with `PAYLOAD_COMPRESSION` (`gzip` or `zstd`) and stored in `PAYLOAD_STORE` (a local directory
+    # or URI of the blob store). Without a store, they are always stored inline.
+    PAYLOAD_STORE: str | None = None
+    PAYLOAD_INLINE_LIMIT: int = 64 * 1024
+    PAYLOAD_COMPRESSION: str = "gzip"
+
+    # Step metrics, also measure the peak GPU memory allocated by torch
+    STEP_GPU_METRICS: bool = False
+
+    # Worker settings, the queue is `memory` or `sqlite://<path>`
+    WORKER_QUEUE: str = "sqlite:///tmp/tasks-queue.db"
+    WORKER_CONCURRENCY: int = 1
+    WORKER_POLL_INTERVAL: float = 1.0
+    # Seconds after which a job claimed by a worker and never acknowledged, e.g. by a killed worker,
+    # is given back to the queue. A job still running then is not run twice, its status is not "created"
+    WORKER_CLAIM_TIMEOUT: float | None = 3600.0
+
     # Default server settings
     SERVER_HOST: str = "0.0.0.0"
     SERVER_PORT: int = 5000
     SERVER_LOG_LEVEL: str = "info"
     SERVER_HEALTH_ENDPOINT: str = "/health"
     SERVER_PREDICT_ENDPOINT: str = "/predict"
+    SERVER_MAX_CONCURRENCY: int = 8  # Maximum number of instances running at the same time
+    SERVER_RESOURCE_RETRY_INTERVAL: float = 30.0  # Seconds between two loads of the failed eager resources
+    # Micro-batching of the task `batch_task`, overrides the values of its `@batched` decorator
+    SERVER_MAX_BATCH_SIZE: int | None = None
+    SERVER_MAX_BATCH_WAIT: float | None = None
 
 settings = Settings()
\ No newline at end of file
@@ -1,65 +1,114 @@
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
 from dataclasses import dataclass
-from typing import TypeVar
+from typing import TYPE_CHECKING, Iterator, TypeVar
 
-from google.cloud.firestore import Client
 from pydantic import BaseModel
 
-from tasks.types import BaseParameters
+from tasks.backends import (
+    JobBackend,
+    FirestoreJobBackend,
+    InMemoryJobBackend,
+    SQLiteJobBackend,
+    TASKS_COLLECTION,  # noqa: F401
+    JOBS_COLLECTION,  # noqa: F401
+)
+from tasks.types import BaseParameters, JobCancelled
 from tasks.config import settings
+from tasks.cancellation import JobCancellation
+from tasks.checkpoint import Checkpoints
 from tasks.models import (
+    JobError,
     JobStatus,
+    JobProgress,
     CreateJob,
-    StartJob,
-    FailJob,
-    FinishJob,
-    StartJobStep,
-    FailJobStep,
-    FinishJobStep,
+    get_timestamp,
 )
-from tasks.utils import get_logger
+from tasks.payloads import dump_payload
+from tasks.resources import Resource
+from tasks.storage import get_blob_store
+from tasks.utils import get_logger, log_fields
+from tasks.writer import JobStatusWriter
 
-T = TypeVar("T", bound=BaseModel)
+if TYPE_CHECKING:
+    from google.cloud.firestore import Client
 
-TASKS_COLLECTION = "tasks"
-JOBS_COLLECTION = "jobs"
+T = TypeVar("T", bound=BaseModel)
 
 logger = get_logger(__name__)
 
 
 @dataclass(frozen=True)
 class _Context:
-    """Context for the task execution, with the job ID and the Firestore client."""
+    """Context for the task execution, with the job ID, the job backend and the job status
+    writer."""
     job_id: str
     task_id: str
     parameters: BaseParameters
-    db: Client
+    backend: JobBackend
+    writer: JobStatusWriter
+    resume: bool = False
+    checkpoints: Checkpoints | None = None
+    cancellation: JobCancellation | None = None
+
 
+# The context of the running job. Each thread and asyncio task has its own value, so one process
+# can run many jobs concurrently.
+_current_context: ContextVar[_Context | None] = ContextVar("tasks_context", default=None)
 
-def setup_context(job_id: str, task_id: str, parameters: BaseParameters) -> _Context:
-    """Setup the context for the task execution, with the job ID and the Firestore client."""
+
+def setup_context(job_id: str, task_id: str, parameters: BaseParameters, resume: bool = False) -> _Context:
+    """Setup the context for the task execution, with the job ID and the job backend. Step
+    checkpoints are enabled when `CHECKPOINT_STORE` is set. Use it with `use_context`."""
+    backend = get_job_backend()
+    checkpoints = None
+    if settings.CHECKPOINT_STORE:
+        checkpoints = Checkpoints(get_blob_store(settings.CHECKPOINT_STORE), job_id)
     ctx = _Context(
         job_id=job_id,
         task_id=task_id,
         parameters=parameters.model_copy(),
-        db=get_firestore_client(),
+        backend=backend,
+        writer=JobStatusWriter(
+            backend,
+            job_id,
+            interval=settings.STATUS_WRITE_INTERVAL,
+            partials_chunk_size=settings.PARTIALS_CHUNK_SIZE,
+            heartbeat_interval=settings.HEARTBEAT_INTERVAL,
+        ),
+        resume=resume,
+        checkpoints=checkpoints,
+        cancellation=JobCancellation(job_id),
     )
-    return _get_context(ctx)
+    return ctx
 
 
-def _get_context(ctx: _Context | None = None) -> _Context:
-    if ctx is not None:
-        _get_context.ctx = ctx
-    elif not hasattr(_get_context, "ctx") or _get_context.ctx is None:
-        raise RuntimeError("Context not set")
-    return _get_context.ctx
+@contextmanager
+def use_context(ctx: _Context) -> Iterator[_Context]:
+    """Set the context of the task execution for the current thread or asyncio task, and restore
+    the previous one on exit. New threads do not inherit it, run them with
+    `contextvars.copy_context().run`. Log records get the job and task IDs meanwhile."""
+    token = _current_context.set(ctx)
+    try:
+        with log_fields(job_id=ctx.job_id, task_id=ctx.task_id):
+            yield ctx
+    finally:
+        _current_context.reset(token)
 
 
 def get_context() -> _Context:
     """Get the context for the task execution."""
-    return _get_context()
+    ctx = _current_context.get()
+    if ctx is None:
+        raise RuntimeError("Context not set")
+    return ctx
+
 
+def _create_firestore_client() -> "Client":
+    # Imported on first use, the client library takes a large part of the startup time
+    from google.cloud.firestore import Client
 
-def get_firestore_client() -> Client:
     if settings.FIRESTORE_EMULATOR_HOST:
         logger.info("Using Firestore emulator")
         client = Client(
@@ -69,7 +118,7 @@ def get_firestore_client() -> Client:
         )
         client._emulator_host = settings.FIRESTORE_EMULATOR_HOST
     else:
-        logger.info(f"Using Firestore project {settings.FIRESTORE_PROJECT_ID}")
+        logger.info("Using Firestore project %s", settings.FIRESTORE_PROJECT_ID)
         client = Client(
             project=settings.FIRESTORE_PROJECT_ID,
             database=settings.FIRESTORE_DATABASE,
@@ -77,111 +126,112 @@ def get_firestore_client() -> Client:
     return client
 
 
-def create_task(client: Client, task_id: str, task_name: str, task_description: str, parameters_json_schema: str, result_json_schema: str, uri: str) -> None:
-    """Create a task in Firestore."""
-    logger.info(f"Creating task with id: {task_id}")
-    logger.info(f"Task name: {task_name}")
-    logger.info(f"Task description: {task_description}")
-    logger.info(f"Task parameters JSON schema: {parameters_json_schema}")
-    logger.info(f"Task result JSON schema: {result_json_schema}")
-    logger.info(f"Task URI: {uri}")
-    client.collection(TASKS_COLLECTION).document(task_id).set(
+_firestore_client: Resource["Client"] = Resource(_create_firestore_client, "firestore")
+
+
+def get_firestore_client() -> "Client":
+    """Get the Firestore client of the process, created on first use and shared by all the jobs."""
+    return _firestore_client.get()
+
+
+def _create_job_backend() -> JobBackend:
+    uri = settings.JOBS_BACKEND
+    if uri == "firestore":
+        return FirestoreJobBackend(get_firestore_client())
+    if uri == "memory":
+        logger.info("Using in-memory job backend")
+        return InMemoryJobBackend()
+    if uri.startswith("sqlite://"):
+        path = uri.removeprefix("sqlite://")
+        logger.info("Using SQLite job backend %s", path)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return SQLiteJobBackend(path)
+    raise ValueError(f"Unsupported job backend: {uri}")
+
+
+_job_backend: Resource[JobBackend] = Resource(_create_job_backend, "jobs_backend")
+
+
+def get_job_backend() -> JobBackend:
+    """Get the job backend of the process, selected by `JOBS_BACKEND`, created on first use and
+    shared by all the jobs."""
+    return _job_backend.get()
+
+
+def create_task(backend: JobBackend, task_id: str, task_name: str, task_description: str, parameters_json_schema: str, result_json_schema: str, uri: str) -> None:
+    """Create a task in the job backend."""
+    logger.info("Creating task with id: %s", task_id)
+    logger.info("Task name: %s", task_name)
+    logger.info("Task description: %s", task_description)
+    logger.info("Task parameters JSON schema: %s", parameters_json_schema)
+    logger.info("Task result JSON schema: %s", result_json_schema)
+    logger.info("Task URI: %s", uri)
+    backend.create_task(
+        task_id,
         {
             "name": task_name,
             "description": task_description,
             "parameters_json_schema": parameters_json_schema,
             "result_json_schema": result_json_schema,
             "uri": uri,
-        }
+        },
     )
 
 
-def create_or_check_job(client: Client, job_id: str, task_id: str, parameters: BaseParameters) -> bool:
-    """Check if a job with the given ID exists in Firestore, otherwise create it."""
-    job_ref = client.collection(JOBS_COLLECTION).document(job_id)
-    job_doc = job_ref.get()
-    if job_doc.exists:
-        logger.info(f"Job {job_id} already exists")
-        logger.info(f"Job {job_id} status: {job_doc}")
-        curr_status = job_doc.to_dict().get("status", JobStatus.FAILED)
+def create_or_check_job(backend: JobBackend, job_id: str, task_id: str, parameters: BaseParameters, resume: bool = False) -> bool:
+    """Check if a job with the given ID exists in the job backend, otherwise create it. A job can
+    only run from the "created" status, or also from the "failed" status when it is resumed. A job
+    cancelled before it started raises `JobCancelled`, it is skipped."""
+    job = backend.get_job(job_id)
+    if job is not None:
+        curr_status = job.get("status", JobStatus.FAILED)
+        logger.info("Job %s already exists with status %s", job_id, curr_status)
+        if resume and curr_status == JobStatus.FAILED:
+            logger.info("Resuming job %s", job_id)
+            return True
+        if curr_status == JobStatus.CANCELLED:
+            logger.info("Job %s was cancelled before it started, skipping it", job_id)
+            raise JobCancelled(f"Job {job_id} was cancelled before it started")
         if curr_status != JobStatus.CREATED:
-            logger.error(f"Job {job_id} is not in \"created\" status, but in \"{curr_status}\"")
+            logger.error("Job %s is not in \"created\" status, but in \"%s\"", job_id, curr_status)
             raise ValueError(f"Job {job_id} is not in \"created\" status, but in \"{curr_status}\"")
         return True
-    logger.info(f"Creating job {job_id}")
-    job_ref.set(
+    logger.info("Creating job %s", job_id)
+    backend.create_job(
+        job_id,
         CreateJob(
             task_id=task_id,
-            parameters_json_value=parameters.model_dump_json(),
-        ).model_dump()
+            **dump_payload(job_id, "parameters", parameters.model_dump_json()),
+        ).model_dump(),
     )
     exists = False
     return exists
 
 
-def update_job_status(client: Client, job_id: str, job_update: StartJob | FailJob | FinishJob) -> None:
-    """Update the status of a job in Firestore."""
-    logger.debug(f"Updating job {job_id} with {job_update}")
-    job_ref = client.collection(JOBS_COLLECTION).document(job_id)
-    if not job_ref.get().exists:
-        raise ValueError(f"Job {job_id} not found")
-    if isinstance(job_update, StartJob):
-        job_ref.update(
-            {
-                "status": job_update.status,
-                "started_at": job_update.started_at,
-            }
-        )
-    elif isinstance(job_update, FailJob) or isinstance(job_update, FinishJob):
-        job_ref.update(
-            {
-                "status": job_update.status,
-                "completed_at": job_update.completed_at,
-                "result_json_value": job_update.result.model_dump_json() if job_update.result else None,
-                "error_json_value": job_update.error.model_dump_json() if job_update.error else None,
-            }
-        )
-    else:
-        raise ValueError(f"Invalid job update: {job_update}")
+def fail_unstarted_job(job_id: str, e: Exception) -> None:
+    """Mark a job as failed with the error that kept it from starting, only if it is still in the
+    "created" status, a job started by another run is left as is. A job that was never created is
+    only logged."""
+    error = JobError(code=type(e).__name__, message=str(e))
 
+    def update(job: dict) -> dict | None:
+        if job.get("status") != JobStatus.CREATED:
+            return None
+        return {"status": JobStatus.FAILED, "completed_at": get_timestamp(), "error_json_value": error.model_dump_json()}
 
-def update_job_step_status(client: Client, job_id: str, job_step_update: StartJobStep | FailJobStep | FinishJobStep) -> None:
-    """Update the status of a job step in Firestore."""
-    logger.debug(f"Updating job {job_id} step with {job_step_update}")
-    job_ref = client.collection(JOBS_COLLECTION).document(job_id)
-    if not job_ref.get().exists:
-        raise ValueError(f"Job {job_id} not found")
+    try:
+        backend = get_job_backend()
+        if backend.get_job(job_id) is None:
+            logger.warning("Job %s could not start and does not exist: %s", job_id, e)
+            return
+        backend.update_job(job_id, update)
+    except Exception:
+        logger.exception("Job %s could not be marked as failed", job_id)
 
-    if isinstance(job_step_update, StartJobStep):
-        progress = job_ref.get().to_dict().get("progress") or {}
-        steps = progress.get("steps", [])
-        steps.append(
-            {
-                "name": job_step_update.name,
-                "description": job_step_update.description,
-                "status": job_step_update.status,
-                "started_at": job_step_update.started_at,
-            }
-        )
-        job_ref.update(
-            {
-                "progress": {
-                    "steps": steps
-                }
-            }
-        )
-    elif isinstance(job_step_update, FailJobStep) or isinstance(job_step_update, FinishJobStep):
-        steps = job_ref.get().to_dict()["progress"]["steps"]
-        steps[-1].update(
-            {
-                "status": job_step_update.status,
-                "completed_at": job_step_update.completed_at,
-            }
-        )
-        job_ref.update({
-            "progress": {
-                "steps": steps
-            }
-        })
-    else:
-        raise ValueError(f"Invalid job step update: {job_step_update}")
+
+def get_job_progress(backend: JobBackend, job_id: str) -> JobProgress:
+    """Get the progress counters of a job in the job backend."""
+    job = backend.get_job(job_id)
+    if job is None:
+        raise ValueError(f"Job {job_id} not found")
+    return JobProgress.model_validate(job.get("progress") or {})
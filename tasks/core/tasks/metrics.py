@@ -0,0 +1,55 @@
+import resource
+import sys
+import time
+
+from tasks.models import JobStepMetrics
+
+
+def _peak_rss() -> int:
+    """Peak resident set size of the process, in bytes."""
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+def _gpu_torch():
+    """The torch module if it is already imported and CUDA is available, never imports it."""
+    torch = sys.modules.get("torch")
+    if torch is None or not torch.cuda.is_available():
+        return None
+    return torch
+
+
+class StepMeter:
+    """
+    Measure the resources used by a step, from the creation of the meter to `stop`.
+
+    The CPU time is the one of the calling thread, for coroutine steps it also includes the other
+    coroutines running on the event loop meanwhile. The peak RSS delta is how much the peak of the
+    whole process grew during the step.
+
+    Parameters:
+    -----------
+    gpu: bool
+        Also measure the peak GPU memory allocated by torch. It resets the torch peak memory stats,
+        so concurrent steps share the same peak.
+    """
+
+    def __init__(self, gpu: bool = False) -> None:
+        self.torch = _gpu_torch() if gpu else None
+        if self.torch is not None:
+            self.torch.cuda.reset_peak_memory_stats()
+        self.peak_rss = _peak_rss()
+        self.cpu_time = time.thread_time()
+        self.wall_time = time.perf_counter()
+
+    def stop(self) -> JobStepMetrics:
+        """Get the resources used since the creation of the meter."""
+        wall_time = time.perf_counter() - self.wall_time
+        cpu_time = time.thread_time() - self.cpu_time
+        return JobStepMetrics(
+            wall_time=wall_time,
+            cpu_time=cpu_time,
+            peak_rss_delta=_peak_rss() - self.peak_rss,
+            gpu_peak_memory=int(self.torch.cuda.max_memory_allocated()) if self.torch is not None else None,
+        )
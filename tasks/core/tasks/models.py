@@ -61,20 +61,88 @@ class JobStatus(StrEnum):
     RUNNING = "running"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class JobStepMetrics(BaseModel):
+    """Resources used by a step"""
+    wall_time: float = Field(description="The wall time of the step, in seconds")
+    cpu_time: float = Field(description="The CPU time of the thread running the step, in seconds", default=0.0)
+    peak_rss_delta: int = Field(description="The increase of the process peak resident set size during the step, in bytes", default=0)
+    gpu_peak_memory: int | None = Field(description="The peak GPU memory allocated by torch during the step, in bytes", default=None)
+
+
+class JobMetrics(BaseModel):
+    """Resources used by the steps of a job, rolled up from the step metrics"""
+    step_wall_time: float = Field(description="The total wall time of the steps, in seconds", default=0.0)
+    step_cpu_time: float = Field(description="The total CPU time of the steps, in seconds", default=0.0)
+    peak_rss_delta: int = Field(description="The largest peak resident set size increase of a step, in bytes", default=0)
+    gpu_peak_memory: int | None = Field(description="The largest peak GPU memory of a step, in bytes", default=None)
+    slowest_step: int | None = Field(description="The sequence number of the step with the largest wall time", default=None)
+    slowest_step_name: str | None = Field(description="The name of the step with the largest wall time", default=None)
+    slowest_step_wall_time: float = Field(description="The wall time of the slowest step, in seconds", default=0.0)
+
+
+class JobProgressEvent(BaseModel):
+    """An event in the progress of a job, stored in the `steps` subcollection of the job. Events are
+    append-only, the status of a step is given by its latest event."""
+    seq: int = Field(description="The sequence number of the event in the job, starting at 0")
+    step: int = Field(description="The sequence number of the step in the job, starting at 0")
+    name: str = Field(description="The name of the step")
+    description: str = Field(description="The description of the step")
+    status: JobStatus = Field(description="The status of the step after the event")
+    timestamp: str = Field(description="The date of the event, in ISO format")
+    metrics: JobStepMetrics | None = Field(description="The resources used by the step, on its end event", default=None)
+    attempt: int = Field(description="The attempt of the step, starting at 0, retried steps have an event per attempt start and end", default=0)
+    error: str | None = Field(description="The error of a failed attempt", default=None)
+
+
+class JobPartialChunk(BaseModel):
+    """A chunk of partial results of a job, yielded by generator steps and stored in the `partials`
+    subcollection of the job"""
+    seq: int = Field(description="The sequence number of the chunk in the job, starting at 0")
+    offset: int = Field(description="The offset of the first partial result of the chunk in the job")
+    end: int = Field(description="The offset after the last partial result of the chunk")
+    items: list = Field(description="The partial results, in JSON compatible values")
 
 
-class JobProgressStep(BaseModel):
-    """A step in the progress of a job"""
-    name: str
-    description: str
-    started_at: str = Field(description="The start date of the step, in ISO format")
-    completed_at: str = Field(description="The completion date of the step, in ISO format")
-    status: JobStatus = Field(description="The status of the step", default=JobStatus.CREATED)
+class JobProgress(BaseModel):
+    """Progress information for a job, the step events are stored in the `steps` subcollection and
+    the partial results in the `partials` subcollection"""
+    step_count: int = Field(description="The number of started steps", default=0)
+    event_count: int = Field(description="The number of step events", default=0)
+    partial_count: int = Field(description="The number of partial results", default=0)
+    partial_chunk_count: int = Field(description="The number of chunks of partial results", default=0)
 
 
-class JobProgress(BaseModel):
-    """Progress information for a job"""
-    steps: list[JobProgressStep] = Field(description="The detailed steps")
+class JobArrayCounts(BaseModel):
+    """Counts of the ended child jobs of a shard of an array job"""
+    completed: int = Field(description="The number of completed child jobs", default=0)
+    failed: int = Field(description="The number of failed child jobs", default=0)
+    cancelled: int = Field(description="The number of cancelled child jobs", default=0)
+
+
+class JobArray(BaseModel):
+    """Children of an array job. The parameters of an array job are a list of parameter sets, each
+    one run as a child job `{job_id}-{index}` by the task instance of its shard"""
+    size: int = Field(description="The number of child jobs")
+    task_count: int = Field(description="The number of task instances sharing the child jobs", default=1)
+    completed: int = Field(description="The number of completed child jobs", default=0)
+    failed: int = Field(description="The number of failed child jobs", default=0)
+    cancelled: int = Field(description="The number of cancelled child jobs", default=0)
+    shards: dict[str, JobArrayCounts] = Field(
+        description="The counts of each shard, by task index, set by the task instance of the shard",
+        default_factory=dict,
+    )
+
+
+class PayloadRef(BaseModel):
+    """Reference to a payload of a job (its parameters or result) stored in a blob store, used
+    instead of the inline JSON value when it is too large"""
+    store: str = Field(description="The URI of the blob store")
+    key: str = Field(description="The key of the payload in the blob store")
+    compression: str = Field(description="The compression of the stored payload, `gzip` or `zstd`")
+    size: int = Field(description="The size of the uncompressed JSON payload, in bytes")
 
 
 class JobError(BaseModel):
@@ -92,8 +160,14 @@ class CreateJob(BaseModel):
         description="The task document ID",
     )
 
-    parameters_json_value: str = Field(
-        description="The parameters of the job in JSON format",
+    parameters_json_value: str | None = Field(
+        description="The parameters of the job in JSON format, `None` when stored in a blob store",
+        default=None,
+    )
+
+    parameters_ref: PayloadRef | None = Field(
+        description="The reference to the parameters of the job in the blob store",
+        default=None,
     )
 
     user_id: None = Field(
@@ -126,6 +200,11 @@ class CreateJob(BaseModel):
         default=None,
     )
 
+    result_ref: None = Field(
+        description="The reference to the result of the job in the blob store",
+        default=None,
+    )
+
     progress: None = Field(
         description="The current detailed status of the job. It has the step-by-step progress.",
         default=None,
@@ -146,7 +225,7 @@ class StartJob(BaseModel):
 
     progress: JobProgress = Field(
         description="The current detailed status of the job. It has the step-by-step progress.",
-        default=JobProgress(steps=[]),
+        default=JobProgress(),
     )
 
 
@@ -173,6 +252,25 @@ class FailJob(BaseModel):
     )
 
 
+class CancelJob(BaseModel):
+    """Job ending data to update the job status, when its cancellation was requested"""
+
+    status: JobStatus = Field(
+        description="The current status of the job",
+        default=JobStatus.CANCELLED,
+    )
+
+    result: None = Field(
+        description="The result of the job",
+        default=None,
+    )
+
+    completed_at: str = Field(
+        description="The completion date of the job in ISO format",
+        default_factory=get_timestamp,
+    )
+
+
 class FinishJob(BaseModel):
     """Job ending data to update the job status"""
 
@@ -217,6 +315,10 @@ class StartJobStep(BaseModel):
         description="The completion date of the step in ISO format",
         default=None,
     )
+    attempt: int = Field(
+        description="The attempt of the step, starting at 0",
+        default=0,
+    )
 
 
 class FailJobStep(BaseModel):
@@ -230,6 +332,18 @@ class FailJobStep(BaseModel):
         description="The completion date of the step in ISO format",
         default_factory=get_timestamp,
     )
+    metrics: JobStepMetrics | None = Field(
+        description="The resources used by the step",
+        default=None,
+    )
+    attempt: int = Field(
+        description="The attempt of the step, starting at 0",
+        default=0,
+    )
+    error: str | None = Field(
+        description="The error of the failed attempt",
+        default=None,
+    )
 
 
 class FinishJobStep(BaseModel):
@@ -243,3 +357,11 @@ class FinishJobStep(BaseModel):
         description="The completion date of the step in ISO format",
         default_factory=get_timestamp,
     )
+    metrics: JobStepMetrics | None = Field(
+        description="The resources used by the step",
+        default=None,
+    )
+    attempt: int = Field(
+        description="The attempt of the step, starting at 0",
+        default=0,
+    )
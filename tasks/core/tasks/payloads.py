@@ -0,0 +1,97 @@
+import gzip
+from typing import Any
+
+from tasks.config import settings
+from tasks.models import PayloadRef
+from tasks.storage import get_blob_store
+from tasks.utils import get_logger
+
+logger = get_logger(__name__)
+
+PAYLOADS_PREFIX = "payloads"
+
+EXTENSIONS = {"gzip": "gz", "zstd": "zst"}
+
+
+def compress(data: bytes, compression: str) -> bytes:
+    """Compress data with `gzip`, or with `zstd` (needs the optional `zstandard` package)."""
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=6)
+    if compression == "zstd":
+        import zstandard
+
+        return zstandard.ZstdCompressor().compress(data)
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
+def decompress(data: bytes, compression: str) -> bytes:
+    """Decompress data compressed with `compress`."""
+    if compression == "gzip":
+        return gzip.decompress(data)
+    if compression == "zstd":
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
+def dump_payload(job_id: str, name: str, value_json: str, store: str | None = None, inline_limit: int | None = None, compression: str | None = None) -> dict[str, Any]:
+    """
+    Get the job fields storing a payload. Payloads larger than `PAYLOAD_INLINE_LIMIT` bytes are
+    compressed and stored in `PAYLOAD_STORE`, and referenced by the `{name}_ref` field, smaller ones
+    are stored inline in the `{name}_json_value` field. The API passes its own settings.
+
+    Parameters:
+    -----------
+    job_id: str
+        ID of the job.
+    name: str
+        Name of the payload, `parameters` or `result`.
+    value_json: str
+        The payload in JSON format.
+    store: str | None
+        Blob store URI, defaults to `PAYLOAD_STORE`.
+    inline_limit: int | None
+        Maximum size of inline payloads in bytes, defaults to `PAYLOAD_INLINE_LIMIT`.
+    compression: str | None
+        Compression of stored payloads, defaults to `PAYLOAD_COMPRESSION`.
+
+    Returns:
+    --------
+    dict[str, Any]
+        The `{name}_json_value` and `{name}_ref` fields of the job.
+    """
+    store = settings.PAYLOAD_STORE if store is None else store
+    inline_limit = settings.PAYLOAD_INLINE_LIMIT if inline_limit is None else inline_limit
+    compression = compression or settings.PAYLOAD_COMPRESSION
+    data = value_json.encode()
+    if not store or len(data) <= inline_limit:
+        return {f"{name}_json_value": value_json, f"{name}_ref": None}
+    ref = PayloadRef(
+        store=store,
+        key=f"{PAYLOADS_PREFIX}/{job_id}/{name}.json.{EXTENSIONS.get(compression, compression)}",
+        compression=compression,
+        size=len(data),
+    )
+    compressed = compress(data, compression)
+    get_blob_store(ref.store).put(ref.key, compressed)
+    logger.info("Stored %s of job %s in %s, %d bytes compressed to %d", name, job_id, ref.store, ref.size, len(compressed))
+    return {f"{name}_json_value": None, f"{name}_ref": ref.model_dump()}
+
+
+def load_payload(job: dict[str, Any], name: str) -> str | None:
+    """Get a payload of a job in JSON format, from the job fields or the blob store."""
+    if job.get(f"{name}_json_value") is not None:
+        return job[f"{name}_json_value"]
+    if job.get(f"{name}_ref") is None:
+        return None
+    return load_payload_ref(job[f"{name}_ref"])
+
+
+def load_payload_ref(ref: PayloadRef | dict[str, Any]) -> str:
+    """Get a payload stored in a blob store, in JSON format."""
+    ref = PayloadRef.model_validate(ref)
+    data = get_blob_store(ref.store).get(ref.key)
+    if data is None:
+        raise ValueError(f"Payload {ref.key} not found in {ref.store}")
+    return decompress(data, ref.compression).decode()
@@ -0,0 +1,225 @@
+import asyncio
+import contextvars
+import importlib
+import inspect
+import os
+import time
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    FIRST_COMPLETED,
+    wait,
+)
+from typing import Any, Literal
+
+from tasks.config import settings
+from tasks.db import get_context
+from tasks.metrics import StepMeter
+from tasks.models import StartJobStep, FinishJobStep, FailJobStep, JobStepMetrics
+from tasks.types import StepType, StepExpection
+from tasks.utils import get_logger
+
+logger = get_logger(__name__)
+
+
+class PipelineNode:
+    """A step call in a pipeline. Use it as an argument of other steps to depend on its result."""
+
+    def __init__(self, index: int, step_func: StepType, args: tuple, kwargs: dict, depends_on: list["PipelineNode"]) -> None:
+        self.index = index
+        self.step_func = step_func
+        self.args = args
+        self.kwargs = kwargs
+        self.depends_on = depends_on
+        self.name = getattr(step_func, "step_name", step_func.__name__)
+
+    def __repr__(self) -> str:
+        return f"PipelineNode({self.index}, {self.name})"
+
+
+class Pipeline:
+    """
+    Dependency graph of `@step` calls. Steps whose dependencies are done run concurrently in a
+    thread or process pool, so independent branches of a task use all the available vCPUs.
+
+    Dependencies are taken from the arguments of each step, any `PipelineNode` argument is replaced
+    by the result of that node, and from the explicit `depends_on` nodes.
+
+    ```python
+    pipeline = Pipeline()
+    audio = pipeline.add(download_audio, parameters.url)
+    transcript = pipeline.add(transcribe, audio)
+    speakers = pipeline.add(diarize, audio)
+    merged = pipeline.add(merge, transcript, speakers)
+    results = pipeline.run()
+    results[merged]
+    ```
+
+    Parameters:
+    -----------
+    max_workers: int | None
+        Maximum number of steps running at the same time. Defaults to the number of steps, up to
+        32, with threads, so I/O bound steps overlap even on a single vCPU, and to the number of
+        CPUs with processes.
+    executor: Literal["thread", "process"]
+        With "thread" the `@step` wrappers run in a thread pool. With "process" the undecorated step
+        functions run in a process pool, their arguments and results must be picklable, and the
+        step status is recorded from the calling process with the metrics measured in the worker.
+        The items of generator steps are appended to the partial results when the step returns.
+        Steps with resources, checkpoints or retries need the job context of the calling process,
+        they can not run in a process pool.
+    """
+
+    def __init__(self, max_workers: int | None = None, executor: Literal["thread", "process"] = "thread") -> None:
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Invalid executor: {executor}")
+        self.max_workers = max_workers
+        self.executor = executor
+        self.nodes: list[PipelineNode] = []
+
+    def add(self, step_func: StepType, *args: Any, depends_on: list[PipelineNode] | None = None, **kwargs: Any) -> PipelineNode:
+        """Add a step call to the pipeline and return its node."""
+        dependencies = list(depends_on or [])
+        for value in (*args, *kwargs.values()):
+            if isinstance(value, PipelineNode) and value not in dependencies:
+                dependencies.append(value)
+        for dependency in dependencies:
+            if dependency not in self.nodes:
+                raise ValueError(f"{dependency} does not belong to this pipeline")
+        if self.executor == "process":
+            unsupported = [
+                feature for feature, attribute in (("resources", "step_resources"), ("checkpoints", "step_checkpoint"), ("retries", "step_retries"))
+                if getattr(step_func, attribute, None)
+            ]
+            if unsupported:
+                name = getattr(step_func, "step_name", step_func.__name__)
+                raise ValueError(f"Step {name} uses {', '.join(unsupported)}, which need the job context of the calling process. Run it with executor=\"thread\"")
+        node = PipelineNode(len(self.nodes), step_func, args, kwargs, dependencies)
+        self.nodes.append(node)
+        return node
+
+    def run(self) -> dict[PipelineNode, Any]:
+        """
+        Run the pipeline and return the result of each node.
+
+        Raises:
+        -------
+        StepExpection
+            From the first failed step. Steps not started yet are skipped, running steps are
+            awaited.
+        """
+        remaining = {node: set(node.depends_on) for node in self.nodes}
+        dependents: dict[PipelineNode, list[PipelineNode]] = {node: [] for node in self.nodes}
+        for node in self.nodes:
+            for dependency in node.depends_on:
+                dependents[dependency].append(node)
+
+        results: dict[PipelineNode, Any] = {}
+        running: dict[Future, tuple[PipelineNode, tuple[int, float] | None]] = {}
+        error: StepExpection | None = None
+        with self._create_executor() as executor:
+            for node in self.nodes:
+                if not remaining[node]:
+                    future, tracked = self._submit(executor, node, results)
+                    running[future] = (node, tracked)
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node, tracked = running.pop(future)
+                    try:
+                        results[node] = self._result(future, node, tracked)
+                    except StepExpection as e:
+                        error = error or e
+                        continue
+                    if error is not None:
+                        continue
+                    for dependent in dependents[node]:
+                        remaining[dependent].discard(node)
+                        if not remaining[dependent]:
+                            future, tracked = self._submit(executor, dependent, results)
+                            running[future] = (dependent, tracked)
+        if error is not None:
+            raise error
+        return results
+
+    def _create_executor(self) -> Executor:
+        if self.executor == "process":
+            return ProcessPoolExecutor(max_workers=self.max_workers or os.cpu_count() or 1)
+        return ThreadPoolExecutor(max_workers=self.max_workers or min(32, max(len(self.nodes), 1)), thread_name_prefix="pipeline")
+
+    def _submit(self, executor: Executor, node: PipelineNode, results: dict[PipelineNode, Any]) -> tuple[Future, tuple[int, float] | None]:
+        """Submit a node with its dependencies results, and return its future and, when tracked
+        from here, its step sequence number and start time."""
+        args = tuple(results[arg] if isinstance(arg, PipelineNode) else arg for arg in node.args)
+        kwargs = {key: results[value] if isinstance(value, PipelineNode) else value for key, value in node.kwargs.items()}
+        logger.debug("Submitting %s", node)
+        if self.executor == "process":
+            # The wrapper needs the job context, so the step is tracked from this process
+            ctx = get_context()
+            if ctx.cancellation is not None:
+                ctx.cancellation.check()
+            step_seq = ctx.writer.start_step(
+                StartJobStep(name=node.name, description=getattr(node.step_func, "step_description", ""))
+            )
+            func = getattr(node.step_func, "__wrapped__", node.step_func)
+            future = executor.submit(_call_function, func.__module__, func.__qualname__, args, kwargs, settings.STEP_GPU_METRICS)
+            return future, (step_seq, time.perf_counter())
+        # Each thread runs the step in a copy of the job context, a context can not be shared
+        run = contextvars.copy_context().run
+        if inspect.iscoroutinefunction(node.step_func):
+            return executor.submit(run, _run_coroutine, node.step_func, args, kwargs), None
+        return executor.submit(run, node.step_func, *args, **kwargs), None
+
+    def _result(self, future: Future, node: PipelineNode, tracked: tuple[int, float] | None) -> Any:
+        metrics = None
+        try:
+            result = future.result()
+            if tracked is not None:
+                result, metrics = result
+            func = getattr(node.step_func, "__wrapped__", node.step_func)
+            if tracked is not None and (inspect.isgeneratorfunction(func) or inspect.isasyncgenfunction(func)):
+                # Items of generator steps are only streamed once the child process returns them
+                for item in result:
+                    get_context().writer.append_partial(item)
+        except Exception as e:
+            if tracked is not None:
+                step_seq, started = tracked
+                metrics = JobStepMetrics(wall_time=time.perf_counter() - started)
+                get_context().writer.end_step(step_seq, FailJobStep(metrics=metrics))
+            if isinstance(e, StepExpection):
+                raise
+            raise StepExpection(step_name=node.name, error=e) from e
+        if tracked is not None:
+            step_seq, _ = tracked
+            get_context().writer.end_step(step_seq, FinishJobStep(metrics=metrics))
+        return result
+
+
+def _run_coroutine(step_func: StepType, args: tuple, kwargs: dict) -> Any:
+    return asyncio.run(step_func(*args, **kwargs))
+
+
+def _call_function(module_name: str, qualname: str, args: tuple, kwargs: dict, gpu: bool) -> tuple[Any, JobStepMetrics]:
+    """Run an undecorated step function in a worker process, and return its result with the
+    resources it used in the worker."""
+    # Decorated functions can not be pickled by reference, the module attribute is the wrapper
+    func: Any = importlib.import_module(module_name)
+    for name in qualname.split("."):
+        func = getattr(func, name)
+    func = getattr(func, "__wrapped__", func)
+    meter = StepMeter(gpu=gpu)
+    if inspect.iscoroutinefunction(func):
+        result = asyncio.run(func(*args, **kwargs))
+    elif inspect.isasyncgenfunction(func):
+        result = asyncio.run(_collect_async_items(func(*args, **kwargs)))
+    elif inspect.isgeneratorfunction(func):
+        result = list(func(*args, **kwargs))
+    else:
+        result = func(*args, **kwargs)
+    return result, meter.stop()
+
+
+async def _collect_async_items(items: Any) -> list[Any]:
+    return [item async for item in items]
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta, timezone
+
+from tasks.array import count_failed_child, settle_array
+from tasks.backends import JobBackend
+from tasks.models import JobError, JobStatus, get_timestamp
+from tasks.utils import get_logger
+
+logger = get_logger(__name__)
+
+# Error code of the jobs failed by the reaper
+HEARTBEAT_LOST = "HeartbeatLost"
+
+
+def reap_stale_jobs(backend: JobBackend, timeout: float) -> list[str]:
+    """
+    Mark as failed the running jobs without heartbeat for more than `timeout` seconds, their process
+    was killed or preempted before it could write a terminal status. They fail with the
+    `HeartbeatLost` error code, and can be resumed. Failed children of array jobs are counted in
+    their array job. Array jobs without heartbeat lost all their task instances, they end with their
+    children counted from their statuses, the children never run counted as failed.
+
+    Parameters:
+    -----------
+    backend: JobBackend
+        Backend storing the jobs.
+    timeout: float
+        Seconds without heartbeat after which a running job is stale. It should be several times the
+        heartbeat interval of the jobs.
+
+    Returns:
+    --------
+    list[str]
+        The IDs of the failed jobs.
+    """
+    heartbeat_before = (datetime.now(timezone.utc) - timedelta(seconds=timeout)).isoformat()
+    reaped = []
+    for job_id in backend.get_stale_jobs(heartbeat_before):
+        job = backend.get_job(job_id) or {}
+        if job.get("array") is not None:
+            if settle_array(backend, job_id, heartbeat_before):
+                reaped.append(job_id)
+            continue
+        error = JobError(
+            code=HEARTBEAT_LOST,
+            message=f"No heartbeat for more than {timeout} seconds, the job process was lost",
+            additional_info={"timeout": timeout},
+        )
+        fields = {
+            "status": JobStatus.FAILED,
+            "completed_at": get_timestamp(),
+            "error_json_value": error.model_dump_json(),
+        }
+        # The job may have sent a heartbeat or finished since the query
+        if backend.fail_stale_job(job_id, heartbeat_before, fields):
+            logger.warning("Job %s failed, no heartbeat for more than %s seconds", job_id, timeout)
+            reaped.append(job_id)
+            if job.get("parent_id") is not None:
+                count_failed_child(backend, job["parent_id"], job_id)
+    return reaped
@@ -0,0 +1,114 @@
+import threading
+from typing import Callable, Generic, TypeVar
+
+from tasks.utils import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+
+class Resource(Generic[T]):
+    """
+    An expensive object created once per process, on first use or at startup when eager, and shared
+    by every job of the process. Creation is thread-safe.
+
+    Parameters:
+    -----------
+    factory: Callable[[], T]
+        Function creating the object.
+    name: str
+        Name of the resource.
+    eager: bool
+        Create the object at startup of the long-running modes, before they report ready.
+    """
+
+    def __init__(self, factory: Callable[[], T], name: str, eager: bool = False) -> None:
+        self.factory = factory
+        self.name = name
+        self.eager = eager
+        self.error: Exception | None = None
+        self._value: T | None = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def get(self) -> T:
+        """Get the object, creating it on the first call."""
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    logger.info("Loading resource %s", self.name)
+                    try:
+                        self._value = self.factory()
+                    except Exception as e:
+                        self.error = e
+                        raise
+                    self.error = None
+                    self._loaded = True
+        return self._value  # type: ignore
+
+    def __repr__(self) -> str:
+        return f"Resource({self.name}, eager={self.eager}, loaded={self._loaded})"
+
+
+_resources: dict[str, Resource] = {}
+
+
+def resource(name: str | None = None, eager: bool = False) -> Callable[[Callable[[], T]], Resource[T]]:
+    """
+    Decorator to declare a process-lifetime resource from its factory function.
+
+    ```python
+    @resource(eager=True)
+    def whisper_model() -> Model:
+        return whisperx.load_model("large-v2")
+
+    @step(name="Transcribe", description="Transcribe the audio", resources={"model": whisper_model})
+    def transcribe(audio: str, model: Model) -> str:
+        ...
+    ```
+
+    Parameters:
+    -----------
+    name: str | None
+        Name of the resource, defaults to the function name.
+    eager: bool
+        Create the object at startup of the long-running modes, before they report ready.
+    """
+    def decorator(factory: Callable[[], T]) -> Resource[T]:
+        resource_name = name or factory.__name__
+        if resource_name in _resources:
+            raise ValueError(f"Resource {resource_name} already declared")
+        declared = Resource(factory, resource_name, eager)
+        _resources[resource_name] = declared
+        return declared
+    return decorator
+
+
+def load_eager_resources() -> bool:
+    """Create the eager resources that are not loaded yet. Returns if all of them loaded, failures
+    are logged and retried on the next call or on first use."""
+    ready = True
+    for declared in list(_resources.values()):
+        if not declared.eager or declared.loaded:
+            continue
+        try:
+            declared.get()
+        except Exception:
+            logger.exception("Failed to load resource %s", declared.name)
+            ready = False
+    return ready
+
+
+def resources_ready() -> bool:
+    """Check if all the eager resources are loaded."""
+    return all(declared.loaded for declared in _resources.values() if declared.eager)
+
+
+def resources_failed() -> bool:
+    """Check if an eager resource that is not loaded failed on its last attempt."""
+    return any(declared.error is not None for declared in _resources.values() if declared.eager and not declared.loaded)
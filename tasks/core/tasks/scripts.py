@@ -1,16 +1,27 @@
 import argparse
+import asyncio
 import importlib
+import inspect
 import os
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING
 
 from pydantic import BaseModel, Field
-from fastapi import FastAPI
 
-from tasks.types import TaskWithJobIdType, JobIDType, BaseParameters, BaseResult
-from tasks.db import create_task, get_firestore_client
+from tasks.batching import MicroBatcher
+from tasks.types import TaskWithJobIdType, BatchTaskType, JobIDType, BaseParameters, BaseResult
+from tasks.db import create_task, fail_unstarted_job, get_job_backend
+from tasks.tasks import run_task_pipeline, run_batch_task
+from tasks.resources import load_eager_resources, resources_failed, resources_ready
 from tasks.utils import get_logger, normalize_string
 from tasks.config import settings
 
+if TYPE_CHECKING:
+    from fastapi import FastAPI
+
 
 logger = get_logger(__name__)
 
@@ -22,7 +33,7 @@ def import_task(task_module: str) -> tuple[TaskWithJobIdType, type[BaseParameter
     try:
         module = importlib.import_module(task_module)
     except ModuleNotFoundError as e:
-        logger.error(f"Task {task_module} not found")
+        logger.error("Task %s not found", task_module)
         raise ValueError(f"Task {task_module} not found") from e
     try:
         task = getattr(module, "task")
@@ -32,16 +43,24 @@ def import_task(task_module: str) -> tuple[TaskWithJobIdType, type[BaseParameter
     try:
         Parameters = getattr(module, "Parameters")
     except AttributeError as e:
-        logger.error(f"Parameters not found for task {task_module}")
+        logger.error("Parameters not found for task %s", task_module)
         raise ValueError(f"Parameters not found for task {task_module}") from e
     try:
         Results = getattr(module, "Results")
     except AttributeError as e:
-        logger.error(f"Results not found for task {task_module}")
+        logger.error("Results not found for task %s", task_module)
         raise ValueError(f"Results not found for task {task_module}") from e
     return task, Parameters, Results
 
 
+def import_batch_task(task_module: str) -> BatchTaskType | None:
+    """
+    Import the optional batched function of a task module, exported as `batch_task`.
+    """
+    module = importlib.import_module(task_module)
+    return getattr(module, "batch_task", None)
+
+
 def parse_register_parameters(task_name: str) -> str:
     """
     Parse and validate input parameters for a task.
@@ -83,7 +102,7 @@ def parse_register_parameters(task_name: str) -> str:
 
 def register_task(task_pipeline: TaskWithJobIdType, parameters_model: type[BaseParameters], results_model: type[BaseResult]) -> None:
     """
-    Register a task pipeline with input parameters and results models, and store it in Firestore.
+    Register a task pipeline with input parameters and results models, and store it in the job backend.
 
     Parameters
     ----------
@@ -98,21 +117,64 @@ def register_task(task_pipeline: TaskWithJobIdType, parameters_model: type[BaseP
     -------
     None
     """
-    # Register task in Firestore
-    logger.info(f"Registering task {task_pipeline.__name__}")
+    # Register task in the job backend
+    logger.info("Registering task %s", task_pipeline.__name__)
     task_name = task_pipeline.task_name if hasattr(task_pipeline, "task_name") else task_pipeline.__name__
     task_id = task_pipeline.task_id if hasattr(task_pipeline, "task_id") else normalize_string(task_name)
     task_uri = parse_register_parameters(task_name)
     task_description = task_pipeline.task_description if hasattr(task_pipeline, "task_description") else task_pipeline.__doc__ or ""
     parameters_json_schema = json.dumps(parameters_model.model_json_schema())
     results_json_schema = json.dumps(results_model.model_json_schema())
-    db = get_firestore_client()
-    create_task(db, task_id, task_name, task_description, parameters_json_schema, results_json_schema, task_uri)
+    create_task(get_job_backend(), task_id, task_name, task_description, parameters_json_schema, results_json_schema, task_uri)
 
 
-def parse_run_parameters(task_name: str, parameters_model: type[BaseParameters]) -> tuple[JobIDType, BaseParameters]:
+def load_run_parameters(source: str, job_id: JobIDType, parameters_model: type[BaseParameters]) -> BaseParameters:
     """
-    Parse and validate input parameters for a task.
+    Load and validate the parameters of a job as a single payload, keeping their types and nesting
+    whatever their size.
+
+    Parameters:
+    -----------
+    source: str
+        `job` to read the parameters stored in the job (inline or in the payload store), `env` to
+        read them from `TASK_PARAMETERS` in JSON format, or the path of a JSON file, or of a msgpack
+        file with the `.msgpack` extension (needs the optional `msgpack` package).
+    job_id: JobIDType
+        The job ID.
+    parameters_model: type[BaseParameters]
+        Parameters model for the task.
+
+    Returns:
+    --------
+    BaseParameters
+        The validated parameters.
+    """
+    if source == "job":
+        from tasks.payloads import load_payload
+
+        job = get_job_backend().get_job(job_id)
+        parameters_json = load_payload(job, "parameters") if job is not None else None
+        if parameters_json is None:
+            raise ValueError(f"Job {job_id} has no parameters")
+        return parameters_model.model_validate_json(parameters_json)
+    if source == "env":
+        if settings.TASK_PARAMETERS is None:
+            raise ValueError("TASK_PARAMETERS is not set")
+        return parameters_model.model_validate_json(settings.TASK_PARAMETERS)
+    path = source.removeprefix("file://")
+    with open(path, "rb") as file:
+        data = file.read()
+    if path.endswith(".msgpack"):
+        import msgpack
+
+        return parameters_model.model_validate(msgpack.unpackb(data))
+    return parameters_model.model_validate_json(data)
+
+
+def parse_run_parameters(task_name: str, parameters_model: type[BaseParameters]) -> tuple[JobIDType, BaseParameters, bool]:
+    """
+    Parse and validate input parameters for a task. The parameters are given one per argument, or
+    as a single payload with `--parameters_from` (see `load_run_parameters`).
 
     Parameters:
     -----------
@@ -120,13 +182,11 @@ def parse_run_parameters(task_name: str, parameters_model: type[BaseParameters])
         Name of the task.
     parameters_model: type[BaseParameters]
         Parameters model for the task.
-    results_model: type[BaseResult]
-        Results model for the task.
 
     Returns:
     --------
-    tuple[JobIDType, BaseParameters]
-        Job ID and parameters model.
+    tuple[JobIDType, BaseParameters, bool]
+        Job ID, parameters model and if the job is resumed.
 
     Raises:
         ValueError: If required parameters are missing or invalid.
@@ -140,10 +200,26 @@ def parse_run_parameters(task_name: str, parameters_model: type[BaseParameters])
         required=True,
         help="The job ID",
     )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help="Resume a failed job, skipping the steps with a checkpoint",
+    )
+    parser.add_argument(
+        '--parameters_from',
+        help="Read the parameters as a single payload from `job`, `env` or a JSON or msgpack file, instead of the arguments",
+    )
+
+    source_parser = argparse.ArgumentParser(add_help=False)
+    source_parser.add_argument('--parameters_from')
+    source, _ = source_parser.parse_known_args()
+    if source.parameters_from is not None:
+        args = parser.parse_args()
+        return args.job_id, load_run_parameters(args.parameters_from, args.job_id, parameters_model), args.resume
 
     # Build parser dynamically based on the Parameters model
     for name, field in parameters_model.model_fields.items():
-        has_default = field.default != ...
+        has_default = not field.is_required()
         help_text = field.description or ""
         if has_default:
             help_text += f" (default: {field.default})"
@@ -156,13 +232,40 @@ def parse_run_parameters(task_name: str, parameters_model: type[BaseParameters])
     args = parser.parse_args()
     args_dict = vars(args)
     job_id = args_dict.pop('job_id')
-    return job_id, parameters_model(**args_dict)
+    resume = args_dict.pop('resume')
+    args_dict.pop('parameters_from')
+    return job_id, parameters_model(**args_dict), resume
+
+
+def parse_array_parameters() -> tuple[JobIDType, bool] | None:
+    """
+    Parse the arguments of an array job run, `--job_id <id> --array [--resume]`. The parameters of
+    the children are read from the array job instead of the arguments.
+
+    Returns:
+    --------
+    tuple[JobIDType, bool] | None
+        Array job ID and if the failed children are resumed, or `None` if it is not an array job
+        run.
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--job_id')
+    parser.add_argument('--array', action='store_true')
+    parser.add_argument('--resume', action='store_true')
+    args, _ = parser.parse_known_args()
+    if not args.array:
+        return None
+    if args.job_id is None:
+        raise ValueError("--array requires --job_id")
+    return args.job_id, args.resume
 
 
 def run_task(task_pipeline: TaskWithJobIdType, parameters_model: type[BaseParameters], results_model: type[BaseResult]) -> None:
     """
     Run a task pipeline with input parameters. The task pipeline is expected to be a function that
-    takes a job ID and a parameters model as input, and returns a results model.
+    takes a job ID and a parameters model as input, and returns a results model. Coroutine task
+    pipelines are run in a new event loop. With `--array`, the task instance runs its shard of the
+    children of an array job.
 
     Parameters:
     -----------
@@ -178,13 +281,19 @@ def run_task(task_pipeline: TaskWithJobIdType, parameters_model: type[BaseParame
     None
     """
     task_name = task_pipeline.task_name if hasattr(task_pipeline, "task_name") else task_pipeline.__name__
-    logger.info(f"Running task {task_name}")
+    logger.info("Running task %s", task_name)
+    array = parse_array_parameters()
+    if array is not None:
+        from tasks.array import run_array_shard
+
+        job_id, resume = array
+        run_array_shard(task_pipeline, parameters_model, job_id, resume=resume)
+        return
     # Parse and validate input parameters
-    job_id, parameters = parse_run_parameters(task_name, parameters_model)
+    job_id, parameters, resume = parse_run_parameters(task_name, parameters_model)
     # Run the task
-    results = task_pipeline(job_id, parameters)
-    logger.info(f"Results: {results}")
-
+    results = run_task_pipeline(task_pipeline, job_id, parameters, resume=resume)
+    logger.info("Results: %s", results)
 
 
 def build_request_parameters(parameters_model: type[BaseParameters]) -> type:
@@ -222,9 +331,23 @@ def build_request_parameters(parameters_model: type[BaseParameters]) -> type:
     return TaskEndpointBody
 
 
-def serve_task(task_pipeline: TaskWithJobIdType, parameters_model: type[BaseParameters], results_model: type[BaseResult]) -> None:
+def create_app(task_pipeline: TaskWithJobIdType, parameters_model: type[BaseParameters], results_model: type[BaseResult], batch_task: BatchTaskType | None = None) -> "FastAPI":
     """
-    Create and serve a FastAPI app for the task pipeline.
+    Create a FastAPI app for the task pipeline.
+
+    The instances of a request run concurrently, at most `SERVER_MAX_CONCURRENCY` at the same time
+    across requests. Synchronous task pipelines run in a thread pool, so the event loop and the
+    health check are never blocked. With several instances, each one runs as the sub-job
+    `{job_id}-{index}`, and the predictions keep the order of the instances. An instance that can
+    not run (e.g. its job already exists) gets a `null` prediction, and its job is marked failed if
+    it was not started, without failing the other instances.
+
+    The eager `@resource` declarations are loaded in the background at startup, and the health
+    check answers 503 until they are ready.
+
+    With a `batch_task`, instances of concurrent requests are collected into batches of up to
+    `max_batch_size` instances, waiting at most `max_wait` seconds, and the batched function is
+    called once per batch.
 
     Parameters:
     -----------
@@ -234,16 +357,20 @@ def serve_task(task_pipeline: TaskWithJobIdType, parameters_model: type[BasePara
         Parameters model for the task.
     results_model: type[BaseResult]
         Results model for the task.
+    batch_task: BatchTaskType | None
+        Batched function of the task, decorated with `@batched`.
     Returns:
     --------
-    None
+    FastAPI
+        The app serving the task.
     """
+    # Serve-only dependencies are imported here, so `tasks-run` does not pay for them
+    from fastapi import FastAPI, Response
+
     task_name = task_pipeline.task_name if hasattr(task_pipeline, "task_name") else task_pipeline.__name__
-    logger.info(f"Serving task {task_name}")
     # Parse and validate input parameters
     TaskEndpointBody = build_request_parameters(parameters_model)
 
-    port = int(os.environ.get("AIP_HTTP_PORT", settings.SERVER_PORT))
     health_endpoint = os.environ.get("AIP_HEALTH_ROUTE", settings.SERVER_HEALTH_ENDPOINT)
     predict_endpoint = os.environ.get("AIP_PREDICT_ROUTE", settings.SERVER_PREDICT_ENDPOINT)
 
@@ -261,22 +388,77 @@ def serve_task(task_pipeline: TaskWithJobIdType, parameters_model: type[BasePara
         """
         A class representing the response for a task endpoint.
         """
-        predictions: list[results_model] = Field(  # type: ignore
-            description="List of instances processed by the task.",
+        predictions: list[results_model | None] = Field(  # type: ignore
+            description="List of instances processed by the task, `null` for the failed ones.",
         )
 
+    executor = ThreadPoolExecutor(max_workers=settings.SERVER_MAX_CONCURRENCY, thread_name_prefix="predict")
+
+    async def load_resources() -> None:
+        loop = asyncio.get_running_loop()
+        while not await loop.run_in_executor(executor, load_eager_resources):
+            logger.warning("Eager resources failed to load, retrying in %s seconds", settings.SERVER_RESOURCE_RETRY_INTERVAL)
+            await asyncio.sleep(settings.SERVER_RESOURCE_RETRY_INTERVAL)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # Load in the background until they are all loaded, the health check reports when they are ready
+        loading = asyncio.create_task(load_resources())
+        yield
+        loading.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+
     # Serve the task
     app = FastAPI(
         title=f"{task_name.replace('_', ' ').title()} API",
+        lifespan=lifespan,
     )
 
+    semaphore = asyncio.Semaphore(settings.SERVER_MAX_CONCURRENCY)
+
+    batcher = None
+    if batch_task is not None:
+        async def run_batch(items: list[tuple[JobIDType, BaseParameters]]) -> list[BaseResult | None]:
+            job_ids = [job_id for job_id, _ in items]
+            instances = [instance for _, instance in items]
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, run_batch_task, task_pipeline, batch_task, job_ids, instances)
+
+        batcher = MicroBatcher(
+            run_batch,
+            max_batch_size=settings.SERVER_MAX_BATCH_SIZE or getattr(batch_task, "max_batch_size", 8),
+            max_wait=settings.SERVER_MAX_BATCH_WAIT if settings.SERVER_MAX_BATCH_WAIT is not None else getattr(batch_task, "max_wait", 0.01),
+        )
+
+    async def call_instance(job_id: JobIDType, instance: BaseParameters) -> BaseResult | None:
+        if batcher is not None:
+            return await batcher.submit((job_id, instance))
+        if inspect.iscoroutinefunction(task_pipeline):
+            async with semaphore:
+                return await task_pipeline(job_id, instance)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, task_pipeline, job_id, instance)
+
+    async def run_instance(job_id: JobIDType, instance: BaseParameters) -> BaseResult | None:
+        try:
+            return await call_instance(job_id, instance)
+        except Exception as e:
+            # The task catches the errors of the job once started, this one could not start
+            logger.exception("Job %s could not run", job_id)
+            await asyncio.get_running_loop().run_in_executor(executor, fail_unstarted_job, job_id, e)
+            return None
+
     @app.get(
         path=health_endpoint,
         description="Health check endpoint",
     )
-    async def health_check() -> HealthCheckResponse:
+    async def health_check(response: Response) -> HealthCheckResponse:
+        ready = resources_ready()
+        if not ready:
+            response.status_code = 503
+        status = "ok" if ready else "failed" if resources_failed() else "loading"
         return HealthCheckResponse(
-            status="ok",
+            status=status,
             task_name=task_name,
             task_id=task_pipeline.task_id,
             task_description=task_pipeline.task_description,
@@ -288,14 +470,42 @@ def serve_task(task_pipeline: TaskWithJobIdType, parameters_model: type[BasePara
     )
     async def endpoint(parameters: TaskEndpointBody) -> TaskEndpointResponse:  # type: ignore
         job_id = parameters.parameters.job_id
-        # Convert instances to a list of parameters
-        all_results = []
-        for instance in parameters.instances:
-            all_results.append(
-                task_pipeline(job_id, instance)
-            )
+        instances = parameters.instances
+        if len(instances) == 1:
+            job_ids = [job_id]
+        else:
+            job_ids = [f"{job_id}-{index}" for index in range(len(instances))]
+        all_results = await asyncio.gather(
+            *(run_instance(instance_job_id, instance) for instance_job_id, instance in zip(job_ids, instances))
+        )
         return TaskEndpointResponse(predictions=all_results)
 
+    return app
+
+
+def serve_task(task_pipeline: TaskWithJobIdType, parameters_model: type[BaseParameters], results_model: type[BaseResult], batch_task: BatchTaskType | None = None) -> None:
+    """
+    Create and serve a FastAPI app for the task pipeline.
+
+    Parameters:
+    -----------
+    task_pipeline: TaskWithJobIdType
+        Task pipeline function.
+    parameters_model: type[BaseParameters]
+        Parameters model for the task.
+    results_model: type[BaseResult]
+        Results model for the task.
+    batch_task: BatchTaskType | None
+        Batched function of the task, decorated with `@batched`.
+    Returns:
+    --------
+    None
+    """
+    task_name = task_pipeline.task_name if hasattr(task_pipeline, "task_name") else task_pipeline.__name__
+    logger.info("Serving task %s", task_name)
+    app = create_app(task_pipeline, parameters_model, results_model, batch_task)
+    port = int(os.environ.get("AIP_HTTP_PORT", settings.SERVER_PORT))
+
     # Run the FastAPI app
     import uvicorn
     uvicorn.run(
@@ -306,6 +516,91 @@ def serve_task(task_pipeline: TaskWithJobIdType, parameters_model: type[BasePara
     )
 
 
+def work_task(task_pipeline: TaskWithJobIdType, parameters_model: type[BaseParameters], results_model: type[BaseResult]) -> None:
+    """
+    Run a worker pulling jobs of the task pipeline from the `WORKER_QUEUE` queue, with
+    `WORKER_CONCURRENCY` jobs at the same time, until SIGTERM or SIGINT drains it.
+
+    Parameters:
+    -----------
+    task_pipeline: TaskWithJobIdType
+        Task pipeline function.
+    parameters_model: type[BaseParameters]
+        Parameters model for the task.
+    results_model: type[BaseResult]
+        Results model for the task.
+
+    Returns:
+    --------
+    None
+    """
+    task_name = task_pipeline.task_name if hasattr(task_pipeline, "task_name") else task_pipeline.__name__
+    logger.info("Starting worker for task %s", task_name)
+    from tasks.worker import Worker, get_job_queue
+
+    worker = Worker(
+        task_pipeline,
+        parameters_model,
+        get_job_queue(settings.WORKER_QUEUE),
+        concurrency=settings.WORKER_CONCURRENCY,
+        poll_interval=settings.WORKER_POLL_INTERVAL,
+        claim_timeout=settings.WORKER_CLAIM_TIMEOUT,
+    )
+    worker.install_signal_handlers()
+    worker.run()
+
+
+def enqueue_task(task_pipeline: TaskWithJobIdType, parameters_model: type[BaseParameters], results_model: type[BaseResult]) -> None:
+    """
+    Add a job to the `WORKER_QUEUE` queue, with the same arguments as `tasks-run`.
+
+    Parameters:
+    -----------
+    task_pipeline: TaskWithJobIdType
+        Task pipeline function.
+    parameters_model: type[BaseParameters]
+        Parameters model for the task.
+    results_model: type[BaseResult]
+        Results model for the task.
+
+    Returns:
+    --------
+    None
+    """
+    task_name = task_pipeline.task_name if hasattr(task_pipeline, "task_name") else task_pipeline.__name__
+    job_id, parameters, resume = parse_run_parameters(task_name, parameters_model)
+    from tasks.worker import get_job_queue
+
+    get_job_queue(settings.WORKER_QUEUE).put(job_id, parameters.model_dump_json(), resume=resume)
+    logger.info("Job %s queued", job_id)
+
+
+def reap_jobs(timeout: float, interval: float | None = None) -> None:
+    """
+    Mark as failed the running jobs without heartbeat for more than `timeout` seconds, once or every
+    `interval` seconds.
+
+    Parameters:
+    -----------
+    timeout: float
+        Seconds without heartbeat after which a running job is stale.
+    interval: float | None
+        Seconds between two checks, `None` to check once.
+
+    Returns:
+    --------
+    None
+    """
+    from tasks.reaper import reap_stale_jobs
+
+    while True:
+        reaped = reap_stale_jobs(get_job_backend(), timeout)
+        logger.info("Reaped %s stale jobs", len(reaped))
+        if interval is None:
+            return
+        time.sleep(interval)
+
+
 """
 Entry point for running or registering a task.
 ==============================================
@@ -315,6 +610,12 @@ environment variable, then runs the task.
 
 Register: This entry point for registering a task. It imports the task module specified in the
 TASK_MODULE environment variable, then registers the task in Firestore.
+
+Worker: This entry point for running a long-lived worker. It imports the task module specified in
+the TASK_MODULE environment variable once, then runs the jobs pulled from the worker queue.
+
+Reap: This entry point marks as failed the running jobs whose heartbeat is stale. It does not need
+a task module.
 """
 
 def run() -> None:
@@ -333,13 +634,55 @@ def register() -> None:
     register_task(task, Parameters, Results)
 
 
+def reap() -> None:
+    """
+    Mark as failed the running jobs of all the tasks whose heartbeat is stale.
+    """
+    parser = argparse.ArgumentParser(description="Fail the running jobs without heartbeat")
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        default=settings.STALE_JOB_TIMEOUT,
+        help=f"Seconds without heartbeat after which a job is stale (default: {settings.STALE_JOB_TIMEOUT})",
+    )
+    parser.add_argument(
+        '--interval',
+        type=float,
+        default=None,
+        help="Seconds between two checks, check once when not set",
+    )
+    args = parser.parse_args()
+    reap_jobs(args.timeout, args.interval)
+
+
 def serve() -> None:
     """
-    Serve the task pipeline. This is a placeholder function that can be used to serve the task
-    pipeline using a FastAPI web server.
+    Serve the task pipeline with an HTTP prediction endpoint, see `create_app`.
+    """
+    task_module = os.environ.get("TASK_MODULE")
+    if task_module is None:
+        raise ValueError("TASK_MODULE environment variable not set")
+    task, Parameters, Results = import_task(task_module)
+    serve_task(task, Parameters, Results, import_batch_task(task_module))
+
+
+def worker() -> None:
+    """
+    Run a worker for the task pipeline, pulling jobs from the queue until drained.
+    """
+    task_module = os.environ.get("TASK_MODULE")
+    if task_module is None:
+        raise ValueError("TASK_MODULE environment variable not set")
+    task, Parameters, Results = import_task(task_module)
+    work_task(task, Parameters, Results)
+
+
+def enqueue() -> None:
+    """
+    Add a job of the task pipeline to the worker queue.
     """
     task_module = os.environ.get("TASK_MODULE")
     if task_module is None:
         raise ValueError("TASK_MODULE environment variable not set")
     task, Parameters, Results = import_task(task_module)
-    serve_task(task, Parameters, Results)
+    enqueue_task(task, Parameters, Results)
@@ -0,0 +1,124 @@
+import os
+from abc import ABC, abstractmethod
+
+from tasks.utils import get_logger
+
+logger = get_logger(__name__)
+
+
+class BlobStore(ABC):
+    """Key-value store for binary objects, keys are `/` separated paths."""
+
+    @abstractmethod
+    def get(self, key: str) -> bytes | None:
+        """Get the object stored at `key`, or `None` if it does not exist."""
+
+    @abstractmethod
+    def put(self, key: str, data: bytes) -> None:
+        """Store `data` at `key`, replacing any existing object."""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """Check if an object is stored at `key`."""
+
+
+class LocalBlobStore(BlobStore):
+    """Blob store backed by a directory of the local filesystem."""
+
+    def __init__(self, root: str) -> None:
+        self.root = os.path.abspath(root)
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise ValueError(f"Invalid key: {key}")
+        return path
+
+    def get(self, key: str) -> bytes | None:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so readers never see a partial object
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+
+class GCSBlobStore(BlobStore):
+    """
+    Blob store backed by a Google Cloud Storage bucket. Needs the optional `google-cloud-storage`
+    package, imported on first use.
+
+    Parameters:
+    -----------
+    bucket: str
+        Name of the bucket.
+    prefix: str
+        Prefix of the object names, e.g. `tasks/payloads`.
+    """
+
+    def __init__(self, bucket: str, prefix: str = "") -> None:
+        self.bucket_name = bucket
+        self.prefix = prefix.strip("/")
+        self._bucket = None
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            from google.cloud import storage
+
+            self._bucket = storage.Client().bucket(self.bucket_name)
+        return self._bucket
+
+    def _name(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def get(self, key: str) -> bytes | None:
+        from google.api_core.exceptions import NotFound
+
+        try:
+            return self.bucket.blob(self._name(key)).download_as_bytes()
+        except NotFound:
+            return None
+
+    def put(self, key: str, data: bytes) -> None:
+        # Uploads of a single request are atomic, readers never see a partial object
+        self.bucket.blob(self._name(key)).upload_from_string(data, content_type="application/octet-stream")
+
+    def exists(self, key: str) -> bool:
+        return self.bucket.blob(self._name(key)).exists()
+
+
+def get_blob_store(uri: str) -> BlobStore:
+    """
+    Get the blob store for a URI.
+
+    Parameters:
+    -----------
+    uri: str
+        Location of the store, a local directory path, a `file://` URI or a `gs://<bucket>/<prefix>`
+        URI.
+
+    Returns:
+    --------
+    BlobStore
+        The blob store.
+    """
+    if uri.startswith("file://"):
+        return LocalBlobStore(uri.removeprefix("file://"))
+    if uri.startswith("gs://"):
+        bucket, _, prefix = uri.removeprefix("gs://").partition("/")
+        return GCSBlobStore(bucket, prefix)
+    if "://" in uri:
+        raise ValueError(f"Unsupported blob store URI: {uri}")
+    return LocalBlobStore(uri)
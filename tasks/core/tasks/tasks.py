@@ -1,113 +1,428 @@
+import asyncio
+import inspect
+import random
+import time
 from functools import wraps
-from typing import Any, Callable
+from typing import Any, AsyncIterator, Callable, Iterator
 
 from tasks.db import (
+    _Context,
     setup_context,
     create_or_check_job,
     get_context,
-    update_job_status,
-    update_job_step_status,
+    get_job_progress,
+    use_context,
 )
 from tasks.types import (
     BaseParameters,
     BaseResult,
     TaskType,
     TaskWithJobIdType,
+    BatchTaskType,
     StepType,
     StepExpection,
+    JobCancelled,
 )
+from tasks.config import settings
+from tasks.metrics import StepMeter
+from tasks.resources import Resource
 from tasks.utils import (
     get_logger,
+    log_fields,
     normalize_string,
 )
 from tasks.models import (
     JobError,
+    JobStatus,
     StartJob,
     FailJob,
+    CancelJob,
     FinishJob,
     StartJobStep,
     FinishJobStep,
+    JobStepMetrics,
     FailJobStep,
 )
 
 logger = get_logger(__name__)
 
 
+def _start_job(job_id: str, task_id: str, task_name: str, parameters: BaseParameters, resume: bool) -> _Context:
+    """Setup the context, check or create the job and queue its start."""
+    # Initialize the job backend
+    ctx = setup_context(job_id, task_id, parameters, resume=resume)
+
+    # Log start
+    try:
+        exists = create_or_check_job(ctx.backend, ctx.job_id, ctx.task_id, ctx.parameters, resume=resume)
+        if resume and exists:
+            ctx.writer.resume(get_job_progress(ctx.backend, ctx.job_id))
+    except Exception:
+        ctx.writer.close()
+        raise
+    logger.info("Starting task: %s", task_name)
+    ctx.writer.update_job(StartJob())
+    if ctx.cancellation is not None:
+        ctx.cancellation.watch(ctx.backend, settings.CANCEL_POLL_INTERVAL)
+    return ctx
+
+
+def _fail_job(task_name: str, e: Exception) -> FailJob | CancelJob:
+    """Build the failure update of a job from the exception raised by the task, or its
+    cancellation."""
+    if isinstance(e, JobCancelled) or (isinstance(e, StepExpection) and isinstance(e.error, JobCancelled)):
+        logger.warning("Task %s cancelled", task_name)
+        return CancelJob()
+    if isinstance(e, StepExpection):
+        code = type(e.error).__name__
+        message = str(e.error)
+        additional_info = {"step": e.step_name}
+        error = JobError(code=code, message=message, additional_info=additional_info)
+        logger.error("Task %s failed with error in step %s: %s", task_name, e.step_name, error)
+    else:
+        code = type(e).__name__
+        message = str(e)
+        additional_info = None
+        error = JobError(code=code, message=message, additional_info=additional_info)
+        logger.error("Task %s failed with error: %s", task_name, error)
+    return FailJob(error=error)
+
+
+def _end_job(ctx: _Context, task_name: str, job_update: FailJob | CancelJob | FinishJob) -> BaseResult | None:
+    """Write the terminal status of the job and close its status writer."""
+    # Log completion
+    logger.info("Task %s completed with status: %s", task_name, job_update.status)
+    if ctx.cancellation is not None:
+        ctx.cancellation.stop()
+    try:
+        ctx.writer.update_job(job_update)
+    finally:
+        ctx.writer.close()
+    return job_update.result
+
+
 def task(name: str, description: str) -> Callable[[TaskType], TaskWithJobIdType]:
-    """Decorator to log execution status in Firestore."""
+    """Decorator to log execution status in the job backend. Status updates are written behind by
+    the job status writer, and flushed when the task finishes.
+
+    Coroutine functions are supported, the decorated task is then a coroutine function too, and the
+    blocking job creation and final flush run in a worker thread to keep the event loop free.
+
+    The decorated task takes the job ID, the parameters and `resume`. When resuming, a failed job
+    can run again and its checkpointed steps are skipped. A job cancelled before it started is not
+    run, the task returns `None`.
+    """
     def decorator(task_func: TaskType) -> TaskWithJobIdType:
         task_name = name
         task_id = normalize_string(task_name)
         task_description = description
-        logger.debug(f"Adding {task_name} task")
-        @wraps(task_func)
-        def wrapper(job_id: str, parameters: BaseParameters) -> BaseResult | None:
-            # Initialize Firestore client
-            ctx = setup_context(job_id, task_id, parameters)
-
-            # Log start
-            create_or_check_job(ctx.db, ctx.job_id, ctx.task_id, ctx.parameters)
-            logger.info(f"Starting task: {task_name}")
-            try:
-                # Run step
-                update_job_status(ctx.db, ctx.job_id, StartJob())
-                result = task_func(parameters)
-            except StepExpection as e:
-                # Log failure
-                code = type(e.error).__name__
-                message = str(e.error)
-                additional_info = {"step": e.step_name}
-                error = JobError(code=code, message=message, additional_info=additional_info)
-                logger.error(f"Task {task_name} failed with error in step {e.step_name}: {error}")
-            except Exception as e:
-                # Log failure
-                code = type(e).__name__
-                message = str(e)
-                additional_info = None
-                error = JobError(code=code, message=message, additional_info=additional_info)
-                logger.error(f"Task {task_name} failed with error: {error}")
-                job_update = FailJob(error=error)
-            else:
-                job_update = FinishJob(result=result)
-
-            # Log completion
-            logger.info(f"Task {task_name} completed with status: {job_update.status}")
-            update_job_status(ctx.db, ctx.job_id, job_update)
-            return job_update.result
+        logger.debug("Adding %s task", task_name)
+        if inspect.iscoroutinefunction(task_func):
+            @wraps(task_func)
+            async def async_wrapper(job_id: str, parameters: BaseParameters, resume: bool = False) -> BaseResult | None:
+                try:
+                    ctx = await asyncio.to_thread(_start_job, job_id, task_id, task_name, parameters, resume)
+                except JobCancelled:
+                    # Cancelled before it started, there is nothing to run
+                    return None
+                with use_context(ctx):
+                    try:
+                        # Run task
+                        result = await task_func(parameters)
+                    except Exception as e:
+                        job_update = _fail_job(task_name, e)
+                    else:
+                        job_update = FinishJob(result=result)
+                return await asyncio.to_thread(_end_job, ctx, task_name, job_update)
+            wrapper = async_wrapper
+        else:
+            @wraps(task_func)
+            def sync_wrapper(job_id: str, parameters: BaseParameters, resume: bool = False) -> BaseResult | None:
+                try:
+                    ctx = _start_job(job_id, task_id, task_name, parameters, resume)
+                except JobCancelled:
+                    # Cancelled before it started, there is nothing to run
+                    return None
+                with use_context(ctx):
+                    try:
+                        # Run task
+                        result = task_func(parameters)
+                    except Exception as e:
+                        job_update = _fail_job(task_name, e)
+                    else:
+                        job_update = FinishJob(result=result)
+                return _end_job(ctx, task_name, job_update)
+            wrapper = sync_wrapper
         # Add metadata to the wrapper
         wrapper.task_name = task_name  # type: ignore
+        wrapper.task_id = task_id  # type: ignore
         wrapper.task_description = task_description  # type: ignore
         return wrapper
     return decorator
 
 
-def step(name: str, description: str) -> Callable[[StepType], StepType]:
-    """Decorator to log execution status in Firestore."""
+def _restore_step(ctx: _Context, step_id: str, checkpoint: bool, args: tuple, kwargs: dict) -> tuple[str | None, bool, Any]:
+    """Get the checkpoint key of a step call, and its result if the job is resumed and the step
+    was checkpointed. Returns the key, if the result was restored and the result."""
+    if not checkpoint or ctx.checkpoints is None:
+        return None, False, None
+    checkpoint_key = ctx.checkpoints.key(step_id, args, kwargs)
+    if checkpoint_key is None or not ctx.resume:
+        return checkpoint_key, False, None
+    restored, step_result = ctx.checkpoints.load(checkpoint_key)
+    return checkpoint_key, restored, step_result
+
+
+def _save_step(ctx: _Context, checkpoint_key: str | None, step_result: Any) -> None:
+    """Save the checkpoint of a step result, if checkpointed."""
+    if checkpoint_key is not None and ctx.checkpoints is not None:
+        ctx.checkpoints.save(checkpoint_key, step_result)
+
+
+def _resource_kwargs(resources: dict[str, Resource] | None, kwargs: dict) -> dict:
+    """Get the resources to inject as keyword arguments, unless passed explicitly."""
+    if not resources:
+        return {}
+    return {name: declared.get() for name, declared in resources.items() if name not in kwargs}
+
+
+def _stream_partials(ctx: _Context, items: Iterator[Any]) -> list[Any]:
+    """Append each item yielded by a generator step to the partial results of the job, and return
+    the list of items."""
+    step_result = []
+    for item in items:
+        ctx.writer.append_partial(item)
+        step_result.append(item)
+    return step_result
+
+
+async def _write_status(ctx: _Context, write: Callable[..., Any], *args: Any) -> Any:
+    """Call a function writing to the job status writer from an async step. A write-through writer
+    writes to the backend on every call, the call then runs in a thread so it does not block the
+    event loop and the other steps gathered with this one."""
+    if ctx.writer.interval <= 0:
+        return await asyncio.to_thread(write, *args)
+    return write(*args)
+
+
+async def _astream_partials(ctx: _Context, items: AsyncIterator[Any]) -> list[Any]:
+    """Append each item yielded by an async generator step to the partial results of the job, and
+    return the list of items."""
+    step_result = []
+    async for item in items:
+        await _write_status(ctx, ctx.writer.append_partial, item)
+        step_result.append(item)
+    return step_result
+
+
+def _retry_delay(backoff: float, attempt: int) -> float:
+    """Seconds to wait before retrying a step after its failed `attempt`: exponential backoff with
+    jitter, so the jobs hitting the same transient error do not retry in lockstep."""
+    delay = backoff * 2 ** attempt
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def _check_cancelled(ctx: _Context) -> None:
+    if ctx.cancellation is not None:
+        ctx.cancellation.check()
+
+
+def check_cancelled() -> None:
+    """Raise `JobCancelled` if the cancellation of the running job was requested, the job then ends
+    in the "cancelled" status. Steps check it before they start, call it in the long loops of steps
+    to stop sooner. The job is watched in the background, so the check is cheap."""
+    _check_cancelled(get_context())
+
+
+def _fail_attempt(ctx: _Context, step_name: str, step_seq: int, attempt: int, metrics: JobStepMetrics, e: Exception, retries: int, retry_on: tuple[type[Exception], ...]) -> bool:
+    """Record a failed attempt of a step, and return if the step is retried."""
+    if isinstance(e, JobCancelled):
+        ctx.writer.end_step(step_seq, FailJobStep(status=JobStatus.CANCELLED, metrics=metrics, attempt=attempt))
+        return False
+    ctx.writer.end_step(step_seq, FailJobStep(metrics=metrics, attempt=attempt, error=f"{type(e).__name__}: {e}"))
+    retry = attempt < retries and isinstance(e, retry_on)
+    if retry:
+        logger.warning("Step %s failed on attempt %d of %d: %s", step_name, attempt + 1, retries + 1, e)
+    return retry
+
+
+def step(name: str, description: str, checkpoint: bool = False, resources: dict[str, Resource] | None = None, retries: int = 0, backoff: float = 1.0, retry_on: type[Exception] | tuple[type[Exception], ...] = Exception) -> Callable[[StepType], StepType]:
+    """Decorator to log execution status in the job backend. Coroutine functions are supported, so
+    steps can run concurrently with `asyncio.gather` inside an async task.
+
+    The wall time, CPU time and peak RSS increase of each step (and the peak GPU memory with
+    `STEP_GPU_METRICS`) are recorded on its end event and rolled up on the job.
+
+    With `checkpoint`, and `CHECKPOINT_STORE` set, the step result is pickled to the checkpoint
+    store, and a resumed job restores it instead of running the step again with the same inputs.
+
+    `resources` maps keyword arguments of the step to `@resource` declarations, the shared objects
+    are injected unless the argument is passed. They are not part of the checkpoint inputs.
+
+    Generator functions (and async generator functions) stream their items: each yielded item is
+    appended to the partial results of the job as soon as it is produced, and the step returns the
+    list of items. Items are Pydantic models or JSON compatible values.
+
+    With `retries`, a step raising one of the `retry_on` exceptions runs again up to `retries` more
+    times, after `backoff` seconds doubled at each attempt, with jitter. Each attempt has its own
+    start and end events. Generator steps can not be retried, their items are already streamed.
+    Steps with retries, checkpoints or resources can not run in a process pipeline.
+    """
+    if retries < 0:
+        raise ValueError(f"Invalid retries: {retries}")
+    retry_exceptions = retry_on if isinstance(retry_on, tuple) else (retry_on,)
+
     def decorator(step_func: StepType) -> StepType:
         step_name = name
+        step_id = normalize_string(step_name)
         step_description = description
-        @wraps(step_func)
-        def wrapper(*args, **kwargs) -> Any:
-            # Get shared context
-            ctx = get_context()
-
-            # Log step start
-            logger.info(f"Starting step: {step_name}")
-            try:
-                update_job_step_status(ctx.db, ctx.job_id, StartJobStep(name=step_name, description=step_description))
-                step_result = step_func(*args, **kwargs)  # Run step
-            except Exception as e:
-                update_job_step_status(ctx.db, ctx.job_id, FailJobStep())
-                raise StepExpection(
-                    step_name=step_name,
-                    error=e,
-                ) from e
-            else:
-                logger.info(f"Step {step_name} completed")
-                update_job_step_status(ctx.db, ctx.job_id, FinishJobStep())
-                return step_result
+        if retries and (inspect.isgeneratorfunction(step_func) or inspect.isasyncgenfunction(step_func)):
+            raise ValueError(f"Generator step {step_name} can not be retried")
+        if inspect.iscoroutinefunction(step_func) or inspect.isasyncgenfunction(step_func):
+            @wraps(step_func)
+            async def async_wrapper(*args, **kwargs) -> Any:
+                # Get shared context
+                ctx = get_context()
+                _check_cancelled(ctx)
+
+                # Log step start
+                logger.info("Starting step: %s", step_name)
+                step_seq = await _write_status(ctx, ctx.writer.start_step, StartJobStep(name=step_name, description=step_description))
+                with log_fields(step=step_seq, step_name=step_name):
+                    attempt = 0
+                    while True:
+                        meter = StepMeter(gpu=settings.STEP_GPU_METRICS)
+                        try:
+                            checkpoint_key, restored, step_result = _restore_step(ctx, step_id, checkpoint, args, kwargs)
+                            if restored:
+                                logger.info("Step %s restored from checkpoint", step_name)
+                            else:
+                                if inspect.isasyncgenfunction(step_func):
+                                    step_result = await _astream_partials(ctx, step_func(*args, **kwargs, **_resource_kwargs(resources, kwargs)))
+                                else:
+                                    step_result = await step_func(*args, **kwargs, **_resource_kwargs(resources, kwargs))  # Run step
+                                _save_step(ctx, checkpoint_key, step_result)
+                        except Exception as e:
+                            if not await _write_status(ctx, _fail_attempt, ctx, step_name, step_seq, attempt, meter.stop(), e, retries, retry_exceptions):
+                                raise StepExpection(
+                                    step_name=step_name,
+                                    error=e,
+                                ) from e
+                            await asyncio.sleep(_retry_delay(backoff, attempt))
+                            attempt += 1
+                            _check_cancelled(ctx)
+                            await _write_status(ctx, ctx.writer.retry_step, step_seq, StartJobStep(name=step_name, description=step_description, attempt=attempt))
+                        else:
+                            logger.info("Step %s completed", step_name)
+                            await _write_status(ctx, ctx.writer.end_step, step_seq, FinishJobStep(metrics=meter.stop(), attempt=attempt))
+                            return step_result
+            wrapper = async_wrapper
+        else:
+            @wraps(step_func)
+            def sync_wrapper(*args, **kwargs) -> Any:
+                # Get shared context
+                ctx = get_context()
+                _check_cancelled(ctx)
+
+                # Log step start
+                logger.info("Starting step: %s", step_name)
+                step_seq = ctx.writer.start_step(StartJobStep(name=step_name, description=step_description))
+                with log_fields(step=step_seq, step_name=step_name):
+                    attempt = 0
+                    while True:
+                        meter = StepMeter(gpu=settings.STEP_GPU_METRICS)
+                        try:
+                            checkpoint_key, restored, step_result = _restore_step(ctx, step_id, checkpoint, args, kwargs)
+                            if restored:
+                                logger.info("Step %s restored from checkpoint", step_name)
+                            else:
+                                step_result = step_func(*args, **kwargs, **_resource_kwargs(resources, kwargs))  # Run step
+                                if inspect.isgenerator(step_result):
+                                    step_result = _stream_partials(ctx, step_result)
+                                _save_step(ctx, checkpoint_key, step_result)
+                        except Exception as e:
+                            if not _fail_attempt(ctx, step_name, step_seq, attempt, meter.stop(), e, retries, retry_exceptions):
+                                raise StepExpection(
+                                    step_name=step_name,
+                                    error=e,
+                                ) from e
+                            time.sleep(_retry_delay(backoff, attempt))
+                            attempt += 1
+                            _check_cancelled(ctx)
+                            ctx.writer.retry_step(step_seq, StartJobStep(name=step_name, description=step_description, attempt=attempt))
+                        else:
+                            logger.info("Step %s completed", step_name)
+                            ctx.writer.end_step(step_seq, FinishJobStep(metrics=meter.stop(), attempt=attempt))
+                            return step_result
+            wrapper = sync_wrapper
         # Add metadata to the wrapper
         wrapper.step_name = step_name  # type: ignore
         wrapper.step_description = step_description  # type: ignore
+        wrapper.step_checkpoint = checkpoint  # type: ignore
+        wrapper.step_resources = resources  # type: ignore
+        wrapper.step_retries = retries  # type: ignore
         return wrapper
     return decorator
+
+
+def run_task_pipeline(task_pipeline: TaskWithJobIdType, job_id: str, parameters: BaseParameters, resume: bool = False) -> BaseResult | None:
+    """Run a task pipeline from synchronous code, in a new event loop if the task is a coroutine
+    function."""
+    if inspect.iscoroutinefunction(task_pipeline):
+        return asyncio.run(task_pipeline(job_id, parameters, resume=resume))
+    return task_pipeline(job_id, parameters, resume=resume)
+
+
+def run_batch_task(task_pipeline: TaskWithJobIdType, batch_task: BatchTaskType, job_ids: list[str], parameters: list[BaseParameters]) -> list[BaseResult | None]:
+    """
+    Run the batched function of a task once for several jobs. Each job gets its own status
+    updates, but there is no job context while the batch runs, so `batch_task` can not call steps.
+
+    Parameters:
+    -----------
+    task_pipeline: TaskWithJobIdType
+        The decorated task, for its name and ID.
+    batch_task: BatchTaskType
+        Function taking the list of parameters and returning the results in the same order.
+    job_ids: list[str]
+        The job ID of each instance.
+    parameters: list[BaseParameters]
+        The parameters of each instance.
+
+    Returns:
+    --------
+    list[BaseResult | None]
+        The result of each job, `None` for the failed ones.
+    """
+    task_name = task_pipeline.task_name  # type: ignore
+    task_id = task_pipeline.task_id  # type: ignore
+    contexts: list[_Context | None] = []
+    for job_id, instance in zip(job_ids, parameters):
+        try:
+            contexts.append(_start_job(job_id, task_id, task_name, instance, False))
+        except JobCancelled:
+            contexts.append(None)
+        except Exception as e:
+            logger.error("Job %s of task %s could not start: %s", job_id, task_name, e)
+            contexts.append(None)
+    started = [instance for ctx, instance in zip(contexts, parameters) if ctx is not None]
+    if not started:
+        return [None] * len(parameters)
+
+    try:
+        if inspect.iscoroutinefunction(batch_task):
+            batch_results = asyncio.run(batch_task(started))
+        else:
+            batch_results = batch_task(started)
+        if len(batch_results) != len(started):
+            raise ValueError(f"Batch task returned {len(batch_results)} results for {len(started)} instances")
+    except Exception as e:
+        job_updates: list[FailJob | CancelJob | FinishJob] = [_fail_job(task_name, e) for _ in started]
+    else:
+        job_updates = [FinishJob(result=result) for result in batch_results]
+
+    job_update_iter = iter(job_updates)
+    return [
+        _end_job(ctx, task_name, next(job_update_iter)) if ctx is not None else None
+        for ctx in contexts
+    ]
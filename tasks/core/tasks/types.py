@@ -1,4 +1,4 @@
-from typing import Any, Callable
+from typing import Any, Awaitable, Callable
 
 from pydantic import BaseModel
 
@@ -8,6 +8,10 @@ class StepExpection(Exception):
         self.step_name = step_name
         self.error = error
 
+
+class JobCancelled(Exception):
+    """Raised in a job whose cancellation was requested, by `check_cancelled` and before each step."""
+
 class BaseParameters(BaseModel):
     """Base parameters for a task."""
     ...
@@ -17,7 +21,8 @@ class BaseResult(BaseModel):
     ...
 
 
-TaskType = Callable[[BaseParameters], BaseResult]
-TaskWithJobIdType = Callable[[str, BaseParameters], BaseResult | None]
+TaskType = Callable[[BaseParameters], BaseResult | Awaitable[BaseResult]]
+TaskWithJobIdType = Callable[..., BaseResult | None | Awaitable[BaseResult | None]]
+BatchTaskType = Callable[[list[BaseParameters]], list[BaseResult] | Awaitable[list[BaseResult]]]
 StepType = Callable[..., Any]
 JobIDType = str
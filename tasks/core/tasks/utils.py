@@ -1,5 +1,115 @@
+import atexit
+import json
 import os
 import logging
+import queue
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Iterator
+
+if TYPE_CHECKING:
+    from logging.handlers import QueueListener
+
+TEXT_LOG_FORMAT = '%(asctime)s.%(msecs)03d | %(levelname)-8s | %(name)s | %(message)s'
+
+# Fields added to the log records of the current thread or asyncio task, like the job and step IDs
+_log_fields: ContextVar[dict[str, Any]] = ContextVar("tasks_log_fields", default={})
+
+_handler: logging.Handler | None = None
+_listener: "QueueListener | None" = None
+_handler_lock = threading.Lock()
+
+
+@contextmanager
+def log_fields(**fields: Any) -> Iterator[None]:
+    """Add fields to the log records of the current thread or asyncio task, until exit."""
+    token = _log_fields.set({**_log_fields.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_fields.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Attach the fields set with `log_fields` to the log records, as their `context`."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.context = _log_fields.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Format the log records as JSON lines, with the `severity` field read by Cloud Logging and the
+    fields of the record context."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "severity": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **getattr(record, "context", {}),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _ContextQueueHandler(logging.Handler):
+    """Queue handler leaving the formatting to the listener thread. Only the message is merged with
+    its arguments here, in case they are changed after the call."""
+
+    def __init__(self, records: queue.SimpleQueue) -> None:
+        super().__init__()
+        self.queue = records
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            record.msg = record.getMessage()
+            record.args = None
+            self.queue.put_nowait(record)
+        except Exception:
+            self.handleError(record)
+
+
+def _create_handler() -> logging.Handler:
+    """Create the handler shared by the loggers. With `LOG_FORMAT=json` the records are JSON lines,
+    and with `LOG_QUEUE` they are queued and written by a background thread."""
+    global _listener
+    stream_handler = logging.StreamHandler()
+    if os.getenv('LOG_FORMAT', 'text').lower() == 'json':
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(TEXT_LOG_FORMAT, datefmt='%H:%M:%S'))
+    handler: logging.Handler = stream_handler
+    if os.getenv('LOG_QUEUE', '').lower() in ('1', 'true', 'yes'):
+        # Imported only when used, it takes a noticeable part of the startup time
+        from logging.handlers import QueueListener
+
+        records: queue.SimpleQueue = queue.SimpleQueue()
+        _listener = QueueListener(records, stream_handler)
+        _listener.start()
+        # Write the queued records before exit
+        atexit.register(_listener.stop)
+        handler = _ContextQueueHandler(records)
+    handler.addFilter(ContextFilter())
+    return handler
+
+
+def _restart_listener() -> None:
+    """Start a listener in a forked process, the listener thread of the parent is not copied."""
+    global _listener
+    if _listener is not None:
+        from logging.handlers import QueueListener
+
+        _listener = QueueListener(_listener.queue, *_listener.handlers)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+os.register_at_fork(after_in_child=_restart_listener)
 
 
 def get_logger(module_name: str, func_name: str | None = None) -> logging.Logger:
@@ -8,6 +118,11 @@ def get_logger(module_name: str, func_name: str | None = None) -> logging.Logger
 
     2021-08-25 15:00:00,000 | INFO | workflows.hello_world.workflow | Starting Hello World Workflow
 
+    With `LOG_FORMAT=json` the messages are JSON lines with the job and step IDs of the running job,
+    and with `LOG_QUEUE=1` they are written by a background thread, so logging does not block the
+    steps. In hot paths, pass the arguments to the logger (`logger.debug("Step %s", name)`) so the
+    message is not formatted when the level is disabled.
+
     Parameters
     ----------
     module_name : str
@@ -16,6 +131,7 @@ def get_logger(module_name: str, func_name: str | None = None) -> logging.Logger
     -------
     logging.Logger
     """
+    global _handler
 
     # Create a logger for the module
     if func_name:
@@ -31,14 +147,10 @@ def get_logger(module_name: str, func_name: str | None = None) -> logging.Logger
 
     # Check if the logger has handlers already to prevent duplication
     if not logger.hasHandlers():
-        logger.setLevel(logging.INFO)
-        console_handler = logging.StreamHandler()
-        formatter = logging.Formatter(
-            '%(asctime)s.%(msecs)03d | %(levelname)-8s | %(name)s | %(message)s',
-            datefmt='%H:%M:%S'
-        )
-        console_handler.setFormatter(formatter)
-        logger.addHandler(console_handler)
+        with _handler_lock:
+            if _handler is None:
+                _handler = _create_handler()
+        logger.addHandler(_handler)
     return logger
 
 
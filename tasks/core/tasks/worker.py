@@ -0,0 +1,273 @@
+import os
+import queue
+import signal
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+
+from tasks.db import fail_unstarted_job
+from tasks.resources import load_eager_resources
+from tasks.tasks import run_task_pipeline
+from tasks.types import TaskWithJobIdType, BaseParameters, JobIDType
+from tasks.utils import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class QueuedJob:
+    """A job waiting in a queue, with its parameters in JSON format."""
+    job_id: JobIDType
+    parameters_json: str
+    resume: bool = False
+    receipt: int | None = None
+
+
+class JobQueue(ABC):
+    """Queue of jobs for the worker. A job taken with `get` must be acknowledged with `ack` once
+    done, or given back with `nack` to be taken again."""
+
+    @abstractmethod
+    def put(self, job_id: JobIDType, parameters_json: str, resume: bool = False) -> None:
+        """Add a job to the queue."""
+
+    @abstractmethod
+    def get(self, timeout: float) -> QueuedJob | None:
+        """Take the next job, waiting at most `timeout` seconds. Returns `None` if there is none."""
+
+    @abstractmethod
+    def ack(self, job: QueuedJob) -> None:
+        """Remove a job taken from the queue."""
+
+    @abstractmethod
+    def nack(self, job: QueuedJob) -> None:
+        """Give back a job taken from the queue."""
+
+    def release_claimed(self, older_than: float) -> int:
+        """Give back the jobs taken more than `older_than` seconds ago and never acknowledged, e.g.
+        by a killed worker, returns how many. Queues losing their jobs with the worker have none."""
+        return 0
+
+
+class InMemoryJobQueue(JobQueue):
+    """Job queue living in the worker process, for tests, benchmarks and embedding."""
+
+    def __init__(self) -> None:
+        self._queue: queue.Queue[QueuedJob] = queue.Queue()
+
+    def put(self, job_id: JobIDType, parameters_json: str, resume: bool = False) -> None:
+        self._queue.put(QueuedJob(job_id, parameters_json, resume))
+
+    def get(self, timeout: float) -> QueuedJob | None:
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def ack(self, job: QueuedJob) -> None:
+        pass
+
+    def nack(self, job: QueuedJob) -> None:
+        self._queue.put(job)
+
+
+class SQLiteJobQueue(JobQueue):
+    """
+    Job queue stored in a SQLite database, shared by the processes of the same machine. Taken jobs
+    are marked as claimed until acknowledged, so claimed jobs of a killed worker can be released with
+    `release_claimed`.
+
+    Parameters:
+    -----------
+    path: str
+        Path to the database file.
+    poll_interval: float
+        Seconds between two checks of the queue while waiting for a job.
+    """
+
+    def __init__(self, path: str, poll_interval: float = 0.1) -> None:
+        self.path = path
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                parameters_json TEXT NOT NULL,
+                resume INTEGER NOT NULL DEFAULT 0,
+                claimed_at REAL
+            )
+            """
+        )
+
+    def put(self, job_id: JobIDType, parameters_json: str, resume: bool = False) -> None:
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO jobs (job_id, parameters_json, resume) VALUES (?, ?, ?)",
+                (job_id, parameters_json, int(resume)),
+            )
+
+    def _claim(self) -> QueuedJob | None:
+        with self._lock:
+            rows = self._connection.execute(
+                """
+                UPDATE jobs SET claimed_at = ?
+                WHERE id = (SELECT id FROM jobs WHERE claimed_at IS NULL ORDER BY id LIMIT 1)
+                RETURNING id, job_id, parameters_json, resume
+                """,
+                (time.time(),),
+            ).fetchall()
+        if not rows:
+            return None
+        receipt, job_id, parameters_json, resume = rows[0]
+        return QueuedJob(job_id, parameters_json, bool(resume), receipt)
+
+    def get(self, timeout: float) -> QueuedJob | None:
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self._claim()
+            if job is not None or time.monotonic() >= deadline:
+                return job
+            time.sleep(min(self.poll_interval, max(deadline - time.monotonic(), 0)))
+
+    def ack(self, job: QueuedJob) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM jobs WHERE id = ?", (job.receipt,))
+
+    def nack(self, job: QueuedJob) -> None:
+        with self._lock:
+            self._connection.execute("UPDATE jobs SET claimed_at = NULL WHERE id = ?", (job.receipt,))
+
+    def release_claimed(self, older_than: float) -> int:
+        """Give back the jobs claimed more than `older_than` seconds ago, returns how many."""
+        with self._lock:
+            cursor = self._connection.execute(
+                "UPDATE jobs SET claimed_at = NULL WHERE claimed_at < ?",
+                (time.time() - older_than,),
+            )
+        return cursor.rowcount
+
+
+def get_job_queue(uri: str) -> JobQueue:
+    """
+    Get the job queue for a URI.
+
+    Parameters:
+    -----------
+    uri: str
+        `memory` for an in-process queue, or `sqlite://<path>` for a SQLite queue, e.g.
+        `sqlite:///tmp/tasks-queue.db`.
+
+    Returns:
+    --------
+    JobQueue
+        The job queue.
+    """
+    if uri == "memory":
+        return InMemoryJobQueue()
+    if uri.startswith("sqlite://"):
+        path = uri.removeprefix("sqlite://")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return SQLiteJobQueue(path)
+    raise ValueError(f"Unsupported job queue URI: {uri}")
+
+
+class Worker:
+    """
+    Long-running worker pulling jobs from a queue and running them with the task pipeline, keeping
+    the task module and its resources warm between jobs.
+
+    Parameters:
+    -----------
+    task_pipeline: TaskWithJobIdType
+        Task pipeline function.
+    parameters_model: type[BaseParameters]
+        Parameters model for the task.
+    job_queue: JobQueue
+        Queue to pull the jobs from.
+    concurrency: int
+        Maximum number of jobs running at the same time.
+    poll_interval: float
+        Maximum seconds to wait for a job before checking if the worker is draining.
+    claim_timeout: float | None
+        Seconds after which a job taken and never acknowledged, e.g. by a killed worker, is given
+        back to the queue. Checked on startup and then every `claim_timeout` seconds, `None` never
+        gives back jobs.
+    """
+
+    def __init__(self, task_pipeline: TaskWithJobIdType, parameters_model: type[BaseParameters], job_queue: JobQueue, concurrency: int = 1, poll_interval: float = 1.0, claim_timeout: float | None = None) -> None:
+        if concurrency < 1:
+            raise ValueError(f"Invalid concurrency: {concurrency}")
+        self.task_pipeline = task_pipeline
+        self.parameters_model = parameters_model
+        self.job_queue = job_queue
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.claim_timeout = claim_timeout
+        self._released_at: float | None = None
+        self._draining = threading.Event()
+        self._slots = threading.Semaphore(concurrency)
+
+    def drain(self) -> None:
+        """Stop taking jobs, `run` returns once the running jobs are done."""
+        if not self._draining.is_set():
+            logger.info("Draining worker")
+        self._draining.set()
+
+    def run(self) -> None:
+        """Pull and run jobs until drained."""
+        load_eager_resources()
+        logger.info("Worker started with concurrency %s", self.concurrency)
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="worker") as executor:
+            while not self._draining.is_set():
+                self._release_claimed()
+                if not self._slots.acquire(timeout=self.poll_interval):
+                    continue
+                job = self.job_queue.get(timeout=self.poll_interval)
+                if job is None:
+                    self._slots.release()
+                    continue
+                if self._draining.is_set():
+                    self.job_queue.nack(job)
+                    self._slots.release()
+                    break
+                future = executor.submit(self._run_job, job)
+                future.add_done_callback(self._job_done)
+        logger.info("Worker stopped")
+
+    def _release_claimed(self) -> None:
+        if self.claim_timeout is None:
+            return
+        now = time.monotonic()
+        if self._released_at is not None and now - self._released_at < self.claim_timeout:
+            return
+        self._released_at = now
+        released = self.job_queue.release_claimed(older_than=self.claim_timeout)
+        if released:
+            logger.warning("Released %s jobs claimed more than %s seconds ago", released, self.claim_timeout)
+
+    def _job_done(self, future: Future) -> None:
+        self._slots.release()
+
+    def _run_job(self, job: QueuedJob) -> None:
+        logger.info("Running job %s", job.job_id)
+        try:
+            parameters = self.parameters_model.model_validate_json(job.parameters_json)
+            run_task_pipeline(self.task_pipeline, job.job_id, parameters, resume=job.resume)
+        except Exception as e:
+            # The job status is written by the task, this is a job that could not start
+            logger.exception("Job %s could not run", job.job_id)
+            fail_unstarted_job(job.job_id, e)
+        finally:
+            self.job_queue.ack(job)
+
+    def install_signal_handlers(self) -> None:
+        """Drain the worker on SIGTERM and SIGINT."""
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda signum, frame: self.drain())
@@ -0,0 +1,305 @@
+import atexit
+import json
+import threading
+import time
+from typing import Any
+
+from pydantic import BaseModel
+
+from tasks.backends import JobBackend
+from tasks.models import (
+    JobStatus,
+    JobProgress,
+    JobProgressEvent,
+    JobPartialChunk,
+    JobMetrics,
+    JobStepMetrics,
+    StartJob,
+    FailJob,
+    CancelJob,
+    get_timestamp,
+    FinishJob,
+    StartJobStep,
+    FailJobStep,
+    FinishJobStep,
+)
+from tasks.payloads import dump_payload
+from tasks.utils import get_logger
+
+logger = get_logger(__name__)
+
+TERMINAL_STATUSES = (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED)
+
+
+class JobStatusWriter:
+    """
+    Write-behind writer for the status of a job.
+
+    Job updates are coalesced in memory, and step updates are appended as events to the job, keyed
+    by their sequence number. A step has one start and one end event per attempt, an update for a
+    step attempt that already has its event is ignored, so updates can be sent again safely. The
+    step metrics are rolled up in the `metrics` field of the job.
+    Pending changes are written in a single backend write at most once every `interval` seconds by a
+    background thread. Terminal updates and process exit flush synchronously. The job is never read
+    back and the step events are never rewritten.
+
+    Partial results are packed, at each write, into chunks of at most `partials_chunk_size` JSON
+    bytes appended to the job.
+
+    While the job runs, its `heartbeat_at` field is refreshed at least every `heartbeat_interval`
+    seconds, together with the other pending changes, so a reaper can fail the jobs whose process
+    died.
+
+    Parameters:
+    -----------
+    backend: JobBackend
+        Backend storing the job.
+    job_id: str
+        ID of the job.
+    interval: float
+        Minimum number of seconds between two writes. With `0` every update is written through.
+    partials_chunk_size: int
+        Maximum size of a chunk of partial results, in JSON bytes.
+    heartbeat_interval: float
+        Maximum number of seconds between two heartbeats of the running job. With `0` there are no
+        heartbeats.
+    """
+
+    def __init__(self, backend: JobBackend, job_id: str, interval: float, partials_chunk_size: int = 256 * 1024, heartbeat_interval: float = 0) -> None:
+        self.backend = backend
+        self.job_id = job_id
+        self.interval = interval
+        self.partials_chunk_size = partials_chunk_size
+        self.heartbeat_interval = heartbeat_interval
+        self._running = False
+        self._last_heartbeat = 0.0
+        self._pending: dict[str, Any] = {}
+        self._pending_events: list[JobProgressEvent] = []
+        self._pending_partials: list[tuple[Any, int]] = []
+        self._pending_chunks: list[JobPartialChunk] = []
+        self._steps: dict[int, tuple[str, str]] = {}
+        # Events recorded by step, attempt and status
+        self._step_events: set[tuple[int, int, JobStatus]] = set()
+        self._step_count = 0
+        self._event_count = 0
+        self._partial_count = 0
+        self._partial_chunk_count = 0
+        self._metrics = JobMetrics()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread: threading.Thread | None = None
+        if interval > 0 or heartbeat_interval > 0:
+            self._thread = threading.Thread(
+                target=self._run,
+                name=f"job-status-writer-{job_id}",
+                daemon=True,
+            )
+            self._thread.start()
+        atexit.register(self.close)
+
+    def update_job(self, job_update: StartJob | FailJob | CancelJob | FinishJob) -> None:
+        """Queue an update of the job status. Terminal updates are flushed immediately."""
+        if isinstance(job_update, StartJob):
+            fields = {
+                "status": job_update.status,
+                "started_at": job_update.started_at,
+                "heartbeat_at": job_update.started_at,
+                # Clear the end of a previous run when resuming
+                "completed_at": None,
+                "error_json_value": None,
+            }
+        elif isinstance(job_update, (FailJob, CancelJob, FinishJob)):
+            error = job_update.error if isinstance(job_update, FailJob) else None
+            fields = {
+                "status": job_update.status,
+                "completed_at": job_update.completed_at,
+                "result_json_value": None,
+                "result_ref": None,
+                "error_json_value": error.model_dump_json() if error else None,
+            }
+            if job_update.result:
+                # Large results are offloaded to the payload store
+                fields.update(dump_payload(self.job_id, "result", job_update.result.model_dump_json()))
+        else:
+            raise ValueError(f"Invalid job update: {job_update}")
+        with self._lock:
+            self._pending.update(fields)
+            self._running = job_update.status not in TERMINAL_STATUSES
+            self._last_heartbeat = time.monotonic()
+        if job_update.status in TERMINAL_STATUSES or self.interval <= 0:
+            self.flush()
+
+    def resume(self, progress: JobProgress) -> None:
+        """Continue the step, event and partial results sequences of a resumed job."""
+        with self._lock:
+            self._step_count = max(self._step_count, progress.step_count)
+            self._event_count = max(self._event_count, progress.event_count)
+            self._partial_count = max(self._partial_count, progress.partial_count)
+            self._partial_chunk_count = max(self._partial_chunk_count, progress.partial_chunk_count)
+
+    def start_step(self, job_step_update: StartJobStep) -> int:
+        """Queue the start of a step and return its sequence number in the job."""
+        with self._lock:
+            step = self._step_count
+            self._step_count += 1
+            self._steps[step] = (job_step_update.name, job_step_update.description)
+            self._append_event(step, job_step_update.status, job_step_update.started_at, attempt=job_step_update.attempt)
+        if self.interval <= 0:
+            self.flush()
+        return step
+
+    def retry_step(self, step: int, job_step_update: StartJobStep) -> None:
+        """Queue the start of a new attempt of the step with the sequence number `step`."""
+        with self._lock:
+            self._append_event(step, job_step_update.status, job_step_update.started_at, attempt=job_step_update.attempt)
+        if self.interval <= 0:
+            self.flush()
+
+    def end_step(self, step: int, job_step_update: FailJobStep | FinishJobStep) -> None:
+        """Queue the end of the step with the sequence number `step`."""
+        if not (isinstance(job_step_update, FailJobStep) or isinstance(job_step_update, FinishJobStep)):
+            raise ValueError(f"Invalid job step update: {job_step_update}")
+        error = job_step_update.error if isinstance(job_step_update, FailJobStep) else None
+        with self._lock:
+            appended = self._append_event(
+                step,
+                job_step_update.status,
+                job_step_update.completed_at,
+                job_step_update.metrics,
+                attempt=job_step_update.attempt,
+                error=error,
+            )
+            if appended and job_step_update.metrics is not None:
+                self._add_metrics(step, job_step_update.metrics)
+        if self.interval <= 0:
+            self.flush()
+
+    def append_partial(self, item: Any) -> None:
+        """Queue a partial result of the job, a Pydantic model or a JSON compatible value."""
+        value = item.model_dump(mode="json") if isinstance(item, BaseModel) else item
+        # With the separator in the list of items
+        size = len(json.dumps(value)) + 1
+        if size > self.partials_chunk_size:
+            raise ValueError(f"Partial result of {size} bytes is larger than the chunk size of {self.partials_chunk_size} bytes")
+        with self._lock:
+            self._pending_partials.append((value, size))
+            self._partial_count += 1
+        if self.interval <= 0:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the pending events and job updates, if any, in a single backend write."""
+        with self._flush_lock:
+            with self._lock:
+                self._pack_partials()
+                if not self._pending and not self._pending_events and not self._pending_chunks:
+                    return
+                if self._running:
+                    # Every write of the running job is also a heartbeat
+                    self._pending["heartbeat_at"] = get_timestamp()
+                    self._last_heartbeat = time.monotonic()
+                fields, self._pending = self._pending, {}
+                events, self._pending_events = self._pending_events, []
+                chunks, self._pending_chunks = self._pending_chunks, []
+                if events or chunks:
+                    fields["progress"] = JobProgress(
+                        step_count=self._step_count,
+                        event_count=self._event_count,
+                        partial_count=self._partial_count,
+                        partial_chunk_count=self._partial_chunk_count,
+                    ).model_dump()
+                if events:
+                    fields["metrics"] = self._metrics.model_dump()
+            try:
+                self.backend.write_job(self.job_id, fields, events, chunks)
+            except Exception:
+                # Keep what was not written so the next flush retries it, unless updated meanwhile.
+                # Events and chunks are keyed by their sequence number, writing them again is
+                # harmless.
+                with self._lock:
+                    self._pending = {**fields, **self._pending}
+                    self._pending_events = events + self._pending_events
+                    self._pending_chunks = chunks + self._pending_chunks
+                raise
+
+    def close(self) -> None:
+        """Stop the background thread and flush the pending updates."""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        atexit.unregister(self.close)
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _add_metrics(self, step: int, metrics: JobStepMetrics) -> None:
+        rollup = self._metrics
+        rollup.step_wall_time += metrics.wall_time
+        rollup.step_cpu_time += metrics.cpu_time
+        rollup.peak_rss_delta = max(rollup.peak_rss_delta, metrics.peak_rss_delta)
+        if metrics.gpu_peak_memory is not None:
+            rollup.gpu_peak_memory = max(rollup.gpu_peak_memory or 0, metrics.gpu_peak_memory)
+        if rollup.slowest_step is None or metrics.wall_time > rollup.slowest_step_wall_time:
+            rollup.slowest_step = step
+            rollup.slowest_step_name = self._steps[step][0]
+            rollup.slowest_step_wall_time = metrics.wall_time
+
+    def _pack_partials(self) -> None:
+        """Pack the pending partial results into chunks, sealed from now on."""
+        offset = self._partial_count - len(self._pending_partials)
+        chunk: JobPartialChunk | None = None
+        chunk_size = 0
+        for value, size in self._pending_partials:
+            if chunk is None or chunk_size + size > self.partials_chunk_size:
+                chunk = JobPartialChunk(seq=self._partial_chunk_count, offset=offset, end=offset, items=[])
+                self._partial_chunk_count += 1
+                self._pending_chunks.append(chunk)
+                chunk_size = 0
+            chunk.items.append(value)
+            chunk.end += 1
+            chunk_size += size
+            offset += 1
+        self._pending_partials = []
+
+    def _append_event(self, step: int, status: JobStatus, timestamp: str, metrics: JobStepMetrics | None = None, attempt: int = 0, error: str | None = None) -> bool:
+        """Queue a step event, unless the step attempt already has an event with this status.
+        Returns if the event was queued."""
+        key = (step, attempt, status)
+        if key in self._step_events:
+            logger.debug("Step %d attempt %d of job %s is already %s", step, attempt, self.job_id, status)
+            return False
+        self._step_events.add(key)
+        name, description = self._steps[step]
+        self._pending_events.append(
+            JobProgressEvent(
+                seq=self._event_count,
+                step=step,
+                name=name,
+                description=description,
+                status=status,
+                timestamp=timestamp,
+                metrics=metrics,
+                attempt=attempt,
+                error=error,
+            )
+        )
+        self._event_count += 1
+        return True
+
+    def _beat(self) -> None:
+        """Queue a heartbeat if the running job has not written anything for `heartbeat_interval`
+        seconds."""
+        with self._lock:
+            if self._running and time.monotonic() - self._last_heartbeat >= self.heartbeat_interval:
+                self._pending["heartbeat_at"] = get_timestamp()
+
+    def _run(self) -> None:
+        wait = min(value for value in (self.interval, self.heartbeat_interval) if value > 0)
+        while not self._closed.wait(wait):
+            try:
+                if self.heartbeat_interval > 0:
+                    self._beat()
+                self.flush()
+            except Exception:
+                logger.exception("Failed to write the status of job %s", self.job_id)
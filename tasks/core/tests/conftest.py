@@ -0,0 +1,32 @@
+import pytest
+
+from tasks import db
+from tasks.backends import InMemoryJobBackend, JobBackend, SQLiteJobBackend
+from tasks.config import settings
+from tasks.resources import Resource
+
+
+@pytest.fixture(autouse=True)
+def test_settings(monkeypatch):
+    """Write through, without heartbeats, checkpoints or payload store, and poll the
+    cancellations often."""
+    monkeypatch.setattr(settings, "STATUS_WRITE_INTERVAL", 0)
+    monkeypatch.setattr(settings, "HEARTBEAT_INTERVAL", 0)
+    monkeypatch.setattr(settings, "CANCEL_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(settings, "CHECKPOINT_STORE", None)
+    monkeypatch.setattr(settings, "PAYLOAD_STORE", None)
+    return settings
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path, monkeypatch) -> JobBackend:
+    """The job backend of the process, in memory or in a SQLite file."""
+    if request.param == "memory":
+        job_backend: JobBackend = InMemoryJobBackend()
+        monkeypatch.setattr(settings, "JOBS_BACKEND", "memory")
+    else:
+        path = tmp_path / "jobs.db"
+        job_backend = SQLiteJobBackend(str(path))
+        monkeypatch.setattr(settings, "JOBS_BACKEND", f"sqlite://{path}")
+    monkeypatch.setattr(db, "_job_backend", Resource(lambda: job_backend, "jobs_backend"))
+    return job_backend
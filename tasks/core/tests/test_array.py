@@ -0,0 +1,160 @@
+import json
+import time
+
+import pytest
+
+from tasks import BaseParameters, BaseResult, step, task
+from tasks.array import get_child_job_id, get_shard_indexes, run_array_shard
+from tasks.models import JobStatus
+from tasks.reaper import reap_stale_jobs
+
+OLD_HEARTBEAT = "2024-01-01T00:00:00+00:00"
+
+failing = set()
+
+
+class Parameters(BaseParameters):
+    value: int
+
+
+class Result(BaseResult):
+    value: int
+
+
+@step(name="Double", description="Double the value, failing for the values asked to")
+def double(value: int) -> int:
+    if value in failing:
+        raise RuntimeError("Failed")
+    return value * 2
+
+
+@task(name="Array", description="Double the value")
+def array_task(parameters: Parameters) -> Result:
+    return Result(value=double(parameters.value))
+
+
+@pytest.fixture(autouse=True)
+def no_failures():
+    failing.clear()
+
+
+def _create_array_job(backend, size: int, task_count: int, job_id: str = "array") -> str:
+    backend.create_job(job_id, {
+        "task_id": "array_task",
+        "status": JobStatus.CREATED,
+        "user_id": "user@example.com",
+        "parameters_json_value": json.dumps([{"value": index} for index in range(size)]),
+        "array": {"size": size, "task_count": task_count},
+    })
+    return job_id
+
+
+def _run_shards(job_id: str, task_count: int, resume: bool = False) -> None:
+    for task_index in range(task_count):
+        run_array_shard(array_task, Parameters, job_id, resume=resume, task_index=task_index, task_count=task_count)
+
+
+def _counts(job: dict) -> tuple[int, int, int]:
+    return job["array"]["completed"], job["array"]["failed"], job["array"]["cancelled"]
+
+
+def test_children_are_dealt_in_turn():
+    assert list(get_shard_indexes(8, 0, 3)) == [0, 3, 6]
+    assert list(get_shard_indexes(8, 2, 3)) == [2, 5]
+    with pytest.raises(ValueError):
+        get_shard_indexes(8, 3, 3)
+
+
+def test_array_job_runs_its_children(backend):
+    job_id = _create_array_job(backend, size=5, task_count=2)
+
+    _run_shards(job_id, task_count=2)
+
+    job = backend.get_job(job_id)
+    assert job["status"] == JobStatus.COMPLETED
+    assert _counts(job) == (5, 0, 0)
+    for index in range(5):
+        child = backend.get_job(get_child_job_id(job_id, index))
+        assert child["parent_id"] == job_id
+        assert json.loads(child["result_json_value"]) == {"value": index * 2}
+
+
+def test_failed_children_are_resumed(backend):
+    job_id = _create_array_job(backend, size=8, task_count=3)
+    failing.add(3)
+
+    _run_shards(job_id, task_count=3)
+
+    job = backend.get_job(job_id)
+    assert job["status"] == JobStatus.FAILED
+    assert _counts(job) == (7, 1, 0)
+    assert json.loads(job["error_json_value"])["code"] == "ArrayChildFailed"
+
+    failing.clear()
+    _run_shards(job_id, task_count=3, resume=True)
+
+    job = backend.get_job(job_id)
+    assert job["status"] == JobStatus.COMPLETED
+    assert _counts(job) == (8, 0, 0)
+
+
+def test_cancelled_child_is_counted(backend):
+    job_id = _create_array_job(backend, size=4, task_count=1)
+    backend.create_job(get_child_job_id(job_id, 2), {"task_id": "array_task", "status": JobStatus.CANCELLED, "parent_id": job_id})
+
+    _run_shards(job_id, task_count=1)
+
+    job = backend.get_job(job_id)
+    # Cancelled children do not fail the array job
+    assert job["status"] == JobStatus.COMPLETED
+    assert _counts(job) == (3, 0, 1)
+
+
+def test_shard_run_twice_is_counted_once(backend):
+    job_id = _create_array_job(backend, size=3, task_count=1)
+
+    _run_shards(job_id, task_count=1)
+    _run_shards(job_id, task_count=1)
+
+    job = backend.get_job(job_id)
+    assert job["status"] == JobStatus.COMPLETED
+    assert _counts(job) == (3, 0, 0)
+
+
+def test_array_job_of_lost_shards_is_settled(backend):
+    job_id = _create_array_job(backend, size=6, task_count=2)
+    # The second task instance is lost before it runs
+    run_array_shard(array_task, Parameters, job_id, task_index=0, task_count=2)
+    assert backend.get_job(job_id)["status"] == JobStatus.RUNNING
+    time.sleep(0.01)
+
+    assert reap_stale_jobs(backend, timeout=0) == [job_id]
+
+    job = backend.get_job(job_id)
+    assert job["status"] == JobStatus.FAILED
+    assert _counts(job) == (3, 3, 0)
+    assert json.loads(job["error_json_value"])["additional_info"] == {"failed": 3, "lost": 3}
+
+
+def test_reaped_child_is_counted(backend):
+    job_id = _create_array_job(backend, size=3, task_count=1)
+    # The child was left running by a lost task instance
+    child_id = get_child_job_id(job_id, 1)
+    backend.create_job(child_id, {"task_id": "array_task", "status": JobStatus.RUNNING, "heartbeat_at": OLD_HEARTBEAT, "parent_id": job_id})
+
+    _run_shards(job_id, task_count=1)
+
+    job = backend.get_job(job_id)
+    assert job["status"] == JobStatus.RUNNING
+    assert _counts(job) == (2, 0, 0)
+
+    assert reap_stale_jobs(backend, timeout=60) == [child_id]
+
+    job = backend.get_job(job_id)
+    assert job["status"] == JobStatus.FAILED
+    assert _counts(job) == (2, 1, 0)
+
+
+def test_missing_array_job_is_rejected(backend):
+    with pytest.raises(ValueError, match="not found"):
+        run_array_shard(array_task, Parameters, "array", task_index=0, task_count=1)
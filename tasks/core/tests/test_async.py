@@ -0,0 +1,119 @@
+import asyncio
+import json
+import time
+
+from tasks import BaseParameters, BaseResult, step, task
+from tasks.models import JobStatus
+from tasks.tasks import run_task_pipeline
+
+
+class Parameters(BaseParameters):
+    value: int
+
+
+class Result(BaseResult):
+    value: int
+
+
+@step(name="Async Double", description="Double the value")
+async def async_double(value: int) -> int:
+    await asyncio.sleep(0)
+    return value * 2
+
+
+@step(name="Add One", description="Add one to the value")
+def add_one(value: int) -> int:
+    return value + 1
+
+
+@step(name="Async Fail", description="Fail on negative values")
+async def async_fail(value: int) -> int:
+    if value < 0:
+        raise ValueError("Negative value")
+    return value
+
+
+@step(name="Async Wait", description="Wait on the event loop")
+async def async_wait(value: int) -> int:
+    await asyncio.sleep(0.05)
+    return value
+
+
+# Seconds between two ticks of the event loop while the steps are gathered
+loop_gaps: list[float] = []
+
+
+@task(name="Async Gather", description="Wait in steps gathered with a ticker")
+async def async_gather(parameters: Parameters) -> Result:
+    async def tick() -> None:
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(0.005)
+            now = time.monotonic()
+            loop_gaps.append(now - last)
+            last = now
+
+    ticker = asyncio.create_task(tick())
+    values = await asyncio.gather(*(async_wait(parameters.value) for _ in range(3)))
+    ticker.cancel()
+    return Result(value=sum(values))
+
+
+@task(name="Async Task", description="Double the value and add one")
+async def async_task(parameters: Parameters) -> Result:
+    value = await async_double(parameters.value)
+    value = await async_fail(value)
+    return Result(value=add_one(value))
+
+
+def test_async_task_runs_its_steps(backend):
+    result = asyncio.run(async_task("job", Parameters(value=2)))
+
+    assert result == Result(value=5)
+    job = backend.get_job("job")
+    assert job["status"] == JobStatus.COMPLETED
+    assert [event.name for event in backend.get_job_events("job")[::2]] == ["Async Double", "Async Fail", "Add One"]
+
+
+def test_async_step_failure_fails_the_job(backend):
+    result = asyncio.run(async_task("job", Parameters(value=-1)))
+
+    assert result is None
+    job = backend.get_job("job")
+    assert job["status"] == JobStatus.FAILED
+    error = json.loads(job["error_json_value"])
+    assert error["code"] == "ValueError"
+    assert error["additional_info"] == {"step": "Async Fail"}
+
+
+def test_async_jobs_run_concurrently_in_one_loop(backend):
+    async def run_all():
+        return await asyncio.gather(*(async_task(f"job-{i}", Parameters(value=i)) for i in range(5)))
+
+    results = asyncio.run(run_all())
+
+    assert results == [Result(value=i * 2 + 1) for i in range(5)]
+    assert all(backend.get_job(f"job-{i}")["status"] == JobStatus.COMPLETED for i in range(5))
+
+
+def test_async_task_runs_from_sync_code(backend):
+    assert run_task_pipeline(async_task, "job", Parameters(value=1)) == Result(value=3)
+
+
+def test_write_through_does_not_block_the_event_loop(backend, monkeypatch):
+    write_job = backend.write_job
+
+    def slow_write_job(*args, **kwargs):
+        time.sleep(0.1)
+        return write_job(*args, **kwargs)
+
+    monkeypatch.setattr(backend, "write_job", slow_write_job)
+
+    loop_gaps.clear()
+
+    assert asyncio.run(async_gather("job", Parameters(value=1))) == Result(value=3)
+
+    # The loop is never blocked for a whole write
+    assert max(loop_gaps) < 0.1
+    assert backend.get_job("job")["status"] == JobStatus.COMPLETED
+    assert len(backend.get_job_events("job")) == 6
@@ -0,0 +1,117 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from tasks.backends import SQLiteJobBackend
+from tasks.models import JobProgressEvent, JobStatus
+
+
+def _event(seq: int, status: JobStatus = JobStatus.RUNNING) -> JobProgressEvent:
+    return JobProgressEvent(seq=seq, step=0, name="Step", description="A step", status=status, timestamp="2024-01-01T00:00:00")
+
+
+def test_missing_job_is_none(backend):
+    assert backend.get_job("job") is None
+    assert backend.get_job_events("job") == []
+    assert backend.get_job_partials("job") == []
+
+
+def test_job_fields_are_updated(backend):
+    backend.create_job("job", {"status": JobStatus.CREATED, "progress": {"step_count": 0}})
+
+    backend.write_job("job", {"status": JobStatus.RUNNING}, [])
+
+    assert backend.get_job("job") == {"status": JobStatus.RUNNING, "progress": {"step_count": 0}}
+
+
+def test_writing_a_missing_job_fails(backend):
+    with pytest.raises(ValueError, match="not found"):
+        backend.write_job("job", {"status": JobStatus.RUNNING}, [_event(0)])
+
+
+def test_returned_job_is_a_copy(backend):
+    backend.create_job("job", {"progress": {"step_count": 0}})
+
+    backend.get_job("job")["progress"]["step_count"] = 1
+
+    assert backend.get_job("job")["progress"]["step_count"] == 0
+
+
+def test_events_are_read_after_a_sequence_number(backend):
+    backend.create_job("job", {})
+    backend.write_job("job", {}, [_event(0), _event(1)])
+    backend.write_job("job", {}, [_event(2, JobStatus.COMPLETED)])
+
+    assert [event.seq for event in backend.get_job_events("job")] == [0, 1, 2]
+    assert [event.seq for event in backend.get_job_events("job", after=1)] == [2]
+    assert backend.get_job_events("job")[2].status == JobStatus.COMPLETED
+
+
+def test_update_is_atomic(backend):
+    backend.create_job("job", {"count": 0})
+
+    def increment(job):
+        return {"count": job["count"] + 1}
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: backend.update_job("job", increment), range(50)))
+
+    assert backend.get_job("job")["count"] == 50
+
+
+def test_update_returning_nothing_keeps_the_job(backend):
+    backend.create_job("job", {"count": 0})
+
+    assert backend.update_job("job", lambda job: None) is None
+    assert backend.get_job("job") == {"count": 0}
+
+
+def test_updating_a_missing_job_fails(backend):
+    with pytest.raises(ValueError, match="not found"):
+        backend.update_job("job", lambda job: {"count": 1})
+
+
+def test_failing_update_changes_nothing(backend):
+    backend.create_job("job", {"count": 0})
+
+    def fail(job):
+        raise RuntimeError("Update failed")
+
+    with pytest.raises(RuntimeError):
+        backend.update_job("job", fail)
+    # The backend is still usable
+    backend.update_job("job", lambda job: {"count": 1})
+    assert backend.get_job("job") == {"count": 1}
+
+
+def test_job_changes_are_watched(backend):
+    backend.create_job("job", {"status": JobStatus.CREATED})
+    changed = threading.Event()
+    seen = []
+
+    def on_change(job):
+        seen.append(job["status"])
+        if job["status"] == JobStatus.COMPLETED:
+            changed.set()
+
+    stop = backend.watch_job("job", on_change, interval=0.01)
+    try:
+        backend.write_job("job", {"status": JobStatus.COMPLETED}, [])
+        assert changed.wait(timeout=5)
+    finally:
+        stop()
+    assert seen[-1] == JobStatus.COMPLETED
+
+
+def test_sqlite_backend_is_shared_by_the_processes_of_a_machine(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    writer = SQLiteJobBackend(path)
+    reader = SQLiteJobBackend(path)
+
+    writer.create_job("job", {"status": JobStatus.CREATED})
+    reader.update_job("job", lambda job: {"status": JobStatus.RUNNING})
+    writer.write_job("job", {}, [_event(0)])
+
+    assert writer.get_job("job")["status"] == JobStatus.RUNNING
+    assert [event.seq for event in reader.get_job_events("job")] == [0]
@@ -0,0 +1,144 @@
+import asyncio
+import json
+
+import pytest
+
+from tasks import BaseParameters, BaseResult, batched, task
+from tasks.batching import MicroBatcher
+from tasks.models import JobStatus
+from tasks.tasks import run_batch_task
+
+
+class Parameters(BaseParameters):
+    value: int
+
+
+class Result(BaseResult):
+    value: int
+
+
+@task(name="Batched Double", description="Double the value")
+def batched_double(parameters: Parameters) -> Result:
+    return Result(value=parameters.value * 2)
+
+
+@batched(max_batch_size=4, max_wait=0.05)
+def double_batch(parameters: list[Parameters]) -> list[Result]:
+    return [Result(value=instance.value * 2) for instance in parameters]
+
+
+def test_concurrent_items_are_batched():
+    batches = []
+
+    async def double(items):
+        batches.append(items)
+        return [item * 2 for item in items]
+
+    async def submit_all():
+        batcher = MicroBatcher(double, max_batch_size=4, max_wait=0.05)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(10)))
+
+    results = asyncio.run(submit_all())
+
+    assert results == [i * 2 for i in range(10)]
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+    assert sum(batches, []) == list(range(10))
+
+
+def test_batch_failure_fails_its_items():
+    async def fail(items):
+        raise RuntimeError("Batch failed")
+
+    async def submit_all():
+        batcher = MicroBatcher(fail, max_batch_size=4, max_wait=0.01)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(2)), return_exceptions=True)
+
+    results = asyncio.run(submit_all())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_wrong_number_of_results_fails_the_batch():
+    async def drop_one(items):
+        return items[1:]
+
+    async def submit_all():
+        batcher = MicroBatcher(drop_one, max_batch_size=2, max_wait=0.05)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(2)), return_exceptions=True)
+
+    results = asyncio.run(submit_all())
+
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_next_batch_is_collected_while_a_batch_runs():
+    async def run():
+        release = asyncio.Event()
+        started = []
+
+        async def wait(items):
+            started.append(items)
+            await release.wait()
+            return items
+
+        batcher = MicroBatcher(wait, max_batch_size=2, max_wait=0.01, max_concurrency=2)
+        first = [asyncio.create_task(batcher.submit(i)) for i in range(2)]
+        while len(started) < 1:
+            await asyncio.sleep(0.005)
+        second = [asyncio.create_task(batcher.submit(i)) for i in range(2, 4)]
+        # The second batch starts while the first one is still running
+        while len(started) < 2:
+            await asyncio.sleep(0.005)
+        release.set()
+        return started, await asyncio.gather(*first, *second)
+
+    started, results = asyncio.run(asyncio.wait_for(run(), 5))
+
+    assert started == [[0, 1], [2, 3]]
+    assert results == [0, 1, 2, 3]
+
+
+@pytest.mark.parametrize("max_batch_size,max_concurrency", [(0, 1), (1, 0)])
+def test_invalid_limits_are_rejected(max_batch_size, max_concurrency):
+    async def identity(items):
+        return items
+
+    with pytest.raises(ValueError):
+        MicroBatcher(identity, max_batch_size=max_batch_size, max_wait=0.01, max_concurrency=max_concurrency)
+
+
+def test_batched_declares_the_batch_limits():
+    assert double_batch.max_batch_size == 4
+    assert double_batch.max_wait == 0.05
+
+
+def test_batch_task_ends_each_job(backend):
+    results = run_batch_task(batched_double, double_batch, ["job-0", "job-1"], [Parameters(value=1), Parameters(value=2)])
+
+    assert results == [Result(value=2), Result(value=4)]
+    for job_id, value in (("job-0", 2), ("job-1", 4)):
+        job = backend.get_job(job_id)
+        assert job["status"] == JobStatus.COMPLETED
+        assert json.loads(job["result_json_value"]) == {"value": value}
+
+
+def test_batch_task_failure_fails_each_job(backend):
+    def fail(parameters: list[Parameters]) -> list[Result]:
+        raise RuntimeError("Batch failed")
+
+    results = run_batch_task(batched_double, fail, ["job-0", "job-1"], [Parameters(value=1), Parameters(value=2)])
+
+    assert results == [None, None]
+    for job_id in ("job-0", "job-1"):
+        job = backend.get_job(job_id)
+        assert job["status"] == JobStatus.FAILED
+        assert json.loads(job["error_json_value"])["code"] == "RuntimeError"
+
+
+def test_batch_task_skips_the_jobs_that_can_not_start(backend):
+    backend.create_job("job-0", {"task_id": "batched_double", "status": JobStatus.COMPLETED})
+
+    results = run_batch_task(batched_double, double_batch, ["job-0", "job-1"], [Parameters(value=1), Parameters(value=2)])
+
+    assert results == [None, Result(value=4)]
+    assert backend.get_job("job-0")["status"] == JobStatus.COMPLETED
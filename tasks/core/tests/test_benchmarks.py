@@ -0,0 +1,49 @@
+import pytest
+
+from benchmarks.runtime import SCALING_STEPS, compare, run_benchmarks
+from tasks.models import JobProgressEvent, JobStatus
+
+
+def _event(seq: int) -> JobProgressEvent:
+    return JobProgressEvent(seq=seq, step=0, name="Step", description="A step", status=JobStatus.RUNNING, timestamp="2024-01-01T00:00:00")
+
+
+def test_slower_results_are_regressions():
+    baseline = {"step_overhead": 10e-6, "job_overhead": 100e-6}
+
+    regressions = compare({"step_overhead": 13e-6, "job_overhead": 110e-6, "setup_context": 1e-6}, baseline, tolerance=0.2)
+
+    assert len(regressions) == 1
+    assert regressions[0].startswith("step_overhead: 13.0us > 10.0us")
+
+
+def test_benchmarks_measure_the_runtime(backend):
+    results = run_benchmarks(steps=2, repeat=1)
+
+    assert {"step_overhead", "async_step_overhead", "step_overhead_write_through", "setup_context", "create_or_check_job", "job_overhead"} <= set(results)
+    assert all(f"job_{count}_steps" in results for count in SCALING_STEPS)
+    assert all(value >= 0 for value in results.values())
+
+
+def test_fake_firestore_serves_the_job_backend(monkeypatch):
+    pytest.importorskip("grpc")
+    firestore = pytest.importorskip("google.cloud.firestore")
+    from benchmarks.firestore_fake import FakeFirestore
+    from tasks.backends import FirestoreJobBackend
+
+    with FakeFirestore() as host:
+        monkeypatch.setenv("FIRESTORE_EMULATOR_HOST", host)
+        client = firestore.Client(project="test")
+        backend = FirestoreJobBackend(client)
+
+        backend.create_job("job", {"status": JobStatus.RUNNING, "heartbeat_at": "2024-01-01T00:00:00+00:00", "count": 0})
+        backend.write_job("job", {"count": 1}, [_event(0), _event(1)])
+        backend.update_job("job", lambda job: {"count": job["count"] + 1})
+
+        assert backend.get_job("job")["count"] == 2
+        assert backend.get_job("missing") is None
+        assert [event.seq for event in backend.get_job_events("job", after=0)] == [1]
+        assert backend.get_stale_jobs("2025-01-01T00:00:00+00:00") == ["job"]
+        assert backend.fail_stale_job("job", "2025-01-01T00:00:00+00:00", {"status": JobStatus.FAILED})
+        assert backend.get_job("job")["status"] == JobStatus.FAILED
+        client.close()
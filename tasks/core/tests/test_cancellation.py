@@ -0,0 +1,158 @@
+import json
+import threading
+import time
+
+import pytest
+
+from tasks import BaseParameters, BaseResult, check_cancelled, step, task
+from tasks.array import run_array_shard
+from tasks.cancellation import request_cancel
+from tasks.models import JobStatus, get_timestamp
+from tasks.tasks import run_batch_task
+
+started = threading.Event()
+calls = {"after": 0}
+
+
+class Parameters(BaseParameters):
+    value: int
+
+
+class Result(BaseResult):
+    value: int
+
+
+@step(name="Wait", description="Loop until cancelled")
+def wait(value: int) -> int:
+    started.set()
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        check_cancelled()
+        time.sleep(0.01)
+    return value
+
+
+@step(name="After", description="Run after the wait")
+def after(value: int) -> int:
+    calls["after"] += 1
+    return value
+
+
+@task(name="Cancellable", description="Wait until cancelled")
+def cancellable(parameters: Parameters) -> Result:
+    return Result(value=after(wait(parameters.value)))
+
+
+@task(name="Quick", description="Double the value")
+def quick(parameters: Parameters) -> Result:
+    return Result(value=after(parameters.value * 2))
+
+
+def double_batch(parameters: list[Parameters]) -> list[Result]:
+    return [Result(value=instance.value * 2) for instance in parameters]
+
+
+@pytest.fixture(autouse=True)
+def reset():
+    started.clear()
+    calls.update(after=0)
+
+
+def _cancel(backend, job_id: str) -> None:
+    backend.update_job(job_id, lambda job: {"cancel_requested_at": get_timestamp()})
+
+
+def test_running_job_is_cancelled(backend):
+    results = []
+    thread = threading.Thread(target=lambda: results.append(cancellable("job", Parameters(value=1))))
+    thread.start()
+    assert started.wait(timeout=5)
+
+    _cancel(backend, "job")
+    thread.join(timeout=5)
+
+    assert results == [None]
+    job = backend.get_job("job")
+    assert job["status"] == JobStatus.CANCELLED
+    assert job["completed_at"] is not None
+    # The next step is not started
+    assert calls["after"] == 0
+    assert [(event.name, event.status) for event in backend.get_job_events("job")] == [
+        ("Wait", JobStatus.RUNNING), ("Wait", JobStatus.CANCELLED),
+    ]
+
+
+def test_job_cancelled_before_it_started_is_skipped(backend):
+    backend.create_job("job", {"task_id": "quick", "status": JobStatus.CANCELLED})
+
+    assert quick("job", Parameters(value=1)) is None
+
+    assert calls["after"] == 0
+    assert backend.get_job("job") == {"task_id": "quick", "status": JobStatus.CANCELLED}
+    assert backend.get_job_events("job") == []
+
+
+def test_batch_skips_the_cancelled_jobs(backend):
+    backend.create_job("job-0", {"task_id": "quick", "status": JobStatus.CANCELLED})
+
+    results = run_batch_task(quick, double_batch, ["job-0", "job-1"], [Parameters(value=1), Parameters(value=2)])
+
+    assert results == [None, Result(value=4)]
+    assert backend.get_job("job-0")["status"] == JobStatus.CANCELLED
+    assert backend.get_job("job-1")["status"] == JobStatus.COMPLETED
+
+
+def test_cancelled_array_job_runs_no_child(backend):
+    backend.create_job("array", {
+        "task_id": "quick",
+        "status": JobStatus.CANCELLED,
+        "parameters_json_value": json.dumps([{"value": 1}]),
+        "array": {"size": 1, "task_count": 1},
+    })
+
+    run_array_shard(quick, Parameters, "array", task_index=0, task_count=1)
+
+    assert backend.get_job("array")["status"] == JobStatus.CANCELLED
+    assert backend.get_job("array-0") is None
+
+
+def test_array_cancellation_is_forwarded_to_the_running_child(backend):
+    backend.create_job("array", {
+        "task_id": "cancellable",
+        "status": JobStatus.CREATED,
+        "parameters_json_value": json.dumps([{"value": index} for index in range(3)]),
+        "array": {"size": 3, "task_count": 1},
+    })
+    thread = threading.Thread(target=run_array_shard, args=(cancellable, Parameters, "array"), kwargs={"task_index": 0, "task_count": 1})
+    thread.start()
+    assert started.wait(timeout=5)
+
+    # As the API cancels a running array job
+    backend.update_job("array", lambda job: {"status": JobStatus.CANCELLED, "cancel_requested_at": get_timestamp(), "completed_at": get_timestamp()})
+    thread.join(timeout=5)
+
+    assert not thread.is_alive()
+    # The child stopped inside its step
+    assert backend.get_job("array-0")["status"] == JobStatus.CANCELLED
+    assert calls["after"] == 0
+    assert backend.get_job("array-1") is None
+    job = backend.get_job("array")
+    assert job["status"] == JobStatus.CANCELLED
+    assert job["array"]["cancelled"] == 1
+
+
+def test_cancellation_request_depends_on_the_status(backend):
+    for job_id, status in (("created", JobStatus.CREATED), ("running", JobStatus.RUNNING), ("completed", JobStatus.COMPLETED)):
+        backend.create_job(job_id, {"status": status})
+        request_cancel(backend, job_id)
+
+    assert backend.get_job("created")["status"] == JobStatus.CANCELLED
+    running = backend.get_job("running")
+    assert running["status"] == JobStatus.RUNNING
+    assert running["cancel_requested_at"] is not None
+    assert backend.get_job("completed") == {"status": JobStatus.COMPLETED}
+
+
+def test_cancellation_is_checked_in_a_job_only():
+    with pytest.raises(RuntimeError):
+        check_cancelled()
@@ -0,0 +1,97 @@
+import pytest
+
+from tasks import BaseParameters, BaseResult, step, task
+from tasks.checkpoint import Checkpoints
+from tasks.models import JobStatus
+from tasks.storage import LocalBlobStore
+
+calls = {"load": 0, "transform": 0}
+failures = {"transform": 0}
+
+
+class Parameters(BaseParameters):
+    value: int
+
+
+class Result(BaseResult):
+    value: int
+
+
+@step(name="Load", description="Load the value", checkpoint=True)
+def load(value: int) -> int:
+    calls["load"] += 1
+    return value * 10
+
+
+@step(name="Transform", description="Transform the value, failing while asked to")
+def transform(value: int) -> int:
+    calls["transform"] += 1
+    if failures["transform"]:
+        failures["transform"] -= 1
+        raise RuntimeError("Transient failure")
+    return value + 1
+
+
+@task(name="Checkpointed", description="Load and transform the value")
+def checkpointed(parameters: Parameters) -> Result:
+    return Result(value=transform(load(parameters.value)))
+
+
+@pytest.fixture(autouse=True)
+def checkpoint_store(test_settings, tmp_path, monkeypatch):
+    monkeypatch.setattr(test_settings, "CHECKPOINT_STORE", str(tmp_path / "checkpoints"))
+    calls.update(load=0, transform=0)
+    failures.update(transform=0)
+
+
+def test_resumed_job_skips_the_checkpointed_steps(backend):
+    failures["transform"] = 1
+    assert checkpointed("job", Parameters(value=1)) is None
+    assert backend.get_job("job")["status"] == JobStatus.FAILED
+
+    result = checkpointed("job", Parameters(value=1), resume=True)
+
+    assert result == Result(value=11)
+    assert calls == {"load": 1, "transform": 2}
+    job = backend.get_job("job")
+    assert job["status"] == JobStatus.COMPLETED
+    assert job["error_json_value"] is None
+    # The events of the resumed run follow the events of the failed run
+    events = backend.get_job_events("job")
+    assert [event.seq for event in events] == list(range(8))
+    assert job["progress"]["step_count"] == 4
+
+
+def test_failed_job_does_not_run_again_without_resume(backend):
+    failures["transform"] = 1
+    checkpointed("job", Parameters(value=1))
+
+    with pytest.raises(ValueError, match="not in \"created\" status"):
+        checkpointed("job", Parameters(value=1))
+    assert calls == {"load": 1, "transform": 1}
+
+
+def test_new_job_runs_its_checkpointed_steps(backend):
+    checkpointed("job-1", Parameters(value=1))
+    checkpointed("job-2", Parameters(value=1))
+
+    assert calls == {"load": 2, "transform": 2}
+
+
+def test_checkpoints_are_keyed_by_their_inputs(tmp_path):
+    checkpoints = Checkpoints(LocalBlobStore(str(tmp_path)), "job")
+    key = checkpoints.key("load", (1,), {})
+
+    checkpoints.save(key, {"value": 10})
+
+    assert checkpoints.load(key) == (True, {"value": 10})
+    assert checkpoints.key("load", (1,), {}) == key
+    other = checkpoints.key("load", (2,), {})
+    assert other != key
+    assert checkpoints.load(other) == (False, None)
+
+
+def test_unpicklable_inputs_are_not_checkpointed(tmp_path):
+    checkpoints = Checkpoints(LocalBlobStore(str(tmp_path)), "job")
+
+    assert checkpoints.key("load", (lambda: None,), {}) is None
@@ -0,0 +1,63 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from tasks import BaseParameters, BaseResult, step, task
+from tasks.db import get_context, setup_context, use_context
+from tasks.models import JobStatus
+
+
+class Parameters(BaseParameters):
+    value: int
+
+
+class Result(BaseResult):
+    job_id: str
+    value: int
+
+
+# All the jobs are inside their step at the same time
+inside = threading.Barrier(4, timeout=5)
+
+
+@step(name="Current Job", description="Return the ID of the job of the context")
+def current_job(value: int) -> str:
+    inside.wait()
+    return get_context().job_id
+
+
+@task(name="Context", description="Return the ID of the job seen by its step")
+def context_task(parameters: Parameters) -> Result:
+    return Result(job_id=current_job(parameters.value), value=parameters.value)
+
+
+def test_concurrent_jobs_have_their_own_context(backend):
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda i: context_task(f"job-{i}", Parameters(value=i)), range(4)))
+
+    assert [result.job_id for result in results] == [f"job-{i}" for i in range(4)]
+    for i in range(4):
+        job = backend.get_job(f"job-{i}")
+        assert job["status"] == JobStatus.COMPLETED
+        assert len(backend.get_job_events(f"job-{i}")) == 2
+
+
+def test_context_is_not_set_outside_of_a_job():
+    with pytest.raises(RuntimeError):
+        get_context()
+
+
+def test_use_context_restores_the_previous_context(backend):
+    outer = setup_context("outer", "task", Parameters(value=1))
+    inner = setup_context("inner", "task", Parameters(value=2))
+    try:
+        with use_context(outer):
+            with use_context(inner):
+                assert get_context().job_id == "inner"
+            assert get_context().job_id == "outer"
+        with pytest.raises(RuntimeError):
+            get_context()
+    finally:
+        outer.writer.close()
+        inner.writer.close()
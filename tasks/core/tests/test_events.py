@@ -0,0 +1,72 @@
+from tasks import BaseParameters, BaseResult, step, task
+from tasks.models import JobProgressEvent, JobStatus
+
+
+class Parameters(BaseParameters):
+    value: int
+
+
+class Result(BaseResult):
+    value: int
+
+
+@step(name="Add One", description="Add one to the value")
+def add_one(value: int) -> int:
+    return value + 1
+
+
+@task(name="Add Two", description="Add two to the value")
+def add_two(parameters: Parameters) -> Result:
+    return Result(value=add_one(add_one(parameters.value)))
+
+
+def _event(seq: int, step: int, status: JobStatus) -> JobProgressEvent:
+    return JobProgressEvent(seq=seq, step=step, name="Step", description="A step", status=status, timestamp="2025-01-01T00:00:00+00:00")
+
+
+def test_events_are_appended_in_order(backend):
+    backend.create_job("job", {"status": JobStatus.CREATED})
+    backend.write_job("job", {"status": JobStatus.RUNNING}, [_event(0, 0, JobStatus.RUNNING)])
+    backend.write_job("job", {}, [_event(1, 0, JobStatus.COMPLETED), _event(2, 1, JobStatus.RUNNING)])
+
+    assert [event.seq for event in backend.get_job_events("job")] == [0, 1, 2]
+    assert [event.seq for event in backend.get_job_events("job", after=0)] == [1, 2]
+    assert backend.get_job("job")["status"] == JobStatus.RUNNING
+
+
+def test_event_written_again_is_replaced(backend):
+    backend.create_job("job", {"status": JobStatus.CREATED})
+    backend.write_job("job", {}, [_event(0, 0, JobStatus.RUNNING)])
+    backend.write_job("job", {}, [_event(0, 0, JobStatus.RUNNING), _event(1, 0, JobStatus.COMPLETED)])
+
+    assert [(event.seq, event.status) for event in backend.get_job_events("job")] == [
+        (0, JobStatus.RUNNING),
+        (1, JobStatus.COMPLETED),
+    ]
+
+
+def test_created_job_has_no_events_of_a_previous_run(backend):
+    backend.create_job("job", {"status": JobStatus.CREATED})
+    backend.write_job("job", {}, [_event(0, 0, JobStatus.RUNNING)])
+
+    backend.create_job("job", {"status": JobStatus.CREATED})
+
+    assert backend.get_job_events("job") == []
+
+
+def test_task_appends_a_start_and_end_event_per_step(backend):
+    result = add_two("job", Parameters(value=1))
+
+    assert result == Result(value=3)
+    job = backend.get_job("job")
+    assert job["status"] == JobStatus.COMPLETED
+    assert job["progress"]["step_count"] == 2
+    assert job["progress"]["event_count"] == 4
+    events = backend.get_job_events("job")
+    assert [(event.step, event.status) for event in events] == [
+        (0, JobStatus.RUNNING),
+        (0, JobStatus.COMPLETED),
+        (1, JobStatus.RUNNING),
+        (1, JobStatus.COMPLETED),
+    ]
+    assert all(event.name == "Add One" for event in events)
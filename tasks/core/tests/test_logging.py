@@ -0,0 +1,112 @@
+import atexit
+import json
+import logging
+import queue
+
+from tasks import BaseParameters, BaseResult, step, task
+from tasks import utils
+from tasks.utils import ContextFilter, JsonFormatter, _ContextQueueHandler, _create_handler, get_logger, log_fields
+
+logger = get_logger(__name__)
+
+
+class Parameters(BaseParameters):
+    value: int
+
+
+class Result(BaseResult):
+    value: int
+
+
+@step(name="Logged", description="Log the value")
+def logged(value: int) -> int:
+    logger.info("Value %s", value)
+    return value
+
+
+@task(name="Logging", description="Log the value")
+def logging_task(parameters: Parameters) -> Result:
+    return Result(value=logged(parameters.value))
+
+
+class RecordingHandler(logging.Handler):
+    """Keep the records with their context."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.records: list[logging.LogRecord] = []
+        self.addFilter(ContextFilter())
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append(record)
+
+
+def _record(message: str, *args) -> logging.LogRecord:
+    return logging.LogRecord("tasks.test", logging.INFO, __file__, 1, message, args, None)
+
+
+def test_log_fields_are_nested():
+    with log_fields(job_id="job"):
+        with log_fields(step=0):
+            record = _record("Message")
+            ContextFilter().filter(record)
+            assert record.context == {"job_id": "job", "step": 0}
+        record = _record("Message")
+        ContextFilter().filter(record)
+        assert record.context == {"job_id": "job"}
+
+
+def test_json_lines_have_the_record_context():
+    record = _record("Value %s", 1)
+    with log_fields(job_id="job", step=0):
+        ContextFilter().filter(record)
+
+    entry = json.loads(JsonFormatter().format(record))
+
+    assert entry["severity"] == "INFO"
+    assert entry["logger"] == "tasks.test"
+    assert entry["message"] == "Value 1"
+    assert entry["job_id"] == "job"
+    assert entry["step"] == 0
+
+
+def test_step_logs_have_the_job_and_step(backend):
+    handler = RecordingHandler()
+    logger.addHandler(handler)
+    try:
+        logging_task("job", Parameters(value=1))
+    finally:
+        logger.removeHandler(handler)
+
+    record = next(record for record in handler.records if record.getMessage() == "Value 1")
+    assert record.context == {"job_id": "job", "task_id": logging_task.task_id, "step": 0, "step_name": "Logged"}
+
+
+def test_queued_message_is_formatted_at_the_call():
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    handler = _ContextQueueHandler(records)
+    values = [1]
+
+    handler.emit(_record("Values %s", values))
+    values.append(2)
+
+    assert records.get_nowait().getMessage() == "Values [1]"
+
+
+def test_handler_is_selected_by_the_environment(monkeypatch):
+    monkeypatch.setenv("LOG_FORMAT", "json")
+    monkeypatch.setenv("LOG_QUEUE", "1")
+    monkeypatch.setattr(utils, "_listener", None)
+
+    handler = _create_handler()
+    try:
+        assert isinstance(handler, _ContextQueueHandler)
+        assert isinstance(utils._listener.handlers[0].formatter, JsonFormatter)
+    finally:
+        atexit.unregister(utils._listener.stop)
+        utils._listener.stop()
+
+    monkeypatch.delenv("LOG_QUEUE")
+    handler = _create_handler()
+    assert isinstance(handler, logging.StreamHandler)
+    assert isinstance(handler.formatter, JsonFormatter)
@@ -0,0 +1,86 @@
+import time
+
+import pytest
+
+from tasks import BaseParameters, BaseResult, step, task
+from tasks.metrics import StepMeter
+from tasks.models import JobStatus
+
+
+class Parameters(BaseParameters):
+    sleep: float
+
+
+class Result(BaseResult):
+    total: int
+
+
+@step(name="Sleep", description="Sleep without using the CPU")
+def sleep(seconds: float) -> int:
+    time.sleep(seconds)
+    return 0
+
+
+@step(name="Spin", description="Use the CPU")
+def spin(count: int) -> int:
+    return sum(range(count))
+
+
+@step(name="Fail", description="Fail after some work")
+def fail(count: int) -> int:
+    sum(range(count))
+    raise RuntimeError("Failed")
+
+
+@task(name="Measured", description="Sleep then spin")
+def measured(parameters: Parameters) -> Result:
+    return Result(total=sleep(parameters.sleep) + spin(200_000))
+
+
+def test_step_end_events_have_metrics(backend):
+    measured("job", Parameters(sleep=0.1))
+
+    events = [event for event in backend.get_job_events("job") if event.status == JobStatus.COMPLETED]
+    assert [event.name for event in events] == ["Sleep", "Spin"]
+    sleep_metrics, spin_metrics = (event.metrics for event in events)
+    assert sleep_metrics.wall_time >= 0.1
+    assert sleep_metrics.cpu_time < sleep_metrics.wall_time
+    assert spin_metrics.cpu_time > 0
+    assert sleep_metrics.gpu_peak_memory is None
+    # Start events have no metrics
+    assert all(event.metrics is None for event in backend.get_job_events("job") if event.status == JobStatus.RUNNING)
+
+
+def test_job_metrics_roll_up_the_steps(backend):
+    measured("job", Parameters(sleep=0.1))
+
+    events = [event for event in backend.get_job_events("job") if event.status == JobStatus.COMPLETED]
+    metrics = backend.get_job("job")["metrics"]
+    assert metrics["step_wall_time"] == pytest.approx(sum(event.metrics.wall_time for event in events))
+    assert metrics["step_cpu_time"] == pytest.approx(sum(event.metrics.cpu_time for event in events))
+    assert metrics["slowest_step"] == 0
+    assert metrics["slowest_step_name"] == "Sleep"
+    assert metrics["slowest_step_wall_time"] == events[0].metrics.wall_time
+
+
+def test_failed_step_has_metrics(backend):
+    @task(name="Failing", description="Fail in a step")
+    def failing(parameters: Parameters) -> Result:
+        return Result(total=fail(1000))
+
+    failing("job", Parameters(sleep=0))
+
+    failed = backend.get_job_events("job")[-1]
+    assert failed.status == JobStatus.FAILED
+    assert failed.metrics is not None
+    assert failed.error == "RuntimeError: Failed"
+
+
+def test_meter_measures_wall_and_cpu_time():
+    meter = StepMeter()
+    time.sleep(0.02)
+    metrics = meter.stop()
+
+    assert metrics.wall_time >= 0.02
+    assert 0 <= metrics.cpu_time < metrics.wall_time
+    assert metrics.peak_rss_delta >= 0
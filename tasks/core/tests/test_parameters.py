@@ -0,0 +1,76 @@
+import sys
+
+import pytest
+
+from tasks import BaseParameters
+from tasks.db import create_or_check_job
+from tasks.scripts import load_run_parameters, parse_run_parameters
+
+
+class Options(BaseParameters):
+    language: str
+    beam_size: int
+
+
+class Parameters(BaseParameters):
+    text: str
+    tags: list[str]
+    options: Options
+
+
+PARAMETERS = Parameters(text="Line 1\nLine 2 \"quoted\" é", tags=["a", "b"], options=Options(language="fr", beam_size=5))
+
+
+def test_parameters_are_read_from_a_json_file(tmp_path):
+    path = tmp_path / "parameters.json"
+    path.write_text(PARAMETERS.model_dump_json())
+
+    assert load_run_parameters(str(path), "job", Parameters) == PARAMETERS
+    assert load_run_parameters(f"file://{path}", "job", Parameters) == PARAMETERS
+
+
+def test_parameters_are_read_from_a_msgpack_file(tmp_path):
+    msgpack = pytest.importorskip("msgpack")
+    path = tmp_path / "parameters.msgpack"
+    path.write_bytes(msgpack.packb(PARAMETERS.model_dump()))
+
+    assert load_run_parameters(str(path), "job", Parameters) == PARAMETERS
+
+
+def test_parameters_are_read_from_the_environment(test_settings, monkeypatch):
+    monkeypatch.setattr(test_settings, "TASK_PARAMETERS", PARAMETERS.model_dump_json())
+
+    assert load_run_parameters("env", "job", Parameters) == PARAMETERS
+
+
+def test_missing_environment_parameters_are_rejected(test_settings, monkeypatch):
+    monkeypatch.setattr(test_settings, "TASK_PARAMETERS", None)
+
+    with pytest.raises(ValueError, match="TASK_PARAMETERS is not set"):
+        load_run_parameters("env", "job", Parameters)
+
+
+def test_parameters_are_read_from_the_job(backend):
+    create_or_check_job(backend, "job", "task", PARAMETERS)
+
+    assert load_run_parameters("job", "job", Parameters) == PARAMETERS
+    with pytest.raises(ValueError, match="has no parameters"):
+        load_run_parameters("job", "missing", Parameters)
+
+
+def test_run_arguments_read_the_parameters_from_a_source(tmp_path, monkeypatch):
+    path = tmp_path / "parameters.json"
+    path.write_text(PARAMETERS.model_dump_json())
+    monkeypatch.setattr(sys, "argv", ["run", "--job_id", "job", "--parameters_from", str(path), "--resume"])
+
+    assert parse_run_parameters("task", Parameters) == ("job", PARAMETERS, True)
+
+
+def test_run_arguments_give_the_parameters_one_by_one(monkeypatch):
+    class Flat(BaseParameters):
+        text: str
+        count: int = 1
+
+    monkeypatch.setattr(sys, "argv", ["run", "--job_id", "job", "--text", "hello"])
+
+    assert parse_run_parameters("task", Flat) == ("job", Flat(text="hello"), False)
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from tasks import BaseParameters, BaseResult, step, task
+from tasks.models import JobStatus
+from tasks.writer import JobStatusWriter
+
+
+class Parameters(BaseParameters):
+    count: int
+
+
+class Result(BaseResult):
+    words: list[str]
+
+
+class Word(BaseResult):
+    word: str
+
+
+@step(name="Words", description="Yield the words one by one")
+def words(count: int):
+    for index in range(count):
+        yield Word(word=f"word-{index}")
+
+
+@step(name="Async Words", description="Yield the words one by one")
+async def async_words(count: int):
+    for index in range(count):
+        await asyncio.sleep(0)
+        yield f"word-{index}"
+
+
+@task(name="Streamed", description="Stream the words")
+def streamed(parameters: Parameters) -> Result:
+    return Result(words=[item.word for item in words(parameters.count)])
+
+
+@task(name="Async Streamed", description="Stream the words")
+async def async_streamed(parameters: Parameters) -> Result:
+    return Result(words=await async_words(parameters.count))
+
+
+def _partials(backend, job_id: str, offset: int = 0) -> list:
+    return [item for chunk in backend.get_job_partials(job_id, offset) for item in chunk.items]
+
+
+def test_generator_step_streams_its_items(backend):
+    result = streamed("job", Parameters(count=3))
+
+    assert result == Result(words=["word-0", "word-1", "word-2"])
+    assert _partials(backend, "job") == [{"word": f"word-{index}"} for index in range(3)]
+    job = backend.get_job("job")
+    assert job["status"] == JobStatus.COMPLETED
+    assert job["progress"]["partial_count"] == 3
+
+
+def test_async_generator_step_streams_its_items(backend):
+    result = asyncio.run(async_streamed("job", Parameters(count=3)))
+
+    assert result == Result(words=["word-0", "word-1", "word-2"])
+    assert _partials(backend, "job") == ["word-0", "word-1", "word-2"]
+
+
+def test_partials_are_packed_in_chunks(backend):
+    backend.create_job("job", {})
+    writer = JobStatusWriter(backend, "job", interval=60, partials_chunk_size=20)
+    for index in range(5):
+        writer.append_partial(f"item-{index}")
+    writer.flush()
+    writer.append_partial("item-5")
+    writer.close()
+
+    chunks = backend.get_job_partials("job")
+    # Each item takes 9 bytes, with its separator
+    assert [(chunk.seq, chunk.offset, chunk.end) for chunk in chunks] == [(0, 0, 2), (1, 2, 4), (2, 4, 5), (3, 5, 6)]
+    assert backend.get_job("job")["progress"]["partial_count"] == 6
+
+
+def test_partials_are_read_from_an_offset(backend):
+    backend.create_job("job", {})
+    writer = JobStatusWriter(backend, "job", interval=60, partials_chunk_size=20)
+    for index in range(6):
+        writer.append_partial(f"item-{index}")
+    writer.close()
+
+    # The chunks before the offset are skipped, the chunk holding it is read from its start
+    assert [chunk.offset for chunk in backend.get_job_partials("job", offset=3)] == [2, 4]
+    assert _partials(backend, "job", offset=6) == []
+
+
+def test_partial_larger_than_a_chunk_is_rejected(backend):
+    backend.create_job("job", {})
+    writer = JobStatusWriter(backend, "job", interval=0, partials_chunk_size=8)
+
+    with pytest.raises(ValueError, match="larger than the chunk size"):
+        writer.append_partial("a long partial result")
+    writer.close()
@@ -0,0 +1,92 @@
+import gzip
+import json
+
+import pytest
+
+from tasks import BaseParameters, BaseResult, task
+from tasks.models import JobStatus
+from tasks.payloads import compress, decompress, dump_payload, load_payload, load_payload_ref
+from tasks.storage import LocalBlobStore, get_blob_store
+
+LARGE = json.dumps({"text": "word " * 1000})
+
+
+class Parameters(BaseParameters):
+    text: str
+
+
+class Result(BaseResult):
+    text: str
+
+
+@task(name="Echo", description="Return the text")
+def echo(parameters: Parameters) -> Result:
+    return Result(text=parameters.text)
+
+
+def test_payload_is_inline_without_store():
+    assert dump_payload("job", "result", LARGE, store="") == {"result_json_value": LARGE, "result_ref": None}
+
+
+def test_small_payload_is_inline(tmp_path):
+    fields = dump_payload("job", "result", '{"text": "word"}', store=str(tmp_path), inline_limit=1024)
+
+    assert fields == {"result_json_value": '{"text": "word"}', "result_ref": None}
+    assert load_payload(fields, "result") == '{"text": "word"}'
+
+
+def test_large_payload_is_compressed_in_the_store(tmp_path):
+    fields = dump_payload("job", "result", LARGE, store=str(tmp_path), inline_limit=1024, compression="gzip")
+
+    ref = fields["result_ref"]
+    assert fields["result_json_value"] is None
+    assert ref["key"] == "payloads/job/result.json.gz"
+    assert ref["size"] == len(LARGE)
+    stored = LocalBlobStore(str(tmp_path)).get(ref["key"])
+    assert len(stored) < len(LARGE)
+    assert gzip.decompress(stored).decode() == LARGE
+    assert load_payload(fields, "result") == LARGE
+
+
+def test_missing_payload():
+    assert load_payload({"result_json_value": None, "result_ref": None}, "result") is None
+
+
+def test_deleted_payload_fails_to_load(tmp_path):
+    with pytest.raises(ValueError, match="not found"):
+        load_payload_ref({"store": str(tmp_path), "key": "payloads/job/result.json.gz", "compression": "gzip", "size": 1})
+
+
+def test_zstd_compression():
+    pytest.importorskip("zstandard")
+
+    assert decompress(compress(LARGE.encode(), "zstd"), "zstd").decode() == LARGE
+
+
+def test_unsupported_compression_is_rejected():
+    with pytest.raises(ValueError, match="Unsupported compression"):
+        compress(b"data", "lz4")
+    with pytest.raises(ValueError, match="Unsupported compression"):
+        decompress(b"data", "lz4")
+
+
+def test_blob_store_uris(tmp_path):
+    assert isinstance(get_blob_store(f"file://{tmp_path}"), LocalBlobStore)
+    assert isinstance(get_blob_store(str(tmp_path)), LocalBlobStore)
+    with pytest.raises(ValueError, match="Unsupported blob store URI"):
+        get_blob_store("s3://bucket")
+
+
+def test_large_job_payloads_are_offloaded(backend, test_settings, tmp_path, monkeypatch):
+    monkeypatch.setattr(test_settings, "PAYLOAD_STORE", str(tmp_path))
+    monkeypatch.setattr(test_settings, "PAYLOAD_INLINE_LIMIT", 1024)
+    text = json.loads(LARGE)["text"]
+
+    assert echo("job", Parameters(text=text)) == Result(text=text)
+
+    job = backend.get_job("job")
+    assert job["status"] == JobStatus.COMPLETED
+    assert job["parameters_json_value"] is None
+    assert job["result_json_value"] is None
+    assert json.loads(load_payload(job, "parameters")) == {"text": text}
+    assert json.loads(load_payload(job, "result")) == {"text": text}
@@ -0,0 +1,162 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from tasks import BaseParameters, BaseResult, resource, step, task
+from tasks.models import JobStatus
+from tasks import pipeline as pipeline_module
+from tasks.pipeline import Pipeline
+from tasks.types import StepExpection
+
+
+class Parameters(BaseParameters):
+    value: int
+    executor: str = "thread"
+
+
+class Result(BaseResult):
+    value: int
+
+
+# Both branches of the diamond wait for each other, so they must run at the same time
+branches = threading.Barrier(2, timeout=5)
+
+
+@step(name="Source", description="Return the value")
+def source(value: int) -> int:
+    return value
+
+
+@step(name="Double", description="Double the value")
+def double(value: int) -> int:
+    branches.wait()
+    return value * 2
+
+
+@step(name="Square", description="Square the value")
+def square(value: int) -> int:
+    branches.wait()
+    return value * value
+
+
+@step(name="Add", description="Add the values")
+def add(left: int, right: int) -> int:
+    return left + right
+
+
+@step(name="Fail", description="Always fail")
+def fail(value: int) -> int:
+    raise RuntimeError("Failed")
+
+
+@step(name="Triple", description="Triple the value")
+def triple(value: int) -> int:
+    return value * 3
+
+
+@resource()
+def offset() -> int:
+    return 1
+
+
+@step(name="Add Offset", description="Add the offset", resources={"offset": offset})
+def add_offset(value: int, offset: int) -> int:
+    return value + offset
+
+
+@task(name="Diamond", description="Add the double and the square of the value")
+def diamond(parameters: Parameters) -> Result:
+    pipeline = Pipeline(executor=parameters.executor)
+    value = pipeline.add(source, parameters.value)
+    if parameters.executor == "thread":
+        left, right = pipeline.add(double, value), pipeline.add(square, value)
+    else:
+        left, right = pipeline.add(triple, value), pipeline.add(triple, value)
+    total = pipeline.add(add, left, right)
+    return Result(value=pipeline.run()[total])
+
+
+def test_branches_run_concurrently(backend):
+    result = diamond("job", Parameters(value=3))
+
+    assert result == Result(value=15)
+    events = backend.get_job_events("job")
+    started = [event.name for event in events if event.status == JobStatus.RUNNING]
+    assert started[0] == "Source"
+    assert set(started[1:3]) == {"Double", "Square"}
+    assert started[3] == "Add"
+
+
+def test_failed_step_skips_its_dependents(backend):
+    @task(name="Failing", description="Fail in the middle of the pipeline")
+    def failing(parameters: Parameters) -> Result:
+        pipeline = Pipeline()
+        failed = pipeline.add(fail, parameters.value)
+        total = pipeline.add(triple, failed)
+        return Result(value=pipeline.run()[total])
+
+    assert failing("job", Parameters(value=1)) is None
+    assert backend.get_job("job")["status"] == JobStatus.FAILED
+    assert [event.name for event in backend.get_job_events("job")] == ["Fail", "Fail"]
+
+
+def test_failed_step_raises_from_run(backend):
+    @task(name="Raising", description="Check the pipeline error")
+    def raising(parameters: Parameters) -> Result:
+        pipeline = Pipeline()
+        pipeline.add(fail, parameters.value)
+        with pytest.raises(StepExpection) as error:
+            pipeline.run()
+        assert error.value.step_name == "Fail"
+        return Result(value=0)
+
+    assert raising("job", Parameters(value=1)) == Result(value=0)
+
+
+def test_node_of_another_pipeline_is_rejected():
+    other = Pipeline().add(source, 1)
+    with pytest.raises(ValueError):
+        Pipeline().add(triple, other)
+
+
+@pytest.mark.parametrize("steps,workers", [(3, 3), (40, 32)])
+def test_thread_pool_defaults_to_a_thread_per_step(backend, monkeypatch, steps, workers):
+    pools = []
+
+    class RecordingPool(ThreadPoolExecutor):
+        def __init__(self, max_workers=None, **kwargs):
+            pools.append(max_workers)
+            super().__init__(max_workers=max_workers, **kwargs)
+
+    monkeypatch.setattr(pipeline_module, "ThreadPoolExecutor", RecordingPool)
+
+    @task(name="Wide", description="Run independent steps")
+    def wide(parameters: Parameters) -> Result:
+        pipeline = Pipeline()
+        nodes = [pipeline.add(triple, parameters.value) for _ in range(steps)]
+        results = pipeline.run()
+        return Result(value=sum(results[node] for node in nodes))
+
+    assert wide("job", Parameters(value=1)) == Result(value=3 * steps)
+    assert pools == [workers]
+
+
+def test_process_pool_runs_the_step_functions(backend):
+    result = diamond("job", Parameters(value=2, executor="process"))
+
+    assert result == Result(value=12)
+    events = backend.get_job_events("job")
+    ended = [event for event in events if event.status == JobStatus.COMPLETED]
+    assert len(ended) == 4
+    assert all(event.metrics is not None for event in ended)
+
+
+@pytest.mark.parametrize("step_func", [
+    add_offset,
+    step(name="Checkpointed", description="Checkpointed step", checkpoint=True)(triple.__wrapped__),
+    step(name="Retried", description="Retried step", retries=2)(triple.__wrapped__),
+])
+def test_process_pool_rejects_steps_needing_the_job_context(step_func):
+    with pytest.raises(ValueError, match="executor=\"thread\""):
+        Pipeline(executor="process").add(step_func, 1)
@@ -0,0 +1,72 @@
+import json
+import time
+
+from tasks import BaseParameters, BaseResult, task
+from tasks.models import JobStatus, StartJob
+from tasks.reaper import HEARTBEAT_LOST, reap_stale_jobs
+from tasks.writer import JobStatusWriter
+
+OLD_HEARTBEAT = "2024-01-01T00:00:00+00:00"
+
+
+class Parameters(BaseParameters):
+    value: int
+
+
+class Result(BaseResult):
+    value: int
+
+
+@task(name="Reaped", description="Double the value")
+def reaped(parameters: Parameters) -> Result:
+    return Result(value=parameters.value * 2)
+
+
+def test_job_without_heartbeat_is_failed(backend):
+    backend.create_job("job", {"status": JobStatus.RUNNING, "heartbeat_at": OLD_HEARTBEAT})
+
+    assert reap_stale_jobs(backend, timeout=60) == ["job"]
+
+    job = backend.get_job("job")
+    assert job["status"] == JobStatus.FAILED
+    assert job["completed_at"] is not None
+    assert json.loads(job["error_json_value"])["code"] == HEARTBEAT_LOST
+    # It is failed once
+    assert reap_stale_jobs(backend, timeout=60) == []
+
+
+def test_live_and_finished_jobs_are_kept(backend):
+    backend.create_job("live", {"status": JobStatus.CREATED})
+    writer = JobStatusWriter(backend, "live", interval=0)
+    writer.update_job(StartJob())
+    backend.create_job("done", {"status": JobStatus.COMPLETED, "heartbeat_at": OLD_HEARTBEAT})
+    backend.create_job("created", {"status": JobStatus.CREATED})
+
+    assert reap_stale_jobs(backend, timeout=60) == []
+
+    assert backend.get_job("live")["status"] == JobStatus.RUNNING
+    assert backend.get_job("done")["status"] == JobStatus.COMPLETED
+    writer.close()
+
+
+def test_running_job_sends_heartbeats(backend):
+    backend.create_job("job", {"status": JobStatus.CREATED})
+    writer = JobStatusWriter(backend, "job", interval=0, heartbeat_interval=0.05)
+    writer.update_job(StartJob())
+    first = backend.get_job("job")["heartbeat_at"]
+
+    time.sleep(0.2)
+
+    assert backend.get_job("job")["heartbeat_at"] > first
+    writer.close()
+
+
+def test_reaped_job_can_be_resumed(backend):
+    reaped("job", Parameters(value=1))
+    backend.write_job("job", {"status": JobStatus.RUNNING, "heartbeat_at": OLD_HEARTBEAT}, [])
+    reap_stale_jobs(backend, timeout=60)
+
+    assert reaped("job", Parameters(value=1), resume=True) == Result(value=2)
+    job = backend.get_job("job")
+    assert job["status"] == JobStatus.COMPLETED
+    assert job["error_json_value"] is None
@@ -0,0 +1,124 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from tasks import BaseParameters, BaseResult, step, task
+from tasks import resources as resources_module
+from tasks.models import JobStatus
+from tasks.resources import Resource, load_eager_resources, resource, resources_ready
+
+
+class Parameters(BaseParameters):
+    value: int
+
+
+class Result(BaseResult):
+    value: int
+
+
+@pytest.fixture(autouse=True)
+def declared_resources(monkeypatch):
+    """Declare the resources of each test in an empty registry."""
+    monkeypatch.setattr(resources_module, "_resources", {})
+
+
+def test_resource_is_created_once_by_concurrent_jobs():
+    created = []
+    started = threading.Barrier(8, timeout=5)
+
+    def factory():
+        created.append(1)
+        return object()
+
+    shared = Resource(factory, "shared")
+
+    def get(_):
+        started.wait()
+        return shared.get()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        values = list(executor.map(get, range(8)))
+
+    assert len(created) == 1
+    assert all(value is values[0] for value in values)
+    assert shared.loaded
+
+
+def test_failed_creation_is_retried_on_next_use():
+    attempts = []
+
+    def factory():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("Not ready")
+        return "model"
+
+    flaky = Resource(factory, "flaky")
+
+    with pytest.raises(RuntimeError):
+        flaky.get()
+    assert isinstance(flaky.error, RuntimeError)
+    assert not flaky.loaded
+
+    assert flaky.get() == "model"
+    assert flaky.error is None
+    assert flaky.loaded
+
+
+def test_resource_names_are_unique():
+    @resource()
+    def model():
+        return "model"
+
+    assert model.name == "model"
+    with pytest.raises(ValueError, match="already declared"):
+        resource(name="model")(lambda: "other")
+
+
+def test_eager_resources_are_loaded_at_startup():
+    attempts = []
+
+    @resource(eager=True)
+    def eager_model():
+        return "model"
+
+    @resource(eager=True)
+    def flaky_model():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("Not ready")
+        return "model"
+
+    @resource()
+    def lazy_model():
+        return "model"
+
+    assert not resources_ready()
+    assert not load_eager_resources()
+    assert eager_model.loaded
+    assert not flaky_model.loaded
+    assert not resources_ready()
+
+    assert load_eager_resources()
+    assert resources_ready()
+    assert not lazy_model.loaded
+
+
+def test_step_receives_its_resources(backend):
+    @resource()
+    def multiplier():
+        return 3
+
+    @step(name="Multiply", description="Multiply the value", resources={"factor": multiplier})
+    def multiply(value: int, factor: int) -> int:
+        return value * factor
+
+    @task(name="Resources", description="Multiply the value with a resource")
+    def with_resources(parameters: Parameters) -> Result:
+        # A value passed explicitly wins over the resource
+        return Result(value=multiply(parameters.value) + multiply(parameters.value, factor=10))
+
+    assert with_resources("job", Parameters(value=2)) == Result(value=26)
+    assert backend.get_job("job")["status"] == JobStatus.COMPLETED
+    assert multiply.step_resources == {"factor": multiplier}
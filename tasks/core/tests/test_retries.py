@@ -0,0 +1,137 @@
+import asyncio
+import json
+
+import pytest
+
+from tasks import BaseParameters, BaseResult, step, task
+from tasks.models import FinishJobStep, JobStatus, StartJob, StartJobStep
+from tasks.writer import JobStatusWriter
+
+failures = {"flaky": 0}
+calls = {"broken": 0}
+
+
+class TransientError(Exception):
+    pass
+
+
+class Parameters(BaseParameters):
+    value: int
+
+
+class Result(BaseResult):
+    value: int
+
+
+@step(name="Flaky", description="Fail while asked to", retries=2, backoff=0, retry_on=TransientError)
+def flaky(value: int) -> int:
+    if failures["flaky"]:
+        failures["flaky"] -= 1
+        raise TransientError("Transient failure")
+    return value * 2
+
+
+@step(name="Broken", description="Fail with an error that is not retried", retries=2, backoff=0, retry_on=TransientError)
+def broken(value: int) -> int:
+    calls["broken"] += 1
+    raise RuntimeError("Permanent failure")
+
+
+@step(name="Async Flaky", description="Fail while asked to", retries=2, backoff=0)
+async def async_flaky(value: int) -> int:
+    if failures["flaky"]:
+        failures["flaky"] -= 1
+        raise TransientError("Transient failure")
+    return value * 2
+
+
+@task(name="Retried", description="Double the value")
+def retried(parameters: Parameters) -> Result:
+    return Result(value=flaky(parameters.value))
+
+
+@task(name="Not Retried", description="Fail")
+def not_retried(parameters: Parameters) -> Result:
+    return Result(value=broken(parameters.value))
+
+
+@task(name="Async Retried", description="Double the value")
+async def async_retried(parameters: Parameters) -> Result:
+    return Result(value=await async_flaky(parameters.value))
+
+
+@pytest.fixture(autouse=True)
+def no_failures():
+    failures.update(flaky=0)
+    calls.update(broken=0)
+
+
+def _attempts(backend, job_id: str) -> list[tuple[int, JobStatus]]:
+    return [(event.attempt, event.status) for event in backend.get_job_events(job_id)]
+
+
+def test_step_is_retried(backend):
+    failures["flaky"] = 2
+
+    assert retried("job", Parameters(value=1)) == Result(value=2)
+
+    assert _attempts(backend, "job") == [
+        (0, JobStatus.RUNNING), (0, JobStatus.FAILED),
+        (1, JobStatus.RUNNING), (1, JobStatus.FAILED),
+        (2, JobStatus.RUNNING), (2, JobStatus.COMPLETED),
+    ]
+    assert backend.get_job_events("job")[1].error == "TransientError: Transient failure"
+    job = backend.get_job("job")
+    assert job["status"] == JobStatus.COMPLETED
+    # The attempts are events of the same step
+    assert job["progress"]["step_count"] == 1
+
+
+def test_step_fails_after_its_retries(backend):
+    failures["flaky"] = 3
+
+    assert retried("job", Parameters(value=1)) is None
+
+    assert [status for _, status in _attempts(backend, "job")].count(JobStatus.FAILED) == 3
+    assert backend.get_job("job")["status"] == JobStatus.FAILED
+
+
+def test_only_the_retried_errors_are_retried(backend):
+    assert not_retried("job", Parameters(value=1)) is None
+
+    assert calls["broken"] == 1
+    assert _attempts(backend, "job") == [(0, JobStatus.RUNNING), (0, JobStatus.FAILED)]
+    assert json.loads(backend.get_job("job")["error_json_value"])["code"] == "RuntimeError"
+
+
+def test_async_step_is_retried(backend):
+    failures["flaky"] = 1
+
+    assert asyncio.run(async_retried("job", Parameters(value=1))) == Result(value=2)
+    assert _attempts(backend, "job")[-1] == (1, JobStatus.COMPLETED)
+
+
+def test_repeated_step_end_is_written_once(backend):
+    backend.create_job("job", {"status": JobStatus.CREATED})
+    writer = JobStatusWriter(backend, "job", interval=0)
+    writer.update_job(StartJob())
+    step_seq = writer.start_step(StartJobStep(name="Step", description="A step"))
+
+    writer.end_step(step_seq, FinishJobStep())
+    writer.end_step(step_seq, FinishJobStep())
+    writer.close()
+
+    assert _attempts(backend, "job") == [(0, JobStatus.RUNNING), (0, JobStatus.COMPLETED)]
+    assert backend.get_job("job")["progress"]["event_count"] == 2
+
+
+def test_generator_step_can_not_be_retried():
+    with pytest.raises(ValueError, match="can not be retried"):
+        @step(name="Stream", description="Stream the values", retries=1)
+        def stream(count: int):
+            yield from range(count)
+
+
+def test_negative_retries_are_rejected():
+    with pytest.raises(ValueError, match="Invalid retries"):
+        step(name="Step", description="A step", retries=-1)
@@ -0,0 +1,130 @@
+import asyncio
+import threading
+
+import pytest
+
+from tasks import BaseParameters, BaseResult, step, task
+from tasks import resources as resources_module
+from tasks.config import settings
+from tasks.models import JobStatus
+from tasks.resources import resource
+
+pytest.importorskip("fastapi")
+
+from fastapi import Response  # noqa: E402
+
+from tasks.scripts import build_request_parameters, create_app  # noqa: E402
+
+
+class Parameters(BaseParameters):
+    value: int
+
+
+class Result(BaseResult):
+    value: int
+
+
+# The instances of a request wait for each other, so they must run at the same time
+instances_barrier = threading.Barrier(3, timeout=5)
+
+
+@step(name="Wait Double", description="Wait for the other instances and double the value")
+def wait_double(value: int) -> int:
+    instances_barrier.wait()
+    return value * 2
+
+
+@task(name="Served", description="Double the value")
+def served(parameters: Parameters) -> Result:
+    return Result(value=wait_double(parameters.value))
+
+
+@task(name="Served Alone", description="Triple the value")
+def served_alone(parameters: Parameters) -> Result:
+    return Result(value=parameters.value * 3)
+
+
+def _endpoint(app, path: str):
+    return next(route.endpoint for route in app.routes if route.path == path)
+
+
+def _predict(app, job_id: str, values: list[int]) -> list[BaseResult | None]:
+    body = build_request_parameters(Parameters)(
+        instances=[Parameters(value=value) for value in values],
+        parameters={"job_id": job_id},
+    )
+    return asyncio.run(_endpoint(app, "/predict")(body)).predictions
+
+
+def test_instances_run_concurrently_in_order(backend):
+    app = create_app(served, Parameters, Result)
+
+    predictions = _predict(app, "job", [1, 2, 3])
+
+    assert predictions == [Result(value=2), Result(value=4), Result(value=6)]
+    for index in range(3):
+        assert backend.get_job(f"job-{index}")["status"] == JobStatus.COMPLETED
+
+
+def test_single_instance_runs_as_the_job(backend):
+    app = create_app(served_alone, Parameters, Result)
+
+    assert _predict(app, "job", [2]) == [Result(value=6)]
+    assert backend.get_job("job")["status"] == JobStatus.COMPLETED
+
+
+def test_instance_that_can_not_start_does_not_fail_the_others(backend):
+    app = create_app(served_alone, Parameters, Result)
+    backend.create_job("job-1", {"task_id": "served_alone", "status": JobStatus.COMPLETED})
+
+    predictions = _predict(app, "job", [1, 2, 3])
+
+    assert predictions == [Result(value=3), None, Result(value=9)]
+    # The job that already ran is left as is
+    assert backend.get_job("job-1")["status"] == JobStatus.COMPLETED
+    assert backend.get_job("job-2")["status"] == JobStatus.COMPLETED
+
+
+def test_health_check_reports_the_task():
+    app = create_app(served_alone, Parameters, Result)
+    response = Response()
+
+    health = asyncio.run(_endpoint(app, "/health")(response))
+
+    assert response.status_code != 503
+    assert health.status == "ok"
+    assert health.task_id == served_alone.task_id
+
+
+def test_health_check_reports_the_failed_resources_until_they_load(monkeypatch):
+    monkeypatch.setattr(resources_module, "_resources", {})
+    monkeypatch.setattr(settings, "SERVER_RESOURCE_RETRY_INTERVAL", 0.01)
+    attempts = []
+
+    @resource(eager=True)
+    def model():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RuntimeError("Not ready")
+        return "model"
+
+    app = create_app(served_alone, Parameters, Result)
+
+    async def health_during_startup() -> list[tuple[int, str]]:
+        states = []
+        async with app.router.lifespan_context(app):
+            for _ in range(500):
+                response = Response()
+                health = await _endpoint(app, "/health")(response)
+                if not states or states[-1] != (response.status_code, health.status):
+                    states.append((response.status_code, health.status))
+                if health.status == "ok":
+                    break
+                await asyncio.sleep(0.01)
+        return states
+
+    states = asyncio.run(health_during_startup())
+
+    assert (503, "failed") in states
+    assert states[-1] == (200, "ok")
+    assert len(attempts) == 3
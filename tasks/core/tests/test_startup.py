@@ -0,0 +1,51 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from tasks.config import settings
+from tasks.db import get_job_backend
+
+HEAVY_MODULES = ["fastapi", "uvicorn", "google.cloud.firestore"]
+
+
+def _loaded_modules(code: str) -> list[str]:
+    """Run the code in a new interpreter and get the heavy modules it loaded."""
+    script = f"{code}\nimport json, sys\nprint(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))"
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+@pytest.mark.parametrize("code", [
+    "import tasks",
+    "from tasks import step, task, resource, batched",
+    "import tasks.scripts",
+    "from tasks.scripts import import_task, build_request_parameters",
+])
+def test_import_does_not_load_the_serve_or_firestore_dependencies(code):
+    assert _loaded_modules(code) == []
+
+
+def test_entry_points_are_imported_on_first_use():
+    import tasks
+    from tasks import scripts
+
+    assert tasks.run is scripts.run
+    with pytest.raises(AttributeError):
+        tasks.missing
+
+
+def test_job_backend_is_created_once(backend):
+    assert get_job_backend() is get_job_backend()
+
+
+def test_unsupported_jobs_backend_is_rejected(monkeypatch):
+    from tasks import db
+    from tasks.resources import Resource
+
+    monkeypatch.setattr(settings, "JOBS_BACKEND", "redis://localhost")
+    monkeypatch.setattr(db, "_job_backend", Resource(db._create_job_backend, "jobs_backend"))
+
+    with pytest.raises(ValueError):
+        get_job_backend()
@@ -0,0 +1,191 @@
+import json
+import threading
+import time
+
+import pytest
+
+from tasks import BaseParameters, BaseResult, step, task
+from tasks.models import JobStatus
+from tasks.worker import InMemoryJobQueue, SQLiteJobQueue, Worker, get_job_queue
+
+
+class Parameters(BaseParameters):
+    value: int
+
+
+class Result(BaseResult):
+    value: int
+
+
+# The jobs of a concurrent worker wait for each other, so they must run at the same time
+jobs_barrier = threading.Barrier(2, timeout=5)
+
+
+@step(name="Wait Double", description="Wait for the other job and double the value")
+def wait_double(value: int) -> int:
+    jobs_barrier.wait()
+    return value * 2
+
+
+@task(name="Queued", description="Double the value")
+def queued(parameters: Parameters) -> Result:
+    return Result(value=wait_double(parameters.value))
+
+
+@task(name="Queued Alone", description="Triple the value")
+def queued_alone(parameters: Parameters) -> Result:
+    return Result(value=parameters.value * 3)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def job_queue(request, tmp_path):
+    if request.param == "memory":
+        return get_job_queue("memory")
+    return get_job_queue(f"sqlite://{tmp_path / 'queue' / 'jobs.db'}")
+
+
+def _run_until(worker: Worker, done) -> None:
+    """Run the worker in a thread until `done` returns true, then drain it."""
+    thread = threading.Thread(target=worker.run)
+    thread.start()
+    try:
+        deadline = time.monotonic() + 5
+        while not done() and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        worker.drain()
+        thread.join(timeout=5)
+    assert not thread.is_alive()
+
+
+def test_jobs_are_taken_in_order(job_queue):
+    job_queue.put("job-1", '{"value": 1}')
+    job_queue.put("job-2", '{"value": 2}', resume=True)
+
+    first = job_queue.get(timeout=1)
+    second = job_queue.get(timeout=1)
+
+    assert (first.job_id, first.parameters_json, first.resume) == ("job-1", '{"value": 1}', False)
+    assert (second.job_id, second.resume) == ("job-2", True)
+    assert job_queue.get(timeout=0.05) is None
+
+
+def test_given_back_job_is_taken_again(job_queue):
+    job_queue.put("job", '{"value": 1}')
+
+    job = job_queue.get(timeout=1)
+    job_queue.nack(job)
+    again = job_queue.get(timeout=1)
+    job_queue.ack(again)
+
+    assert again.job_id == "job"
+    assert job_queue.get(timeout=0.05) is None
+
+
+def test_claimed_jobs_are_not_shared_between_sqlite_queues(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    producer = SQLiteJobQueue(path, poll_interval=0.01)
+    consumers = [SQLiteJobQueue(path, poll_interval=0.01) for _ in range(2)]
+    producer.put("job", '{"value": 1}')
+
+    claimed = consumers[0].get(timeout=1)
+
+    assert claimed.job_id == "job"
+    assert consumers[1].get(timeout=0.05) is None
+    # The job claimed by a killed worker is released
+    assert producer.release_claimed(older_than=0) == 1
+    assert consumers[1].get(timeout=1).job_id == "job"
+
+
+def test_unsupported_queue_uri_is_rejected():
+    assert isinstance(get_job_queue("memory"), InMemoryJobQueue)
+    with pytest.raises(ValueError, match="Unsupported job queue URI"):
+        get_job_queue("redis://localhost")
+
+
+def test_worker_runs_jobs_concurrently(backend, job_queue):
+    job_queue.put("job-1", '{"value": 1}')
+    job_queue.put("job-2", '{"value": 2}')
+    worker = Worker(queued, Parameters, job_queue, concurrency=2, poll_interval=0.01)
+
+    _run_until(worker, lambda: all((backend.get_job(f"job-{i}") or {}).get("status") == JobStatus.COMPLETED for i in (1, 2)))
+
+    for i in (1, 2):
+        assert backend.get_job(f"job-{i}")["status"] == JobStatus.COMPLETED
+    assert job_queue.get(timeout=0.05) is None
+
+
+def test_worker_skips_jobs_that_can_not_run(backend, job_queue):
+    job_queue.put("job-1", '{"value": "not a number"}')
+    job_queue.put("job-2", '{"value": 2}')
+    worker = Worker(queued_alone, Parameters, job_queue, poll_interval=0.01)
+
+    _run_until(worker, lambda: (backend.get_job("job-2") or {}).get("status") == JobStatus.COMPLETED)
+
+    assert backend.get_job("job-1") is None
+    assert backend.get_job("job-2")["status"] == JobStatus.COMPLETED
+    # Both jobs are acknowledged
+    assert job_queue.get(timeout=0.05) is None
+
+
+def test_worker_fails_the_created_jobs_that_can_not_run(backend, job_queue):
+    backend.create_job("invalid", {"task_id": "queued_alone", "status": JobStatus.CREATED})
+    backend.create_job("completed", {"task_id": "queued_alone", "status": JobStatus.COMPLETED})
+    job_queue.put("invalid", '{"value": "not a number"}')
+    job_queue.put("completed", '{"value": 1}')
+    job_queue.put("job", '{"value": 2}')
+    worker = Worker(queued_alone, Parameters, job_queue, poll_interval=0.01)
+
+    _run_until(worker, lambda: (backend.get_job("job") or {}).get("status") == JobStatus.COMPLETED)
+
+    invalid = backend.get_job("invalid")
+    assert invalid["status"] == JobStatus.FAILED
+    assert invalid["completed_at"] is not None
+    assert json.loads(invalid["error_json_value"])["code"] == "ValidationError"
+    # A job that already ran is left as is
+    assert backend.get_job("completed") == {"task_id": "queued_alone", "status": JobStatus.COMPLETED}
+    assert job_queue.get(timeout=0.05) is None
+
+
+def test_worker_releases_the_jobs_of_a_killed_worker(backend, tmp_path):
+    path = str(tmp_path / "queue.db")
+    SQLiteJobQueue(path).put("job", '{"value": 1}')
+    # A killed worker claimed the job and never acknowledged it
+    assert SQLiteJobQueue(path).get(timeout=1).job_id == "job"
+    job_queue = SQLiteJobQueue(path, poll_interval=0.01)
+    worker = Worker(queued_alone, Parameters, job_queue, poll_interval=0.01, claim_timeout=0)
+
+    _run_until(worker, lambda: (backend.get_job("job") or {}).get("status") == JobStatus.COMPLETED)
+
+    assert backend.get_job("job")["status"] == JobStatus.COMPLETED
+    assert job_queue.get(timeout=0.05) is None
+
+
+def test_worker_does_not_release_recent_claims(backend, tmp_path):
+    path = str(tmp_path / "queue.db")
+    SQLiteJobQueue(path).put("claimed", '{"value": 1}')
+    SQLiteJobQueue(path).put("job", '{"value": 2}')
+    assert SQLiteJobQueue(path).get(timeout=1).job_id == "claimed"
+    job_queue = SQLiteJobQueue(path, poll_interval=0.01)
+    worker = Worker(queued_alone, Parameters, job_queue, poll_interval=0.01, claim_timeout=3600)
+
+    _run_until(worker, lambda: (backend.get_job("job") or {}).get("status") == JobStatus.COMPLETED)
+
+    assert backend.get_job("claimed") is None
+    assert job_queue.release_claimed(older_than=0) == 1
+
+
+def test_drained_worker_does_not_take_jobs(backend, job_queue):
+    worker = Worker(queued_alone, Parameters, job_queue, poll_interval=0.01)
+    worker.drain()
+    job_queue.put("job", '{"value": 1}')
+
+    worker.run()
+
+    assert backend.get_job("job") is None
+    assert job_queue.get(timeout=1).job_id == "job"
+
+
+def test_invalid_concurrency_is_rejected(job_queue):
+    with pytest.raises(ValueError):
+        Worker(queued_alone, Parameters, job_queue, concurrency=0)
@@ -0,0 +1,109 @@
+import pytest
+
+from tasks.models import (
+    FinishJob,
+    FinishJobStep,
+    JobStatus,
+    StartJob,
+    StartJobStep,
+)
+from tasks.types import BaseResult
+from tasks.writer import JobStatusWriter
+
+
+class Result(BaseResult):
+    value: int
+
+
+class RecordingBackend:
+    """Job backend recording its writes, failing the next `fail` of them."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.writes = []
+        self.fail = 0
+
+    def write_job(self, job_id, fields, events, chunks=None):
+        if self.fail:
+            self.fail -= 1
+            raise ConnectionError("Backend unavailable")
+        self.writes.append((fields, events, chunks))
+        self.backend.write_job(job_id, fields, events, chunks)
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+
+@pytest.fixture
+def recording(backend):
+    backend.create_job("job", {"status": JobStatus.CREATED})
+    return RecordingBackend(backend)
+
+
+def test_updates_are_coalesced_until_the_terminal_update(recording):
+    writer = JobStatusWriter(recording, "job", interval=60)
+    writer.update_job(StartJob())
+    for _ in range(3):
+        step = writer.start_step(StartJobStep(name="Step", description="A step"))
+        writer.end_step(step, FinishJobStep())
+    assert recording.writes == []
+
+    writer.update_job(FinishJob(result=Result(value=1)))
+    writer.close()
+
+    assert len(recording.writes) == 1
+    fields, events, _ = recording.writes[0]
+    assert fields["status"] == JobStatus.COMPLETED
+    assert [event.seq for event in events] == list(range(6))
+    job = recording.get_job("job")
+    assert job["status"] == JobStatus.COMPLETED
+    assert job["progress"]["step_count"] == 3
+    assert len(recording.get_job_events("job")) == 6
+
+
+def test_updates_are_written_through_without_interval(recording):
+    writer = JobStatusWriter(recording, "job", interval=0)
+    writer.update_job(StartJob())
+    step = writer.start_step(StartJobStep(name="Step", description="A step"))
+    assert len(recording.writes) == 2
+    assert recording.get_job("job")["status"] == JobStatus.RUNNING
+
+    writer.end_step(step, FinishJobStep())
+    writer.close()
+
+    assert len(recording.writes) == 3
+    assert [event.status for event in recording.get_job_events("job")] == [JobStatus.RUNNING, JobStatus.COMPLETED]
+
+
+def test_failed_flush_is_written_again(recording):
+    writer = JobStatusWriter(recording, "job", interval=60)
+    writer.update_job(StartJob())
+    step = writer.start_step(StartJobStep(name="Step", description="A step"))
+    recording.fail = 1
+    with pytest.raises(ConnectionError):
+        writer.flush()
+    assert recording.get_job("job")["status"] == JobStatus.CREATED
+
+    writer.end_step(step, FinishJobStep())
+    writer.flush()
+    writer.close()
+
+    assert len(recording.writes) == 1
+    assert recording.get_job("job")["status"] == JobStatus.RUNNING
+    assert [event.seq for event in recording.get_job_events("job")] == [0, 1]
+
+
+def test_newer_fields_win_over_a_failed_flush(recording):
+    writer = JobStatusWriter(recording, "job", interval=60)
+    writer.update_job(StartJob())
+    recording.fail = 1
+    with pytest.raises(ConnectionError):
+        writer.flush()
+
+    writer.update_job(FinishJob(result=Result(value=2)))
+    writer.close()
+
+    job = recording.get_job("job")
+    assert job["status"] == JobStatus.COMPLETED
+    assert job["started_at"] is not None
+    assert job["result_json_value"] == Result(value=2).model_dump_json()